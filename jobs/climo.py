@@ -140,7 +140,7 @@ class Climo(Job):
                 'local_path': os.path.join(regrid_path, regrid_file),
                 'case': self.case,
                 'year': self.start_year,
-                'month': self.end_year, # use the month to hold the end year field
+                'end_year': self.end_year,
                 'local_status': FileStatus.PRESENT.value
             })
         filemanager.add_files(
@@ -154,13 +154,14 @@ class Climo(Job):
             config['simulations'][self.case]['native_grid_name'],
             self._short_name, 'climo', '{length}yr'.format(length=self.end_year-self.start_year+1))
 
+        new_files = list()
         for climo_file in get_climo_output_files(climo_path, self.start_year, self.end_year):
             new_files.append({
                 'name': climo_file,
-                'local_path': os.path.join(regrid_path, climo_file),
+                'local_path': os.path.join(climo_path, climo_file),
                 'case': self.case,
                 'year': self.start_year,
-                'month': self.end_year, # use the month to hold the end year field
+                'end_year': self.end_year,
                 'local_status': FileStatus.PRESENT.value
             })
         filemanager.add_files(
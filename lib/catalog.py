@@ -0,0 +1,303 @@
+"""
+A module for an in-memory, array backed copy of the DataFile table
+"""
+import os
+import logging
+import threading
+
+from array import array
+
+from lib.util import format_debug
+
+
+class _Interned(object):
+    """
+    A table of unique strings, so each column value can be stored as a small int
+    """
+    def __init__(self):
+        self.values = list()
+        self._index = dict()
+
+    def index(self, value):
+        idx = self._index.get(value)
+        if idx is None:
+            idx = len(self.values)
+            self._index[value] = idx
+            self.values.append(value)
+        return idx
+
+    def find(self, value):
+        return self._index.get(value)
+
+
+class ArrayCatalog(object):
+    """
+    Holds the DataFile state in compact column arrays
+
+    Strings are interned into small int columns, the local status is an int8 and
+    years and months are int16/int8, with dict indexes from id, (case, datatype) and
+    directory to row positions. Status changes are tracked so they can be
+    checkpointed back to the database.
+    """
+    # the DataFile fields each loaded row must contain, in order
+    FIELDS = ('id', 'case', 'datatype', 'local_path', 'local_status',
+              'year', 'month', 'end_year', 'transfer_type')
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._cases = _Interned()
+        self._datatypes = _Interned()
+        self._directories = _Interned()
+        self._transfer_types = _Interned()
+
+        self._id = array('l')
+        self._case = array('H')
+        self._datatype = array('H')
+        self._directory = array('I')
+        self._name = list()
+        self._status = array('b')
+        self._year = array('h')
+        self._month = array('b')
+        self._end_year = array('h')
+        self._transfer_type = array('B')
+
+        # DataFile id -> row position
+        self._by_id = dict()
+        # (case, datatype) index -> list of row positions
+        self._by_group = dict()
+        # directory index -> list of row positions
+        self._by_directory = dict()
+        # local status -> number of rows
+        self._counts = dict()
+        # DataFile id -> the status that still needs to be written to the database
+        self._dirty = dict()
+
+    def __len__(self):
+        return len(self._id)
+
+    def add(self, rows):
+        """
+        Add rows to the catalog, rows whose id is already known replace the existing row
+
+        Parameters:
+            rows (iterable): tuples of values ordered like ArrayCatalog.FIELDS
+        """
+        with self._lock:
+            for _id, case, datatype, local_path, status, year, month, end_year, transfer_type in rows:
+                directory, name = os.path.split(local_path)
+                case_idx = self._cases.index(case)
+                type_idx = self._datatypes.index(datatype)
+                dir_idx = self._directories.index(directory)
+                if _id in self._by_id:
+                    self._replace(self._by_id[_id], case_idx, type_idx, dir_idx, name,
+                                  status, year, month, end_year, transfer_type)
+                    continue
+                pos = len(self._id)
+                self._id.append(_id)
+                self._case.append(case_idx)
+                self._datatype.append(type_idx)
+                self._directory.append(dir_idx)
+                self._name.append(name)
+                self._status.append(status)
+                self._year.append(year)
+                self._month.append(month)
+                self._end_year.append(end_year)
+                self._transfer_type.append(self._transfer_types.index(transfer_type))
+                self._by_id[_id] = pos
+                self._by_group.setdefault((case_idx, type_idx), list()).append(pos)
+                self._by_directory.setdefault(dir_idx, list()).append(pos)
+                self._counts[status] = self._counts.get(status, 0) + 1
+
+    def _replace(self, pos, case_idx, type_idx, dir_idx, name, status, year, month, end_year, transfer_type):
+        group = (self._case[pos], self._datatype[pos])
+        if group != (case_idx, type_idx):
+            self._by_group[group].remove(pos)
+            self._by_group.setdefault((case_idx, type_idx), list()).append(pos)
+        if self._directory[pos] != dir_idx:
+            self._by_directory[self._directory[pos]].remove(pos)
+            self._by_directory.setdefault(dir_idx, list()).append(pos)
+        self._counts[self._status[pos]] -= 1
+        self._counts[status] = self._counts.get(status, 0) + 1
+        self._case[pos] = case_idx
+        self._datatype[pos] = type_idx
+        self._directory[pos] = dir_idx
+        self._name[pos] = name
+        self._status[pos] = status
+        self._year[pos] = year
+        self._month[pos] = month
+        self._end_year[pos] = end_year
+        self._transfer_type[pos] = self._transfer_types.index(transfer_type)
+        # the database already has the new row
+        self._dirty.pop(self._id[pos], None)
+
+    def set_status(self, ids, status, dirty=True):
+        """
+        Set the local status of the given files
+
+        Parameters:
+            ids (iterable): the DataFile ids to update
+            status (int): the new local status value
+            dirty (bool): if the change still has to be written to the database
+        Returns:
+            the list of ids whose status actually changed
+        """
+        changed = list()
+        with self._lock:
+            for _id in ids:
+                pos = self._by_id.get(_id)
+                if pos is None:
+                    continue
+                previous = self._status[pos]
+                if previous == status:
+                    continue
+                self._status[pos] = status
+                self._counts[previous] -= 1
+                self._counts[status] = self._counts.get(status, 0) + 1
+                if dirty:
+                    self._dirty[_id] = status
+                changed.append(_id)
+        return changed
+
+    def count(self, status=None):
+        """
+        Return the number of files with the given local status, or all files
+        """
+        with self._lock:
+            if status is None:
+                return len(self._id)
+            return self._counts.get(status, 0)
+
+    def rows_by_directory(self, exclude_status=None):
+        """
+        Return a dict of directory -> list of (id, local_path, local_status, transfer_type, case, name)
+
+        Parameters:
+            exclude_status (int): leave out the files with this local status
+        """
+        rows = dict()
+        with self._lock:
+            for dir_idx, positions in self._by_directory.items():
+                directory = self._directories.values[dir_idx]
+                entries = [
+                    (self._id[pos],
+                     os.path.join(directory, self._name[pos]),
+                     self._status[pos],
+                     self._transfer_types.values[self._transfer_type[pos]],
+                     self._cases.values[self._case[pos]],
+                     self._name[pos])
+                    for pos in positions
+                    if self._status[pos] != exclude_status
+                ]
+                if entries:
+                    rows[directory] = entries
+        return rows
+
+    def file_paths(self, case, datatype, status, start_year=None, end_year=None, match_end_year=False):
+        """
+        Return the local paths of the files for a case and datatype with the given status
+
+        Parameters:
+            start_year (int): the first year of files to return
+            end_year (int): the last year of files to return
+            match_end_year (bool): only return files spanning exactly start_year to
+                end_year instead of every file whose year falls in the range
+        """
+        with self._lock:
+            case_idx = self._cases.find(case)
+            type_idx = self._datatypes.find(datatype)
+            positions = self._by_group.get((case_idx, type_idx), list())
+            paths = list()
+            for pos in positions:
+                if self._status[pos] != status:
+                    continue
+                if start_year and end_year:
+                    if match_end_year:
+                        if self._year[pos] != start_year or self._end_year[pos] != end_year:
+                            continue
+                    elif not start_year <= self._year[pos] <= end_year:
+                        continue
+                paths.append(os.path.join(
+                    self._directories.values[self._directory[pos]],
+                    self._name[pos]))
+            return paths
+
+    def coverage_rows(self, present_status):
+        """
+        Return a list of (id, case, datatype, year, present) for every file, to build a CoverageIndex from
+        """
+        with self._lock:
+            return [
+                (self._id[pos],
+                 self._cases.values[self._case[pos]],
+                 self._datatypes.values[self._datatype[pos]],
+                 self._year[pos],
+                 self._status[pos] == present_status)
+                for pos in range(len(self._id))
+            ]
+
+    def files_for_paths(self, paths, exclude_status=None):
+        """
+        Return a list of (id, local_path) for the files at the given local paths
+
+        Parameters:
+            paths (list): local file paths
+            exclude_status (int): leave out the files with this local status
+        """
+        wanted = dict()
+        for path in paths:
+            directory, name = os.path.split(path)
+            wanted.setdefault(directory, set()).add(name)
+        files = list()
+        with self._lock:
+            for directory, names in wanted.items():
+                dir_idx = self._directories.find(directory)
+                for pos in self._by_directory.get(dir_idx, list()):
+                    if self._name[pos] in names and self._status[pos] != exclude_status:
+                        files.append((self._id[pos], os.path.join(directory, self._name[pos])))
+        return files
+
+    def take_dirty(self):
+        """
+        Return the status changes not yet written to the database as a dict of
+        status -> list of ids, and forget them
+        """
+        with self._lock:
+            dirty, self._dirty = self._dirty, dict()
+        changes = dict()
+        for _id, status in dirty.items():
+            changes.setdefault(status, list()).append(_id)
+        return changes
+
+    def restore_dirty(self, changes):
+        """
+        Put back changes returned by take_dirty that failed to be written
+        """
+        with self._lock:
+            for status, ids in changes.items():
+                for _id in ids:
+                    self._dirty.setdefault(_id, status)
+
+
+class CatalogCheckpointer(threading.Thread):
+    """
+    A thread that periodically writes the status changes held in memory back to the database
+
+    Parameters:
+        checkpoint (function): writes the pending changes, called every interval seconds
+        interval (float): seconds between checkpoints
+        kill_event (threading.Event): an event to listen for to terminate
+    """
+    def __init__(self, checkpoint, interval, kill_event):
+        super(CatalogCheckpointer, self).__init__(name='catalog_checkpoint')
+        self.daemon = True
+        self._checkpoint = checkpoint
+        self._interval = interval
+        self._kill_event = kill_event
+
+    def run(self):
+        while not self._kill_event.wait(self._interval):
+            try:
+                self._checkpoint()
+            except Exception as e:
+                logging.error('Catalog checkpoint failed')
+                logging.error(format_debug(e))
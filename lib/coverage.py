@@ -0,0 +1,87 @@
+"""
+A module for tracking which years of each case and data type are fully present locally
+"""
+import threading
+
+from bisect import bisect_left, insort
+
+
+class CoverageIndex(object):
+    """
+    An in-memory index of the years that still have files missing for each (case, datatype)
+
+    Readiness of a year range is a binary search over the sorted list of incomplete
+    years instead of a scan over every file in the range
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # DataFile id -> [(case, datatype), year, present]
+        self._files = dict()
+        # (case, datatype) -> {year: number of files not present}
+        self._missing = dict()
+        # (case, datatype) -> sorted list of years with files not present
+        self._incomplete = dict()
+
+    def __len__(self):
+        return len(self._files)
+
+    def _mark(self, key, year, delta):
+        missing = self._missing.setdefault(key, dict())
+        incomplete = self._incomplete.setdefault(key, list())
+        previous = missing.get(year, 0)
+        count = max(previous + delta, 0)
+        if previous == 0 and count > 0:
+            insort(incomplete, year)
+        elif previous > 0 and count == 0:
+            del incomplete[bisect_left(incomplete, year)]
+        missing[year] = count
+
+    def add(self, rows):
+        """
+        Add files to the index, files already in the index are replaced
+
+        Parameters:
+            rows (iterable): tuples of (id, case, datatype, year, present)
+        """
+        with self._lock:
+            for _id, case, datatype, year, present in rows:
+                previous = self._files.get(_id)
+                if previous is not None and not previous[2]:
+                    self._mark(previous[0], previous[1], -1)
+                key = (case, datatype)
+                self._files[_id] = [key, year, present]
+                # make sure the group is known even if all of its files are present
+                self._missing.setdefault(key, dict())
+                self._incomplete.setdefault(key, list())
+                if not present:
+                    self._mark(key, year, 1)
+
+    def set_present(self, ids, present):
+        """
+        Update the present flag of the given files
+
+        Parameters:
+            ids (iterable): the DataFile ids that changed
+            present (bool): if the files are now present
+        """
+        with self._lock:
+            for _id in ids:
+                entry = self._files.get(_id)
+                if entry is None or entry[2] == present:
+                    continue
+                entry[2] = present
+                self._mark(entry[0], entry[1], -1 if present else 1)
+
+    def is_ready(self, case, datatype, start_year=None, end_year=None):
+        """
+        Return True if every file of the datatype between start_year and end_year is present,
+        if no years are given all files of the datatype are checked
+        """
+        with self._lock:
+            incomplete = self._incomplete.get((case, datatype))
+            if not incomplete:
+                return True
+            if start_year and end_year:
+                idx = bisect_left(incomplete, start_year)
+                return idx == len(incomplete) or incomplete[idx] > end_year
+            return False
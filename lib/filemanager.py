@@ -1,28 +1,51 @@
 import os
 import re
 import sys
+import json
+import hashlib
 import threading
 import logging
 import random
 
-from time import sleep
+from time import sleep, time
+from functools import partial
 from peewee import *
 from enum import IntEnum
 from threading import Thread
 
-from models import DataFile
+from models import DataFile, DataGroup, DataDirectory, RemoteDirectory, SCHEMA_VERSION
 from lib.jobstatus import JobStatus
 from lib.util import print_debug
 from lib.util import print_line
 from lib.util import print_message
+from lib.reconcile import scan_directories, list_directory, MTIME_SETTLE_SECONDS
+from lib.watcher import FileWatcher, inotify_available
+from lib.coverage import CoverageIndex
+from lib.catalog import ArrayCatalog, CatalogCheckpointer
+from lib.writer import CatalogWriter
+from lib.progress import TransferProgress, format_size, format_duration
+from lib.integrity import ChecksumVerifier, read_manifest
+from lib.scheduler import TransferScheduler
+from lib.recovery import TransferRecovery
 
-from lib.globus_interface import transfer as globus_transfer
+from lib.globus_interface import submit_transfer as globus_submit
+from lib.globus_interface import TaskPoller
 from lib.globus_interface import get_ls as globus_ls
 from globus_cli.services.transfer import get_client
 
-from lib.ssh_interface import transfer as ssh_transfer
-from lib.ssh_interface import get_ls as ssh_ls
-from lib.ssh_interface import get_ssh_client
+from lib.ssh_interface import transfer_files as ssh_transfer_files
+from lib.ssh_interface import listdir_sizes as ssh_listdir_sizes
+from lib.ssh_interface import SSHSessionPool
+from lib.rsync_interface import transfer_files as rsync_transfer_files
+from lib.ingest import link_files
+
+# the catalog is shared between the main loop and the transfer threads, WAL lets them
+# read while the writer thread commits, and each thread gets its own connection
+DATABASE_PRAGMAS = {
+    'journal_mode': 'wal',
+    'synchronous': 'normal',
+}
+DATABASE_TIMEOUT = 30
 
 
 class FileStatus(IntEnum):
@@ -31,33 +54,164 @@ class FileStatus(IntEnum):
     IN_TRANSIT = 2
 
 
+# the order of the values in the DataFile rows rendered from the config
+DATAFILE_FIELDS = (
+    'name', 'remote_path', 'local_path', 'local_status', 'case', 'remote_status',
+    'year', 'month', 'end_year', 'datatype', 'local_size', 'transfer_type',
+    'remote_uuid', 'remote_hostname', 'remote_size', 'checksum')
+
+
+FILE_LIST_ENTRY = """-------------------------------------
+\t     name: {name}
+\t     local_status:  {local_status}, 
+\t     remote_status:  {remote_status}
+\t     local_size: {local_size}
+\t     local_path: {local_path}
+\t     remote_path: {remote_path}
+\t     year: {year}
+\t     month: {month}
+\t     end_year: {end_year}
+"""
+
+
 class FileManager(object):
     """
     Manage all files required by jobs
     """
 
-    def __init__(self, event_list, config, database='processflow.db'):
+    def __init__(self, event_list, config, database='processflow.db', persistent=False):
         """
         Parameters:
             database (str): the path to where to create the sqlite database file
             config (dict): the global configuration dict
+            persistent (bool): keep the database from previous runs and reconcile it
+                against the config instead of rebuilding it from scratch
         """
         self._event_list = event_list
         self._db_path = database
         self._config = config
+        self._persistent = persistent
+        # directory path -> mtime as of the last time its files were checked
+        self._dir_mtimes = dict()
+        # re-check PRESENT files as well on the first status update of a persistent run
+        self._full_reconcile = False
 
-        if os.path.exists(database):
-            os.remove(database)
-
-        DataFile._meta.database.init(database)
-        if DataFile.table_exists():
-            DataFile.drop_table()
+        if persistent:
+            self._open_persistent_catalog(database)
+        else:
+            for path in [database, database + '-wal', database + '-shm']:
+                if os.path.exists(path):
+                    os.remove(path)
 
-        DataFile.create_table()
+            DataFile._meta.database.init(
+                database, pragmas=DATABASE_PRAGMAS, timeout=DATABASE_TIMEOUT)
+            for table in [DataFile, DataGroup, DataDirectory, RemoteDirectory]:
+                if table.table_exists():
+                    table.drop_table()
+                table.create_table()
+            DataFile._meta.database.execute_sql(
+                'PRAGMA user_version = {}'.format(SCHEMA_VERSION))
 
         self.thread_list = list()
         self.kill_event = threading.Event()
 
+        # once other threads can touch the catalog all writes go through this thread,
+        # until it's started writes are made directly
+        self._writer = CatalogWriter(
+            apply_status=self._set_local_status,
+            kill_event=self.kill_event)
+
+        # set when the file watcher has found new data since the last status update
+        self._watcher = None
+        self._wake_event = None
+        self._arrived = threading.Event()
+        self._last_sweep = 0
+
+        # per (case, datatype) index of years with missing files, built on first use
+        self._coverage = None
+        self._coverage_lock = threading.Lock()
+
+        # set whenever the catalog changes so write_database knows to rewrite the file list
+        self._catalog_dirty = threading.Event()
+        self._catalog_dirty.set()
+        self._last_write = 0
+
+        # with catalog_backend = memory the per-loop queries are served from an in-memory
+        # copy of the catalog, and status changes are checkpointed to the database
+        self._use_memory = self._config['global'].get('catalog_backend') == 'memory'
+        self._memory = None
+        self._checkpointer = None
+
+        # throughput samples for estimating the time left on transfers
+        self._progress = TransferProgress()
+        # the byte totals are only summed again after a size has been written or rows added or removed
+        self._byte_totals = None
+        self._sizes_changed = threading.Event()
+
+        # with verify_checksums files are checksummed locally after they arrive,
+        # instead of globus checksumming both ends during the transfer
+        self._verify_checksums = self._config['global'].get('verify_checksums') in ['True', 'true', '1', 1, True]
+        self._checksum_manifest = self._config['global'].get('checksum_manifest', '')
+        self._checksum_algorithm = self._config['global'].get('checksum_algorithm', 'md5')
+        self._verifier = None
+
+        # missing files are sent in batches, in the order the jobs need them,
+        # with at most one transfer running per remote endpoint
+        self._scheduler = TransferScheduler(
+            batch_size=int(self._config['global'].get('transfer_batch_size', 500)))
+        self._active_transfers = dict()
+        # (transfer_type, endpoint) -> the event that stops the batch thread
+        self._transfer_stops = dict()
+        self._verified_cases = set()
+        # one authenticated ssh connection per sftp host, shared by listing and transfers
+        self._ssh_pool = SSHSessionPool()
+
+        # every globus task shares one client, and one poller follows all of them
+        self._globus_client = None
+        self._globus_poller = None
+        # (transfer_type, remote uuid) -> id of the running task
+        self._globus_tasks = dict()
+
+        # files of failed or stalled transfers are returned to NOT_PRESENT and sent again
+        # after a growing delay, until they have failed too often
+        self._recovery = TransferRecovery(
+            max_retries=int(self._config['global'].get('transfer_max_retries', 5)),
+            retry_delay=float(self._config['global'].get('transfer_retry_delay', 60)),
+            max_failures=int(self._config['global'].get('endpoint_max_failures', 5)),
+            stall_timeout=float(self._config['global'].get('transfer_stall_timeout', 3600)))
+
+        # the sources of link files that werent there yet, each is only reported once
+        self._link_missing = set()
+
+        # remote directory listings are reused for remote_listing_ttl seconds, across runs
+        # with a persistent catalog
+        self._listing_ttl = float(self._config['global'].get('remote_listing_ttl', 3600))
+
+    def _open_persistent_catalog(self, database):
+        """
+        Open the database left by a previous run, rebuilding it if it was
+        written with a different schema
+        """
+        db = DataFile._meta.database
+        db.init(database, pragmas=DATABASE_PRAGMAS, timeout=DATABASE_TIMEOUT)
+        version = db.execute_sql('PRAGMA user_version').fetchone()[0]
+        if version != SCHEMA_VERSION:
+            msg = 'Catalog schema version {} does not match {}, rebuilding'.format(
+                version, SCHEMA_VERSION)
+            logging.info(msg)
+            db.drop_tables([DataFile, DataGroup, DataDirectory, RemoteDirectory], safe=True)
+        db.create_tables([DataFile, DataGroup, DataDirectory, RemoteDirectory], safe=True)
+        db.execute_sql('PRAGMA user_version = {}'.format(SCHEMA_VERSION))
+
+        # any transfers from the previous run are gone
+        (DataFile
+         .update({DataFile.local_status: FileStatus.NOT_PRESENT.value})
+         .where(DataFile.local_status == FileStatus.IN_TRANSIT.value)
+         .execute())
+        for directory in DataDirectory.select():
+            self._dir_mtimes[directory.path] = directory.mtime
+        self._full_reconcile = True
+
     def __str__(self):
         # TODO: make this better
         return str({
@@ -78,88 +232,114 @@ class FileManager(object):
                 endpoints.append(x.remote_uuid)
         return endpoints
 
-    def write_database(self):
+    def write_database(self, force=False):
         """
         Write out a human readable version of the database for debug purposes
+
+        The file is only rewritten if the catalog has changed since the last write, and
+        at most once every file_list_interval seconds unless force is set. The file is
+        written to a temp file and moved into place so readers never see a partial list.
+        With file_list_format = json each file is written as a line of JSON instead.
+
+        Parameters:
+            force (bool): write the file now if anything has changed, ignoring the rate limit
         """
+        if not self._catalog_dirty.is_set():
+            return
+        interval = float(self._config['global'].get('file_list_interval', 60))
+        if not force and time() - self._last_write < interval:
+            return
+        as_json = self._config['global'].get('file_list_format') == 'json'
         file_list_path = os.path.join(
             self._config['global']['project_path'],
             'output',
-            'file_list.txt')
-        with open(file_list_path, 'w') as fp:
-            try:
-                for case in self._config['simulations']:
-                    if case in ['start_year', 'end_year', 'comparisons']:
+            'file_list.jsonl' if as_json else 'file_list.txt')
+        temp_path = file_list_path + '.tmp'
+        self._sync_catalog()
+        # clear before reading so changes made during the write mark it dirty again
+        self._catalog_dirty.clear()
+        self._last_write = time()
+        status_names = {
+            FileStatus.PRESENT.value: 'present',
+            FileStatus.NOT_PRESENT.value: 'missing',
+            FileStatus.IN_TRANSIT.value: 'in transit'
+        }
+        fields = [DataFile.case, DataFile.datatype, DataFile.name, DataFile.local_status,
+                  DataFile.remote_status, DataFile.local_size, DataFile.local_path,
+                  DataFile.remote_path, DataFile.year, DataFile.month, DataFile.end_year]
+        query = (DataFile
+                 .select(*fields)
+                 .order_by(DataFile.case, DataFile.datatype, DataFile.id))
+        try:
+            with open(temp_path, 'w', 1024 * 1024) as fp:
+                case = datatype = None
+                for row in query.tuples().iterator():
+                    if as_json:
+                        fp.write(json.dumps(dict(zip([x.name for x in fields], row))))
+                        fp.write('\n')
                         continue
-                    fp.write('+++++++++++++++++++++++++++++++++++++++++++++')
-                    fp.write('\n\t{case}\t\n'.format(case=case))
-                    fp.write('+++++++++++++++++++++++++++++++++++++++++++++\n')
-                    q = (DataFile
-                         .select(DataFile.datatype)
-                         .where(DataFile.case == case)
-                         .distinct())
-                    for df_type in q.execute():
-                        _type = df_type.datatype
+                    if row[0] != case:
+                        case, datatype = row[0], None
+                        fp.write('+++++++++++++++++++++++++++++++++++++++++++++')
+                        fp.write('\n\t{case}\t\n'.format(case=case))
+                        fp.write('+++++++++++++++++++++++++++++++++++++++++++++\n')
+                    if row[1] != datatype:
+                        datatype = row[1]
                         fp.write('===================================\n')
-                        fp.write('\t' + _type + ':\n')
-                        datafiles = (DataFile
-                                     .select()
-                                     .where(
-                                            (DataFile.datatype == _type) &
-                                            (DataFile.case == case)))
-                        for datafile in datafiles.execute():
-                            filestr = '-------------------------------------'
-                            filestr += '\n\t     name: ' + datafile.name + '\n\t     local_status: '
-                            if datafile.local_status == 0:
-                                filestr += ' present, '
-                            elif datafile.local_status == 1:
-                                filestr += ' missing, '
-                            else:
-                                filestr += ' in transit, '
-                            filestr += '\n\t     remote_status: '
-                            if datafile.remote_status == 0:
-                                filestr += ' present'
-                            elif datafile.remote_status == 1:
-                                filestr += ' missing'
-                            else:
-                                filestr += ' in transit'
-                            filestr += '\n\t     local_size: ' + \
-                                str(datafile.local_size)
-                            filestr += '\n\t     local_path: ' + datafile.local_path
-                            filestr += '\n\t     remote_path: ' + datafile.remote_path
-                            filestr += '\n\t     year: ' + str(datafile.year)
-                            filestr += '\n\t     month: ' + str(datafile.month) + '\n'
-                            fp.write(filestr)
-            except Exception as e:
-                print_debug(e)
+                        fp.write('\t' + datatype + ':\n')
+                    fp.write(FILE_LIST_ENTRY.format(
+                        name=row[2],
+                        local_status=status_names.get(row[3], 'in transit'),
+                        remote_status=status_names.get(row[4], 'in transit'),
+                        local_size=row[5],
+                        local_path=row[6],
+                        remote_path=row[7],
+                        year=row[8],
+                        month=row[9],
+                        end_year=row[10]))
+            os.rename(temp_path, file_list_path)
+        except Exception as e:
+            self._catalog_dirty.set()
+            print_debug(e)
+
+    def _get_coverage(self):
+        """
+        Return the coverage index, building it from the database if needed
+        """
+        with self._coverage_lock:
+            if self._coverage is None:
+                coverage = CoverageIndex()
+                if self._memory is not None:
+                    coverage.add(self._memory.coverage_rows(FileStatus.PRESENT.value))
+                else:
+                    q = DataFile.select(
+                        DataFile.id,
+                        DataFile.case,
+                        DataFile.datatype,
+                        DataFile.year,
+                        DataFile.local_status == FileStatus.PRESENT.value)
+                    coverage.add(q.tuples().iterator())
+                self._coverage = coverage
+            return self._coverage
 
     def check_data_ready(self, data_required, case, start_year=None, end_year=None):
+        """
+        Return True if every file of the required data types is present locally
+
+        The local status of the files is kept current by update_local_status, so
+        this is only a lookup in the coverage index
+
+        Parameters:
+            data_required (list): the data types to check
+            case (str): the case the data belongs to
+            start_year (int): the first year of data needed, optional
+            end_year (int): the last year of data needed, optional
+        """
         try:
+            coverage = self._get_coverage()
             for datatype in data_required:
-                if start_year and end_year:
-                    q = (DataFile
-                            .select()
-                            .where(
-                                (DataFile.year >= start_year) &
-                                (DataFile.year <= end_year) &
-                                (DataFile.case == case) &
-                                (DataFile.datatype == datatype)))
-                else:
-                    q = (DataFile
-                            .select()
-                            .where(
-                                (DataFile.case == case) &
-                                (DataFile.datatype == datatype)))
-                datafiles = q.execute()
-                for df in datafiles:
-                    if not os.path.exists(df.local_path) and df.local_status == FileStatus.PRESENT.value:
-                        df.local_status = FileStatus.NOT_PRESENT.value
-                        df.save()
-                    elif os.path.exists(df.local_path) and df.local_status == FileStatus.NOT_PRESENT.value:
-                        df.local_status = FileStatus.PRESENT.value
-                        df.save()
-                    if df.local_status != FileStatus.PRESENT.value:
-                        return False
+                if not coverage.is_ready(case, datatype, start_year, end_year):
+                    return False
             return True
         except Exception as e:
             print_debug(e)
@@ -200,107 +380,296 @@ class FileManager(object):
                 instring = instring.replace(string, val)
         return instring
 
-    def populate_file_list(self):
+    def _group_signature(self, case, data_type):
+        """
+        Return a digest of every config value that goes into rendering the
+        DataFile rows for this case and data type
+        """
+        type_options = {
+            key: val for key, val in self._config['data_types'][data_type].items()
+            if not isinstance(val, dict)
+        }
+        case_options = {
+            key: val for key, val in self._config['simulations'][case].items()
+            if key not in ['job_types', 'data_types']
+        }
+        signature = json.dumps({
+            'project_path': self._config['global']['project_path'],
+            'start_year': self._config['simulations']['start_year'],
+            'end_year': self._config['simulations']['end_year'],
+            'case': case_options,
+            'type': type_options,
+            'type_case': self._config['data_types'][data_type].get(case, {})
+        }, sort_keys=True, default=str)
+        return hashlib.md5(signature.encode('utf-8')).hexdigest()
+
+    def _prune_catalog(self, expected):
+        """
+        Remove catalog entries for cases and data types that are no longer in the config
+
+        Parameters:
+            expected (list): the (case, data_type) tuples the current config asks for
+        """
+        cases = [case for case in self._config['simulations']
+                 if case not in ['start_year', 'end_year', 'comparisons']]
+        removed = (DataFile
+                   .delete()
+                   .where(DataFile.case.not_in(cases))
+                   .execute())
+        DataGroup.delete().where(DataGroup.case.not_in(cases)).execute()
+        for group in DataGroup.select():
+            if (group.case, group.datatype) in expected:
+                continue
+            removed += (DataFile
+                        .delete()
+                        .where(
+                            (DataFile.case == group.case) &
+                            (DataFile.datatype == group.datatype))
+                        .execute())
+            group.delete_instance()
+        if removed:
+            self._sizes_changed.set()
+            msg = 'Removed {} catalog entries no longer in the config'.format(removed)
+            logging.info(msg)
+
+    def compile_file_string(self, data_type, data_type_option, case):
+        """
+        Return a format string for a data_types option with every keyword except
+        YEAR and MONTH already substituted, render it with .format(year=, month=)
+        """
+        instring = self.render_file_string(
+            data_type=data_type,
+            data_type_option=data_type_option,
+            case=case)
+        instring = instring.replace('{', '{{').replace('}', '}}')
+        case_options = self._config['data_types'][data_type].get(case)
+        if case_options and case_options.get(data_type_option):
+            # case specific options only substitute the values from the case config
+            return instring
+        return instring.replace('YEAR', '{year:04d}').replace('MONTH', '{month:02d}')
+
+    def _render_group(self, case, _type, start_year, end_year):
+        """
+        Return the list of DataFile rows, as tuples ordered like DATAFILE_FIELDS,
+        for a single case and data type
+        """
+        local_path = self.render_file_string(
+            data_type=_type,
+            data_type_option='local_path',
+            case=case)
+        name_format = self.compile_file_string(_type, 'file_format', case)
+        remote_format = self.compile_file_string(_type, 'remote_path', case)
+        transfer_type = self._config['simulations'][case]['transfer_type']
+        remote_uuid = self._config['simulations'][case].get('remote_uuid', '')
+        remote_hostname = self._config['simulations'][case].get('remote_hostname', '')
+        missing = FileStatus.NOT_PRESENT.value
+        join = os.path.join
+
+        if self._config['data_types'][_type].get('monthly') and self._config['data_types'][_type]['monthly'] in ['True', 'true', '1', 1]:
+            # handle monthly data
+            dates = [(year, month)
+                     for year in range(start_year, end_year + 1)
+                     for month in range(1, 13)]
+        else:
+            # handle one-off data
+            dates = [(0, 0)]
+
+        names = [name_format.format(year=year, month=month) for year, month in dates]
+        if '{year' in remote_format or '{month' in remote_format:
+            remote_paths = [remote_format.format(year=year, month=month) for year, month in dates]
+        else:
+            remote_paths = [remote_format.format()] * len(dates)
+        rows = [
+            (name, join(remote_path, name), join(local_path, name), missing, case,
+             missing, year, month, year, _type, 0, transfer_type, remote_uuid, remote_hostname, 0, '')
+            for name, remote_path, (year, month) in zip(names, remote_paths, dates)
+        ]
+        return rows
+
+    def _insert_rows(self, fields, rows):
+        """
+        Insert DataFile rows with a single prepared statement inside one transaction,
+        a row with the same (case, datatype, name, year, end_year) as an existing
+        row replaces it
+
+        Parameters:
+            fields (list): the names of the DataFile fields in each row
+            rows (list): tuples of values ordered like fields
+        """
+        sql = 'INSERT OR REPLACE INTO "{table}" ({columns}) VALUES ({params})'.format(
+            table=DataFile._meta.table_name,
+            columns=', '.join('"{}"'.format(DataFile._meta.fields[x].column_name) for x in fields),
+            params=', '.join(['?'] * len(fields)))
+
+        def insert():
+            database = DataFile._meta.database
+            with database.atomic():
+                database.connection().executemany(sql, rows)
+        self._writer.call(insert)
+        self._sizes_changed.set()
+
+    def _start_writer(self):
+        """
+        Start the catalog writer thread, if it hasnt been started already
+        """
+        if self._writer.ident is None and not self.kill_event.is_set():
+            self._writer.start()
+            self.thread_list.append(self._writer)
+
+    def _load_memory_catalog(self):
+        """
+        Load the catalog into memory and start checkpointing it back to the database
+        """
+        # dont lose changes still held by a previously loaded catalog
+        self._sync_catalog()
+        query = DataFile.select(*[getattr(DataFile, x) for x in ArrayCatalog.FIELDS])
+        memory = ArrayCatalog()
+        memory.add(query.tuples().iterator())
+        self._memory = memory
+        msg = 'Loaded {} files into the in-memory catalog'.format(len(memory))
+        logging.info(msg)
+        if self._checkpointer is None:
+            self._start_writer()
+            self._checkpointer = CatalogCheckpointer(
+                checkpoint=self._sync_catalog,
+                interval=float(self._config['global'].get('catalog_checkpoint_interval', 30)),
+                kill_event=self.kill_event)
+            self.thread_list.append(self._checkpointer)
+            self._checkpointer.start()
+
+    def _sync_catalog(self):
+        """
+        Write any status changes held by the in-memory catalog to the database
+        """
+        if self._memory is None:
+            return
+        changes = self._memory.take_dirty()
+        if not changes:
+            return
+
+        def write():
+            with DataFile._meta.database.atomic():
+                for status, ids in changes.items():
+                    self._write_local_status(ids, FileStatus(status))
+        try:
+            self._writer.call(write)
+        except Exception:
+            self._memory.restore_dirty(changes)
+            raise
+        logging.debug('checkpointed %d status changes',
+                      sum(len(x) for x in changes.values()))
+
+    def _forget_directories(self, directories):
+        """
+        Drop the recorded mtimes for the given directories so the files in
+        them get checked on the next status update
+        """
+        directories = list(set(directories))
+        for directory in directories:
+            self._dir_mtimes.pop(directory, None)
+        def delete():
+            step = 50
+            for idx in range(0, len(directories), step):
+                (DataDirectory
+                 .delete()
+                 .where(DataDirectory.path << directories[idx: idx + step])
+                 .execute())
+        self._writer.call(delete)
+
+    def _render_catalog(self, expected, start_year, end_year):
+        """
+        Render and insert the DataFiles of every expected (case, datatype) group inside
+        one transaction, returning the number of groups kept from the existing catalog
+        """
+        with DataFile._meta.database.atomic():
+            if self._persistent:
+                self._prune_catalog(expected)
+            kept = 0
+            for case, _type in expected:
+                signature = self._group_signature(case, _type)
+                if self._persistent:
+                    group = DataGroup.get_or_none(
+                        (DataGroup.case == case) &
+                        (DataGroup.datatype == _type))
+                    if group and group.signature == signature:
+                        kept += 1
+                        continue
+                    # the config for this group changed, render it again from scratch
+                    DataFile.delete().where(
+                        (DataFile.case == case) &
+                        (DataFile.datatype == _type)).execute()
+                    DataGroup.delete().where(
+                        (DataGroup.case == case) &
+                        (DataGroup.datatype == _type)).execute()
+
+                new_files = self._render_group(case, _type, start_year, end_year)
+                tail, _ = os.path.split(new_files[0][DATAFILE_FIELDS.index('local_path')])
+                if not os.path.exists(tail):
+                    os.makedirs(tail)
+                self._forget_directories([tail])
+                self._insert_rows(DATAFILE_FIELDS, new_files)
+                DataGroup.create(
+                    case=case,
+                    datatype=_type,
+                    signature=signature)
+        return kept
+
+    def populate_file_list(self, data_required=None):
         """
         Populate the database with the required DataFile entries
+
+        When running with a persistent catalog, only the case/data_type groups whose
+        config has changed since the last run are re-rendered
+
+        Parameters:
+            data_required (dict): case -> the data types read by that case's jobs, if
+                given only those data types are added to the catalog
         """
         msg = 'Creating file table'
         print_line(
             line=msg,
             event_list=self._event_list)
-        newfiles = list()
         start_year = int(self._config['simulations']['start_year'])
         end_year = int(self._config['simulations']['end_year'])
-        with DataFile._meta.database.atomic():
-            # for each case
-            for case in self._config['simulations']:
-                if case in ['start_year', 'end_year', 'comparisons']:
+
+        expected = list()
+        skipped = 0
+        for case in self._config['simulations']:
+            if case in ['start_year', 'end_year', 'comparisons']:
+                continue
+            data_types_for_case = self._config['simulations'][case]['data_types']
+            for _type in self._config['data_types']:
+                if 'all' not in data_types_for_case:
+                    if _type not in data_types_for_case:
+                        continue
+                if data_required is not None and _type not in data_required.get(case, []):
+                    skipped += 1
                     continue
-                # for each data type
-                for _type in self._config['data_types']:
-                    data_types_for_case = self._config['simulations'][case]['data_types']
-                    if 'all' not in data_types_for_case:
-                        if _type not in data_types_for_case:
-                            continue
-
-                    # setup the base local_path
-                    local_path = self.render_file_string(
-                        data_type=_type,
-                        data_type_option='local_path',
-                        case=case)
-
-                    new_files = list()
-                    if self._config['data_types'][_type].get('monthly') and self._config['data_types'][_type]['monthly'] in ['True', 'true', '1', 1]:
-                        # handle monthly data
-                        for year in range(start_year, end_year + 1):
-                            for month in range(1, 13):
-                                filename = self.render_file_string(
-                                    data_type=_type,
-                                    data_type_option='file_format',
-                                    case=case,
-                                    year=year,
-                                    month=month)
-                                r_path = self.render_file_string(
-                                    data_type=_type,
-                                    data_type_option='remote_path',
-                                    case=case,
-                                    year=year,
-                                    month=month)
-                                new_files.append({
-                                    'name': filename,
-                                    'remote_path': os.path.join(r_path, filename),
-                                    'local_path': os.path.join(local_path, filename),
-                                    'local_status': FileStatus.NOT_PRESENT.value,
-                                    'case': case,
-                                    'remote_status': FileStatus.NOT_PRESENT.value,
-                                    'year': year,
-                                    'month': month,
-                                    'datatype': _type,
-                                    'local_size': 0,
-                                    'transfer_type': self._config['simulations'][case]['transfer_type'],
-                                    'remote_uuid': self._config['simulations'][case].get('remote_uuid', ''),
-                                    'remote_hostname': self._config['simulations'][case].get('remote_hostname', '')
-                                })
-                    else:
-                        # handle one-off data
-                        filename = self.render_file_string(
-                                    data_type=_type,
-                                    data_type_option='file_format',
-                                    case=case)
-                        r_path = self.render_file_string(
-                                    data_type=_type,
-                                    data_type_option='remote_path',
-                                    case=case)
-                        new_files.append({
-                            'name': filename,
-                            'remote_path': os.path.join(r_path, filename),
-                            'local_path': os.path.join(local_path, filename),
-                            'local_status': FileStatus.NOT_PRESENT.value,
-                            'case': case,
-                            'remote_status': FileStatus.NOT_PRESENT.value,
-                            'year': 0,
-                            'month': 0,
-                            'datatype': _type,
-                            'local_size': 0,
-                            'transfer_type': self._config['simulations'][case]['transfer_type'],
-                            'remote_uuid': self._config['simulations'][case].get('remote_uuid', ''),
-                            'remote_hostname': self._config['simulations'][case].get('remote_hostname', '')
-                        })
-                    tail, _ = os.path.split(new_files[0]['local_path'])
-                    if not os.path.exists(tail):
-                        os.makedirs(tail)
-                    step = 50
-                    for idx in range(0, len(new_files), step):
-                        DataFile.insert_many(
-                            new_files[idx: idx + step]).execute()
-
-            msg = 'Database update complete'
+                expected.append((case, _type))
+        if skipped:
+            msg = 'Skipping {} data types that no job needs'.format(skipped)
+            print_line(msg, self._event_list)
+
+        with self._coverage_lock:
+            self._coverage = None
+        self._catalog_dirty.set()
+        kept = self._writer.call(self._render_catalog, expected, start_year, end_year)
+        if kept:
+            msg = 'Reusing {} of {} data groups from the existing catalog'.format(
+                kept, len(expected))
             print_line(msg, self._event_list)
+        msg = 'Database update complete'
+        print_line(msg, self._event_list)
+        if self._use_memory:
+            self._load_memory_catalog()
     
     def verify_remote_files(self, client, case):
         """
         Check that the user supplied file paths are valid for remote files
 
+        Each remote directory is listed once for every data type it holds, and
+        recent listings are reused from the catalog
+
         Parameters:
             client: either an ssh_client or a globus_client
             case: the case to check remote paths for
@@ -310,53 +679,136 @@ class FileManager(object):
         msg = 'verifying remote file paths'
         print_line(msg, self._event_list)
 
-        data_types_to_verify = []
         q = (DataFile
-                .select()
-                .where(
-                    (DataFile.case == case) & 
-                    (DataFile.local_status != FileStatus.PRESENT.value)))
-        for datafile in  q.execute():
-            if datafile.datatype not in data_types_to_verify:
-                data_types_to_verify.append(datafile.datatype)
-        for datatype in data_types_to_verify:
-            q = (DataFile
-                    .select()
-                    .where(
-                        (DataFile.case == case) &
-                        (DataFile.datatype == datatype)))
-            files = q.execute()
-            remote_path, _ = os.path.split(files[0].remote_path)
-            msg = 'Checking {} files in {}'.format(datatype, remote_path)
-            print_line(msg, self._event_list)
-            if files[0].transfer_type == 'globus':
-                remote_contents = globus_ls(
-                    client=client,
-                    path=remote_path,
-                    endpoint=self._config['simulations'][case]['remote_uuid'])
-            elif files[0].transfer_type == 'sftp':
-                remote_contents = ssh_ls(
-                    client=client,
-                    remote_path=remote_path)
-            remote_names = [x['name'] for x in remote_contents]
-            for df in files:
-                if df.name not in remote_names:
-                    import ipdb; ipdb.set_trace()
+             .select(
+                 DataFile.id,
+                 DataFile.name,
+                 DataFile.remote_path,
+                 DataFile.local_status,
+                 DataFile.transfer_type,
+                 DataFile.remote_uuid,
+                 DataFile.remote_hostname)
+             .where(
+                 (DataFile.case == case) &
+                 (DataFile.transfer_type != 'local')))
+        directories = dict()
+        for row in q.namedtuples().iterator():
+            remote_path, _ = os.path.split(row.remote_path)
+            directories.setdefault(remote_path, list()).append(row)
+
+        sftp_client = None
+        try:
+            for remote_path, files in sorted(directories.items()):
+                if all(x.local_status == FileStatus.PRESENT.value for x in files):
+                    continue
+                msg = 'Checking {} files in {}'.format(len(files), remote_path)
+                print_line(msg, self._event_list)
+                if files[0].transfer_type == 'globus':
+                    endpoint, lister = files[0].remote_uuid, client
+                elif client is None:
+                    # rsync from the local filesystem
+                    endpoint, lister = '', None
+                else:
+                    if sftp_client is None:
+                        sftp_client = client.open_sftp()
+                    endpoint, lister = files[0].remote_hostname, sftp_client
+
+                contents, cached = self._remote_listing(
+                    files[0].transfer_type, endpoint, lister, remote_path)
+                missing = [x for x in files if x.name not in contents]
+                if missing and cached:
+                    # the files may have been written since the cached listing
+                    contents, _ = self._remote_listing(
+                        files[0].transfer_type, endpoint, lister, remote_path, refresh=True)
+                    missing = [x for x in files if x.name not in contents]
+                if missing:
                     msg = 'Unable to find file {name} at {remote_path}'.format(
-                        name=df.name,
+                        name=missing[0].name,
                         remote_path=remote_path)
                     print_message(msg, 'error')
                     return False
+                # the listing is already here, keep the sizes for progress reporting
+                self._set_field('remote_size', [(contents[x.name], x.id) for x in files])
+        except Exception as e:
+            msg = 'Unable to list the remote files for {}'.format(case)
+            print_message(msg, 'error')
+            print_debug(e)
+            return False
+        finally:
+            if sftp_client is not None:
+                sftp_client.close()
         msg = 'found all remote files for {}'.format(case)
         print_message(msg, 'ok')
         return True
 
+    def _remote_listing(self, transfer_type, endpoint, client, remote_path, refresh=False):
+        """
+        Return a dict of name -> size for a remote directory, reusing the listing
+        stored in the catalog if it's younger than remote_listing_ttl
+
+        Parameters:
+            transfer_type (str): globus, sftp or rsync
+            endpoint (str): the remote globus uuid or hostname
+            client: a globus client or an sftp client to list with, or None for a local directory
+            remote_path (str): the directory to list
+            refresh (bool): list the directory even if there's a recent listing
+        Returns:
+            a tuple of the listing and if it came from the catalog
+        """
+        now = time()
+        if not refresh:
+            try:
+                stored = RemoteDirectory.get(
+                    (RemoteDirectory.endpoint == endpoint) &
+                    (RemoteDirectory.path == remote_path))
+            except RemoteDirectory.DoesNotExist:
+                stored = None
+            if stored is not None and now - stored.listed < self._listing_ttl:
+                return json.loads(stored.contents), True
+
+        if transfer_type == 'globus':
+            result = globus_ls(
+                client=client,
+                path=remote_path,
+                endpoint=endpoint)
+            contents = dict((x['name'], int(x.get('size') or 0)) for x in result)
+        elif client is None:
+            contents = list_directory(remote_path)
+            if contents is None:
+                raise IOError('Unable to list {}'.format(remote_path))
+        else:
+            contents = ssh_listdir_sizes(client, remote_path)
+
+        def write():
+            (RemoteDirectory
+             .insert(
+                 endpoint=endpoint,
+                 path=remote_path,
+                 listed=now,
+                 contents=json.dumps(contents))
+             .on_conflict_replace()
+             .execute())
+        self._writer.call(write)
+        return contents, False
+
     def terminate_transfers(self):
         self.kill_event.set()
+        for stop in self._transfer_stops.values():
+            stop.set()
         for thread in self.thread_list:
+            # the writer is stopped last, the other threads may still be writing
+            if thread is self._writer:
+                continue
             msg = 'terminating {}, this may take a moment'.format(thread.name)
             print_line(msg, self._event_list)
             thread.join()
+        self._writer.stop()
+        self._ssh_pool.close()
+        # write out anything the checkpointer didnt get to
+        try:
+            self._sync_catalog()
+        except Exception as e:
+            print_debug(e)
 
     def print_db(self):
         for df in DataFile.select():
@@ -383,69 +835,352 @@ class FileManager(object):
                 transfer_type (str): the transfer type of these files, optional
                 year (int): the year of the file, optional
                 month (int): the month of the file, optional
+                end_year (int): the last year of data in the file, optional
                 remote_uuid (str): remote globus endpoint id, optional
                 remote_hostname (str): remote hostname for sftp transfer, optional
         """
         try:
             new_files = list()
             for file in file_list:
-                new_files.append({
-                    'name': file['name'],
-                    'local_path': file['local_path'],
-                    'local_status': file.get('local_status', FileStatus.NOT_PRESENT.value),
-                    'datatype': data_type,
-                    'case': file['case'],
-                    'year': file.get('year', 0),
-                    'month': file.get('month', 0),
-                    'remote_uuid': file.get('remote_uuid', ''),
-                    'remote_hostname': file.get('remote_hostname', ''),
-                    'remote_path': file.get('remote_path', ''),
-                    'remote_status': FileStatus.NOT_PRESENT.value,
-                    'local_size': 0,
-                    'transfer_type': file.get('transfer_type', 'local')
-                })
-            step = 50
-            for idx in range(0, len(new_files), step):
-                DataFile.insert_many(
-                    new_files[idx: idx + step]).execute()
+                new_files.append((
+                    file['name'],
+                    file.get('remote_path', ''),
+                    file['local_path'],
+                    file.get('local_status', FileStatus.NOT_PRESENT.value),
+                    file['case'],
+                    FileStatus.NOT_PRESENT.value,
+                    file.get('year', 0),
+                    file.get('month', 0),
+                    file.get('end_year', file.get('year', 0)),
+                    data_type,
+                    0,
+                    file.get('transfer_type', 'local'),
+                    file.get('remote_uuid', ''),
+                    file.get('remote_hostname', ''),
+                    file.get('remote_size', 0),
+                    ''))
+            if not new_files:
+                return
+            ids = self._writer.call(self._upsert_rows, data_type, new_files)
+
+            step = 500
+            for idx in range(0, len(ids), step):
+                chunk = ids[idx: idx + step]
+                with self._coverage_lock:
+                    if self._coverage is not None:
+                        q = (DataFile
+                             .select(
+                                 DataFile.id,
+                                 DataFile.case,
+                                 DataFile.datatype,
+                                 DataFile.year,
+                                 DataFile.local_status == FileStatus.PRESENT.value)
+                             .where(DataFile.id << chunk))
+                        self._coverage.add(q.tuples().iterator())
+                if self._memory is not None:
+                    q = (DataFile
+                         .select(*[getattr(DataFile, x) for x in ArrayCatalog.FIELDS])
+                         .where(DataFile.id << chunk))
+                    self._memory.add(q.tuples().iterator())
+            self._catalog_dirty.set()
+            status_idx = DATAFILE_FIELDS.index('local_status')
+            path_idx = DATAFILE_FIELDS.index('local_path')
+            self._forget_directories([
+                os.path.split(x[path_idx])[0] for x in new_files
+                if x[status_idx] != FileStatus.PRESENT.value])
         except Exception as e:
             print_debug(e)
+
+    def _registered_ids(self, data_type, rows):
+        """
+        Return a dict of (case, name, year, end_year) -> id for the given
+        DataFile rows that are already in the catalog
+        """
+        case_idx = DATAFILE_FIELDS.index('case')
+        name_idx = DATAFILE_FIELDS.index('name')
+        names = dict()
+        for row in rows:
+            names.setdefault(row[case_idx], set()).add(row[name_idx])
+        ids = dict()
+        step = 500
+        for case, case_names in names.items():
+            case_names = list(case_names)
+            for idx in range(0, len(case_names), step):
+                q = (DataFile
+                     .select(DataFile.id, DataFile.case, DataFile.name, DataFile.year, DataFile.end_year)
+                     .where(
+                         (DataFile.case == case) &
+                         (DataFile.datatype == data_type) &
+                         (DataFile.name << case_names[idx: idx + step])))
+                for _id, _case, name, year, end_year in q.tuples().iterator():
+                    ids[(_case, name, year, end_year)] = _id
+        return ids
+
+    def _upsert_rows(self, data_type, rows):
+        """
+        Insert or replace DataFile rows in one transaction, rows that replace an
+        existing file keep its id
+
+        Parameters:
+            data_type (str): the data_type of every row
+            rows (list): tuples of values ordered like DATAFILE_FIELDS
+        Returns:
+            the list of ids of the upserted rows
+        """
+        key_idx = [DATAFILE_FIELDS.index(x) for x in ['case', 'name', 'year', 'end_year']]
+
+        def key(row):
+            return tuple(row[x] for x in key_idx)
+        with DataFile._meta.database.atomic():
+            existing = self._registered_ids(data_type, rows)
+            self._insert_rows(
+                ('id',) + DATAFILE_FIELDS,
+                [(existing.get(key(row)),) + row for row in rows])
+            return list(set(self._registered_ids(data_type, rows).values()))
         
 
+    def _write_local_status(self, ids, status):
+        """
+        Set the local_status of every DataFile in ids in the database inside a single transaction
+        """
+        def write():
+            step = 500
+            with DataFile._meta.database.atomic():
+                for idx in range(0, len(ids), step):
+                    (DataFile
+                     .update({DataFile.local_status: status.value})
+                     .where(DataFile.id << ids[idx: idx + step])
+                     .execute())
+        self._writer.call(write)
+
+    def _set_field(self, field, values):
+        """
+        Set one field of many DataFiles with a single prepared statement inside one transaction
+
+        Parameters:
+            field (str): the name of the field to set, like local_size or checksum
+            values (list): tuples of (value, id)
+        """
+        if not values:
+            return
+        sql = 'UPDATE "{table}" SET "{column}" = ? WHERE "id" = ?'.format(
+            table=DataFile._meta.table_name,
+            column=DataFile._meta.fields[field].column_name)
+
+        def write():
+            database = DataFile._meta.database
+            with database.atomic():
+                database.connection().executemany(sql, values)
+        self._writer.call(write)
+        self._catalog_dirty.set()
+        if field in ['local_size', 'remote_size']:
+            self._sizes_changed.set()
+
+    def _set_local_status(self, ids, status):
+        """
+        Set the local_status of every DataFile in ids
+
+        With the in-memory catalog the change is made in memory and written to
+        the database by the next checkpoint
+
+        Parameters:
+            ids (list): the primary keys of the DataFiles to update
+            status (FileStatus): the new local status
+        """
+        ids = list(ids)
+        if self._memory is not None:
+            ids = self._memory.set_status(ids, status.value)
+        else:
+            self._write_local_status(ids, status)
+        with self._coverage_lock:
+            if self._coverage is not None:
+                self._coverage.set_present(ids, status == FileStatus.PRESENT)
+        self._catalog_dirty.set()
+
+    def start_watcher(self, wake_event=None):
+        """
+        Watch the directories of all missing files with inotify, marking files
+        PRESENT as soon as they arrive
+
+        Parameters:
+            wake_event (threading.Event): set whenever new files arrive
+        Returns:
+            True if the watcher was started, False if the directories have to be polled
+        """
+        if not inotify_available():
+            msg = 'inotify is not supported here, polling for new files instead'
+            print_line(msg, self._event_list)
+            return False
+        q = (DataFile
+             .select(DataFile.local_path)
+             .where(DataFile.local_status != FileStatus.PRESENT.value))
+        directories = set(os.path.split(x[0])[0] for x in q.tuples().iterator())
+        try:
+            self._watcher = FileWatcher(
+                directories=directories,
+                callback=self._files_arrived,
+                kill_event=self.kill_event)
+        except OSError as e:
+            msg = 'Unable to start the file watcher, polling for new files instead'
+            print_line(msg, self._event_list)
+            logging.error(str(e))
+            return False
+        self._wake_event = wake_event
+        # sweep everything once so nothing that arrived before the watches were set is missed
+        self._last_sweep = 0
+        self._start_writer()
+        self._watcher.start()
+        self.thread_list.append(self._watcher)
+        msg = 'Watching {} of {} data directories for new files'.format(
+            len(self._watcher.directories), len(directories))
+        print_line(msg, self._event_list)
+        return True
+
+    def _files_arrived(self, paths):
+        """
+        Callback for the file watcher, marks the arrived files as PRESENT
+
+        Parameters:
+            paths (list): the local paths of the arrived files, or None if the
+                watcher lost events and the directories need re-scanning
+        """
+        if paths is None:
+            self._last_sweep = 0
+            self._wake()
+        else:
+            if self._memory is not None:
+                arrived = self._memory.files_for_paths(paths, exclude_status=FileStatus.PRESENT.value)
+            else:
+                arrived = list()
+                step = 500
+                for idx in range(0, len(paths), step):
+                    q = (DataFile
+                         .select(DataFile.id, DataFile.local_path)
+                         .where(
+                             (DataFile.local_path << paths[idx: idx + step]) &
+                             (DataFile.local_status != FileStatus.PRESENT.value)))
+                    arrived.extend(q.tuples())
+            if not arrived:
+                return
+            self._set_local_status([x[0] for x in arrived], FileStatus.PRESENT)
+            # the main loop can act on the new status before the sizes are written
+            self._wake()
+            sizes = list()
+            for _id, path in arrived:
+                try:
+                    sizes.append((os.path.getsize(path), _id))
+                except OSError:
+                    continue
+            self._set_field('local_size', sizes)
+            logging.info('%d new files arrived', len(arrived))
+
+    def _wake(self):
+        """
+        Let the main loop know new data has arrived
+        """
+        self._arrived.set()
+        if self._wake_event:
+            self._wake_event.set()
+
     def update_local_status(self):
         """
         Update the database with the local status of the expected files
 
+        The files are grouped by directory and each directory that has been modified
+        since the last pass is listed once, all status changes are then written back
+        in a single transaction
+
         Return True if there was new local data found, False othewise
         """
+        change = False
         try:
-            query = (DataFile
-                     .select()
-                     .where(
-                            (DataFile.local_status == FileStatus.NOT_PRESENT.value) |
-                            (DataFile.local_status == FileStatus.IN_TRANSIT.value)))
-            printed = False
-            change = False
-            for datafile in query.execute():
-                marked = False
-                if os.path.exists(datafile.local_path):
-                    if datafile.local_status == FileStatus.NOT_PRESENT.value or datafile.local_status == FileStatus.IN_TRANSIT.value:
-                        datafile.local_status = FileStatus.PRESENT.value
-                        marked = True
-                        change = True
+            if self._memory is not None:
+                directories = self._memory.rows_by_directory(
+                    exclude_status=None if self._full_reconcile else FileStatus.PRESENT.value)
+            else:
+                query = DataFile.select(
+                    DataFile.id,
+                    DataFile.local_path,
+                    DataFile.local_status,
+                    DataFile.transfer_type,
+                    DataFile.case,
+                    DataFile.name)
+                if not self._full_reconcile:
+                    query = query.where(
+                        DataFile.local_status != FileStatus.PRESENT.value)
+                directories = dict()
+                for row in query.tuples().iterator():
+                    directory, _ = os.path.split(row[1])
+                    directories.setdefault(directory, list()).append(row)
+
+            # watched directories only need an occasional sweep as a safety net
+            now = time()
+            if self._watcher and self._watcher.is_alive():
+                interval = float(self._config['global'].get('watch_rescan_interval', 300))
+                if now - self._last_sweep < interval:
+                    watched = self._watcher.directories
+                    directories = {
+                        key: val for key, val in directories.items()
+                        if key not in watched
+                    }
                 else:
-                    if datafile.transfer_type == 'local':
-                        msg = '{case} transfer_type is local, but {filename} is not present'.format(
-                            case=datafile.case, filename=datafile.name)
-                        logging.error(msg)
-                        if not printed:
-                            print_line(msg, self._event_list)
-                            printed = True
-                    if datafile.local_status == FileStatus.PRESENT.value:
-                        datafile.local_status = FileStatus.NOT_PRESENT.value
-                        marked = True
-                if marked:
-                    datafile.save()
+                    self._last_sweep = now
+
+            scanned = scan_directories(
+                directories=directories.keys(),
+                known_mtimes=self._dir_mtimes,
+                workers=int(self._config['global'].get('scan_workers', 4)))
+
+            printed = False
+            present = list()
+            missing = list()
+            sizes = list()
+            settled = dict()
+            for directory, (mtime, contents) in scanned.items():
+                if contents is False:
+                    continue
+                for _id, local_path, local_status, transfer_type, case, name in directories[directory]:
+                    _, filename = os.path.split(local_path)
+                    if contents and filename in contents:
+                        if local_status != FileStatus.PRESENT.value:
+                            present.append(_id)
+                            sizes.append((contents[filename], _id))
+                        elif self._full_reconcile:
+                            sizes.append((contents[filename], _id))
+                    else:
+                        if transfer_type == 'local':
+                            msg = '{case} transfer_type is local, but {filename} is not present'.format(
+                                case=case, filename=name)
+                            logging.error(msg)
+                            if not printed:
+                                print_line(msg, self._event_list)
+                                printed = True
+                        if local_status == FileStatus.PRESENT.value:
+                            missing.append(_id)
+                            sizes.append((0, _id))
+                if mtime is not None and now - mtime > MTIME_SETTLE_SECONDS:
+                    settled[directory] = mtime
+
+            def write():
+                with DataFile._meta.database.atomic():
+                    if present:
+                        self._set_local_status(present, FileStatus.PRESENT)
+                    if missing:
+                        self._set_local_status(missing, FileStatus.NOT_PRESENT)
+                    self._set_field('local_size', sizes)
+                    for directory, mtime in settled.items():
+                        (DataDirectory
+                         .insert(path=directory, mtime=mtime)
+                         .on_conflict_replace()
+                         .execute())
+            self._writer.call(write)
+            if present:
+                change = True
+            self._dir_mtimes.update(settled)
+            self._full_reconcile = False
+            if self._arrived.is_set():
+                self._arrived.clear()
+                change = True
         except Exception as e:
             print_debug(e)
         return change
@@ -455,148 +1190,679 @@ class FileManager(object):
         Returns True if all data is local, False otherwise
         """
         try:
+            if self._memory is not None:
+                if self._memory.count(FileStatus.PRESENT.value) != len(self._memory):
+                    logging.debug('All data is not local')
+                    return False
+                logging.debug('All data is local')
+                return True
             query = (DataFile
-                     .select()
-                     .where(
-                         (DataFile.local_status == FileStatus.NOT_PRESENT.value) |
-                         (DataFile.local_status == FileStatus.IN_TRANSIT.value)))
-            missing_data = query.execute()
+                     .select(DataFile.name)
+                     .where(DataFile.local_status != FileStatus.PRESENT.value))
             # if any of the data is missing, not all data is local
-            if missing_data:
-                logging.debug('All data is not local, missing the following')
-                logging.debug([x.name for x in missing_data])
+            if query.exists():
+                if logging.getLogger().isEnabledFor(logging.DEBUG):
+                    logging.debug('All data is not local, missing the following')
+                    logging.debug([x.name for x in query.execute()])
                 return False
         except Exception as e:
             print_debug(e)
         logging.debug('All data is local')
         return True
 
-    def transfer_needed(self, event_list, event):
+    def set_transfer_windows(self, windows):
+        """
+        Set the job year windows each data type is needed for, so transfers are sent
+        in the order the jobs will use the data
+
+        Parameters:
+            windows (dict): (case, datatype) -> list of (start_year, end_year, job_type)
         """
-        Start a transfer job for any files that arent local, but do exist remotely
+        self._scheduler.set_windows(windows)
 
-        Globus user must already be logged in
+    def transfer_needed(self, event_list, event):
         """
+        Start a transfer of the next batch of missing files from every remote endpoint
+        that doesnt already have a transfer running
 
-        # required files dont exist locally, do exist remotely
-        # or if they do exist locally have a different local and remote size
-        target_files = list()
+        The files needed by the earliest jobs are sent first, at most transfer_batch_size
+        files per transfer. Globus user must already be logged in
+        """
         try:
+            self._start_writer()
+            self._recover_transfers()
+            self._sync_catalog()
+            busy = set(key for key, thread in self._active_transfers.items() if thread.is_alive())
+            busy.update(self._globus_tasks.keys())
             q = (DataFile
-                 .select(DataFile.case)
+                 .select(
+                     DataFile.id,
+                     DataFile.case,
+                     DataFile.datatype,
+                     DataFile.year,
+                     DataFile.month,
+                     DataFile.local_path,
+                     DataFile.remote_path,
+                     DataFile.transfer_type,
+                     DataFile.remote_uuid,
+                     DataFile.remote_hostname)
                  .where(
-                     DataFile.local_status == FileStatus.NOT_PRESENT.value))
-            caselist = [x.case for x in q.execute()]
-            if not caselist or len(caselist) == 0:
-                return
-            cases = list()
-            for case in caselist:
-                if case not in cases:
-                    cases.append(case)
+                     (DataFile.local_status == FileStatus.NOT_PRESENT.value) &
+                     (DataFile.transfer_type != 'local')))
+            endpoints = dict()
+            links = list()
+            for file in q.namedtuples().iterator():
+                if file.transfer_type == 'link':
+                    links.append(file)
+                    continue
+                key = self._endpoint_key(file)
+                if key in busy or not self._recovery.endpoint_ready(key):
+                    continue
+                if not self._recovery.file_ready(file.id):
+                    continue
+                endpoints.setdefault(key, list()).append(file)
 
-            for case in cases:
-                q = (DataFile
-                     .select()
-                     .where(
-                            (DataFile.case == case) &
-                            (DataFile.local_status == FileStatus.NOT_PRESENT.value)))
-                required_files = [x for x in q.execute()]
-                for file in required_files:
-                    if file.transfer_type == 'local':
-                        required_files.remove(file)
-                if not required_files:
-                    msg = 'ERROR: all missing files are marked as local'
-                    print_line(msg, self._event_list)
-                    return
-                # mark files as in-transit so we dont double-copy
-                q = (DataFile
-                     .update({DataFile.local_status: FileStatus.IN_TRANSIT})
-                     .where(DataFile.name << [x.name for x in required_files]))
-                q.execute()
-
-                for file in required_files:
-                    target_files.append({
-                        'local_path': file.local_path,
-                        'remote_path': file.remote_path,
-                    })
-
-                if required_files[0].transfer_type == 'globus':
-                    msg = 'Starting globus file transfer of {} files'.format(
-                        len(required_files))
-                    print_line(msg, self._event_list)
-                    msg = 'See https://www.globus.org/app/activity for transfer details'
-                    print_line(msg, self._event_list)
-
-                    client = get_client()
-                    if not self.verify_remote_files(client=client, case=case):
-                        return False
-                    remote_uuid = required_files[0].remote_uuid
-                    local_uuid = self._config['global']['local_globus_uuid']
-                    thread_name = '{}_globus_transfer'.format(required_files[0].case)
-                    _args = (client, remote_uuid,
-                             local_uuid, target_files,
-                             self.kill_event)
-                    thread = Thread(
-                        target=globus_transfer,
-                        name=thread_name,
-                        args=_args)
-                    self.thread_list.append(thread)
-                    thread.start()
-                elif required_files[0].transfer_type == 'sftp':
-                    msg = 'Starting sftp file transfer of {} files'.format(
-                        len(required_files))
-                    print_line(msg, self._event_list)
-
-                    client = get_ssh_client(required_files[0].remote_hostname)
-                    if not self.verify_remote_files(client=client, case=case):
-                        return False
-                    thread_name = '{}_sftp_transfer'.format(required_files[0].case)
-                    _args = (target_files, client, self.kill_event)
-                    thread = Thread(
-                        target=self._ssh_transfer,
-                        name=thread_name,
-                        args=_args)
-                    self.thread_list.append(thread)
-                    thread.start()
+            if links:
+                self._link_files(links)
+            for (transfer_type, endpoint), files in endpoints.items():
+                batch = self._scheduler.next_batch(files)
+                if not self._start_transfer(transfer_type, endpoint, batch):
+                    return False
         except Exception as e:
             print_debug(e)
             return False
 
-    def _ssh_transfer(self, target_files, client, event):
-        sftp_client = client.open_sftp()
-        for file in target_files:
-            if event.is_set():
-                return
-            _, filename = os.path.split(file['local_path'])
-            msg = 'sftp transfer from {} to {}'.format(
-                file['remote_path'], file['local_path'])
+    def _endpoint_key(self, file):
+        """
+        Return the (transfer_type, endpoint) a file is sent from, its remote globus uuid or hostname
+        """
+        if file.transfer_type == 'globus':
+            return (file.transfer_type, file.remote_uuid)
+        return (file.transfer_type, file.remote_hostname)
+
+    def _link_files(self, files):
+        """
+        Ingest files that are already on this machine by linking them into the local_path,
+        they're marked PRESENT straight away since nothing has to be copied. Sources that
+        dont exist yet are reported once and picked up on a later pass once they do
+
+        Parameters:
+            files (list): the DataFiles with transfer_type link to bring in
+        """
+        results = link_files(
+            file_list=[{
+                'id': x.id,
+                'remote_path': x.remote_path,
+                'local_path': x.local_path
+            } for x in files],
+            workers=int(self._config['global'].get('link_workers', 16)))
+        ids = list()
+        sizes = list()
+        methods = dict()
+        missing = list()
+        for file, method in results:
+            if method is None:
+                if file['remote_path'] not in self._link_missing:
+                    self._link_missing.add(file['remote_path'])
+                    missing.append(file['remote_path'])
+                continue
+            self._link_missing.discard(file['remote_path'])
+            methods[method] = methods.get(method, 0) + 1
+            ids.append(file['id'])
+            try:
+                sizes.append((os.path.getsize(file['local_path']), file['id']))
+            except OSError:
+                continue
+        if ids:
+            self._set_local_status(ids, FileStatus.PRESENT)
+            self._set_field('local_size', sizes)
+            self._arrived.set()
+            msg = 'Linked {count} local files into place ({methods})'.format(
+                count=len(ids),
+                methods=', '.join('{} {}'.format(count, method)
+                                  for method, count in sorted(methods.items())))
             logging.info(msg)
+            print_line(msg, self._event_list)
+        if missing:
+            # they're tried again on every pass, but only reported the first time
+            msg = 'Unable to link {} files, the first was {}, waiting for them to appear'.format(
+                len(missing), missing[0])
+            logging.error(msg)
+            print_line(msg, self._event_list)
+
+    def _start_transfer(self, transfer_type, endpoint, batch):
+        """
+        Mark a batch of files in transit and start a thread to transfer them
+
+        Parameters:
+            transfer_type (str): globus, sftp or rsync
+            endpoint (str): the remote globus uuid or hostname, empty for rsync from local paths
+            batch (list): the files to transfer
+        Returns:
+            False if the remote files couldnt be verified, True otherwise
+        """
+        years = [x.year for x in batch if x.year]
+        msg = 'Starting {transfer_type} file transfer of {count} files'.format(
+            transfer_type=transfer_type, count=len(batch))
+        if years:
+            msg += ' for years {}-{}'.format(min(years), max(years))
+        print_line(msg, self._event_list)
+
+        if transfer_type == 'globus':
+            msg = 'See https://www.globus.org/app/activity for transfer details'
+            print_line(msg, self._event_list)
+            client = self._get_globus_client()
+        elif transfer_type == 'rsync' and not endpoint:
+            # the remote paths are on this machine
+            client = None
+        else:
+            client = self._get_ssh_client(endpoint)
+            if client is None:
+                msg = 'Unable to open an ssh connection to {}'.format(endpoint)
+                print_line(msg, self._event_list)
+                return False
+        for case in sorted(set(x.case for x in batch)):
+            if case in self._verified_cases:
+                continue
+            if not self.verify_remote_files(client=client, case=case):
+                return False
+            self._verified_cases.add(case)
+
+        # mark files as in-transit so we dont double-copy, by id so
+        # files with the same name in other cases are left alone
+        self._set_local_status([x.id for x in batch], FileStatus.IN_TRANSIT)
+        self._recovery.started((transfer_type, endpoint), [x.id for x in batch])
+
+        target_files = [{
+            'id': file.id,
+            'local_path': file.local_path,
+            'remote_path': file.remote_path,
+        } for file in batch]
+        # the manifests go first so they're usually in place before the data is checksummed
+        target_files = self._manifest_targets(batch) + target_files
+
+        if transfer_type == 'globus':
+            return self._submit_globus_transfer(client, endpoint, target_files)
+
+        # each batch gets its own stop event so a stalled one can be stopped on its own
+        stop = threading.Event()
+        if self.kill_event.is_set():
+            stop.set()
+        thread_name = '{}_{}_transfer'.format(endpoint, transfer_type)
+        thread = Thread(
+            target=self._rsync_transfer if transfer_type == 'rsync' else self._ssh_transfer,
+            name=thread_name,
+            args=(target_files, endpoint, stop))
+        self._active_transfers[(transfer_type, endpoint)] = thread
+        self._transfer_stops[(transfer_type, endpoint)] = stop
+        self.thread_list.append(thread)
+        thread.start()
+        return True
+
+    def _get_globus_client(self):
+        """
+        Return the globus client shared by every transfer, creating it the first time it's needed
+        """
+        if self._globus_client is None:
+            self._globus_client = get_client()
+        return self._globus_client
+
+    def _submit_globus_transfer(self, client, endpoint, target_files):
+        """
+        Submit a single globus task for a batch of files from one remote endpoint,
+        whichever cases they belong to, and follow it with the shared task poller
+
+        Parameters:
+            client (TransferClient): the shared globus client
+            endpoint (str): the remote globus uuid
+            target_files (list): dicts with the id, local_path and remote_path of each file
+        Returns:
+            True, files whose task couldnt be submitted are left for the next pass
+        """
+        # with local checksums globus only has to compare timestamps
+        sync_level = 'mtime' if self._verify_checksums else 'checksum'
+        task_id = globus_submit(
+            client=client,
+            remote_uuid=endpoint,
+            local_uuid=self._config['global']['local_globus_uuid'],
+            file_list=target_files,
+            sync_level=sync_level)
+        if task_id is None:
+            msg = 'Unable to submit the globus transfer from {}'.format(endpoint)
+            print_line(msg, self._event_list)
+            self._transfer_ended(('globus', endpoint), failed=True)
+            return True
+
+        if self._globus_poller is None or not self._globus_poller.is_alive():
+            self._globus_poller = TaskPoller(
+                client=client,
+                kill_event=self.kill_event)
+            self.thread_list.append(self._globus_poller)
+            self._globus_poller.start()
+        key = ('globus', endpoint)
+        self._globus_tasks[key] = task_id
+        ids_by_path = {x['local_path']: x['id'] for x in target_files if x.get('id')}
+        self._globus_poller.add(
+            task_id,
+            on_files_done=partial(self._files_transferred, ids_by_path),
+            on_finished=partial(self._globus_transfer_finished, key))
+        return True
 
-            msg = 'starting sftp transfer for {}'.format(filename)
+    def _globus_transfer_finished(self, key, task_id, succeeded, details):
+        """
+        Callback for the task poller once a globus task has ended, frees its
+        endpoint for the next batch
+
+        Parameters:
+            key (tuple): the (transfer_type, remote uuid) the task was sent for
+            task_id (str): the id of the task
+            succeeded (bool): if the task succeeded
+            details (str): the reason the task failed
+        """
+        if self._globus_tasks.get(key) != task_id:
+            return
+        del self._globus_tasks[key]
+        if not succeeded:
+            msg = 'Globus transfer {} failed: {}'.format(task_id, details)
+            logging.error(msg)
             print_line(msg, self._event_list)
+        self._transfer_ended(key, failed=not succeeded)
+        if self._wake_event:
+            self._wake_event.set()
 
-            ssh_transfer(sftp_client, file)
-            
-            msg = 'sftp transfer complete for {}'.format(filename)
+    def _recover_transfers(self):
+        """
+        Return the files of stalled transfers, and of transfer threads that died
+        without reporting back, to the queue
+        """
+        for key in self._recovery.stalled():
+            msg = 'No files have arrived from {} in {}, sending them again'.format(
+                key[1], format_duration(self._recovery.stall_timeout))
             print_line(msg, self._event_list)
+            task_id = self._globus_tasks.pop(key, None)
+            if task_id is not None and self._globus_poller is not None:
+                self._globus_poller.cancel(task_id)
+            # the thread of a stalled sftp or rsync batch is stopped, so the endpoint is free again
+            stop = self._transfer_stops.get(key)
+            if stop is not None:
+                stop.set()
+            self._transfer_ended(key, failed=True)
+        for key in self._recovery.active():
+            if key[0] == 'globus':
+                continue
+            thread = self._active_transfers.get(key)
+            if thread is None or not thread.is_alive():
+                self._transfer_ended(key, failed=True)
+
+    def _transfer_ended(self, key, failed):
+        """
+        Return the files of a transfer batch that didnt arrive to NOT_PRESENT
 
-            msg = self.report_files_local()
+        Their directories are scanned again, so files the transfer skipped because they were
+        already there are found. If the transfer failed the files are held back
+        before being sent again
+
+        Parameters:
+            key (tuple): the (transfer_type, endpoint) of the batch
+            failed (bool): if the transfer failed, rather than finished or was stopped
+        """
+        ids = self._recovery.ended(key, failed)
+        if not ids:
+            return
+        self._set_local_status(ids, FileStatus.NOT_PRESENT)
+        directories = set()
+        step = 500
+        for idx in range(0, len(ids), step):
+            q = (DataFile
+                 .select(DataFile.local_path)
+                 .where(DataFile.id << ids[idx: idx + step]))
+            directories.update(os.path.split(x[0])[0] for x in q.tuples())
+        self._forget_directories(list(directories))
+        if not failed:
+            return
+        given_up = set(self._recovery.given_up()).intersection(ids)
+        msg = '{count} files from {endpoint} did not arrive'.format(
+            count=len(ids), endpoint=key[1])
+        if given_up:
+            msg += ', giving up on {} that failed {} times'.format(
+                len(given_up), self._recovery.max_retries)
+        logging.error(msg)
+        print_line(msg, self._event_list)
+        if not self._recovery.endpoint_ready(key):
+            msg = 'Transfers from {} keep failing, waiting before trying it again'.format(key[1])
             print_line(msg, self._event_list)
 
-    def report_files_local(self):
+    def _get_ssh_client(self, hostname):
         """
-        Return a string in the format 'X of Y files availabe locally' where X is the number here, and Y is the total
+        Return a live ssh client for a host from the session pool, logging in
+        the first time it's needed and reconnecting if the connection dropped
+        """
+        return self._ssh_pool.client(
+            hostname,
+            username=self._host_option(hostname, 'ssh_username', None),
+            key_filename=self._host_option(hostname, 'ssh_key_file', None),
+            compress=self._host_option(hostname, 'sftp_compression', False) in ['True', 'true', '1', 1, True])
+
+    def _manifest_targets(self, required_files):
         """
+        Return the transfer targets for the checksum manifest next to each remote
+        directory the required files come from
+        """
+        if not self._verify_checksums or not self._checksum_manifest:
+            return list()
+        directories = dict()
+        for file in required_files:
+            remote_dir, _ = os.path.split(file.remote_path)
+            local_dir, _ = os.path.split(file.local_path)
+            directories.setdefault(remote_dir, local_dir)
+        return [{
+            'local_path': os.path.join(local, self._checksum_manifest),
+            'remote_path': os.path.join(remote, self._checksum_manifest),
+        } for remote, local in directories.items()]
+
+    def start_checksum_verifier(self):
+        """
+        Start checksumming transferred files in the background as they arrive
+        """
+        if not self._verify_checksums or self._verifier is not None:
+            return
+        self._start_writer()
+        self._verifier = ChecksumVerifier(
+            pending=self._checksums_pending,
+            record=self._record_checksums,
+            kill_event=self.kill_event,
+            algorithm=self._checksum_algorithm,
+            workers=int(self._config['global'].get('checksum_workers', 4)))
+        self._verifier.start()
+        self.thread_list.append(self._verifier)
+
+    def _checksums_pending(self):
+        """
+        Return a list of (id, local_path) for the transferred files that are local but not yet checksummed
+
+        Files in a directory whose manifest hasnt arrived yet are left until it has,
+        so they're compared against it instead of being recorded unchecked
+        """
+        self._sync_catalog()
         q = (DataFile
-             .select(DataFile.local_status)
-             .where(DataFile.local_status == FileStatus.PRESENT.value))
-        local = len([x.local_status for x in q.execute()])
+             .select(DataFile.id, DataFile.local_path)
+             .where(
+                 (DataFile.local_status == FileStatus.PRESENT.value) &
+                 (DataFile.transfer_type.not_in(['local', 'link'])) &
+                 (DataFile.checksum == '')))
+        pending = list()
+        manifests = dict()
+        for _id, path in q.tuples().iterator():
+            if self._checksum_manifest:
+                directory, _ = os.path.split(path)
+                if directory not in manifests:
+                    manifests[directory] = os.path.exists(
+                        os.path.join(directory, self._checksum_manifest))
+                if not manifests[directory]:
+                    continue
+            pending.append((_id, path))
+            if len(pending) == 1000:
+                break
+        return pending
 
-        q = (DataFile.select(DataFile.local_status))
-        total = len([x.local_status for x in q.execute()])
+    def _record_checksums(self, results):
+        """
+        Store computed checksums, any file that doesnt match the manifest in its
+        directory is deleted and marked NOT_PRESENT so it gets transferred again,
+        counting as a failed transfer so a file that is corrupt at the source is given up on
+
+        Parameters:
+            results (list): tuples of (id, local_path, checksum)
+        """
+        manifests = dict()
+        verified = list()
+        mismatched = list()
+        directories = list()
+        for _id, path, checksum in results:
+            directory, name = os.path.split(path)
+            if directory not in manifests:
+                manifests[directory] = read_manifest(
+                    os.path.join(directory, self._checksum_manifest)) if self._checksum_manifest else dict()
+            expected = manifests[directory].get(name)
+            if expected and expected != checksum:
+                msg = 'Checksum mismatch for {}, transferring it again'.format(path)
+                logging.error(msg)
+                print_line(msg, self._event_list)
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+                mismatched.append(_id)
+                directories.append(directory)
+            else:
+                verified.append((checksum, _id))
+        if mismatched:
+            q = (DataFile
+                 .select(
+                     DataFile.id,
+                     DataFile.transfer_type,
+                     DataFile.remote_uuid,
+                     DataFile.remote_hostname)
+                 .where(DataFile.id << mismatched))
+            endpoints = dict()
+            for file in q.namedtuples():
+                endpoints.setdefault(self._endpoint_key(file), list()).append(file.id)
+            for key, ids in endpoints.items():
+                self._recovery.rejected(key, ids)
+            self._set_local_status(mismatched, FileStatus.NOT_PRESENT)
+            self._set_field('local_size', [(0, x) for x in mismatched])
+            self._forget_directories(directories)
+        self._recovery.verified([x for _, x in verified])
+        self._set_field('checksum', verified)
+        logging.info('verified %d files, %d checksum mismatches', len(verified), len(mismatched))
+
+    def _host_option(self, hostname, option, default):
+        """
+        Return an sftp option for a host, set in the section of a case with that
+        remote_hostname or for every host in the global section
+        """
+        for case in self._config['simulations'].values():
+            if not isinstance(case, dict) or case.get('remote_hostname') != hostname:
+                continue
+            if case.get(option):
+                return case[option]
+        return self._config['global'].get(option, default)
+
+    def _ssh_transfer(self, target_files, hostname, event):
+        """
+        Transfer files over a pool of sftp channels, marking each file PRESENT as it completes
+        """
+        workers = int(self._host_option(hostname, 'sftp_workers', 4))
+        logging.info('sftp transfer of %d files from %s over %d channels',
+                     len(target_files), hostname, workers)
+        try:
+            count, size, seconds = ssh_transfer_files(
+                client=partial(self._get_ssh_client, hostname),
+                file_list=target_files,
+                workers=workers,
+                event=event,
+                on_file_done=partial(self._batch_file_done, 'sftp'),
+                large_file_size=int(float(self._host_option(hostname, 'sftp_large_file_mb', 1024)) * 1024 * 1024),
+                range_workers=int(self._host_option(hostname, 'sftp_range_workers', 4)),
+                window_size=int(self._host_option(hostname, 'sftp_window_size', 0)),
+                max_packet_size=int(self._host_option(hostname, 'sftp_max_packet_size', 0)))
+        finally:
+            # anything that didnt arrive goes back in the queue, without counting against it if we were stopped,
+            # a stalled batch has already been counted
+            self._transfer_ended(('sftp', hostname), failed=not self.kill_event.is_set())
+        self._report_batch('sftp', hostname, len(target_files), count, size, seconds)
+
+    def _rsync_transfer(self, target_files, hostname, event):
+        """
+        Transfer files with several rsync processes, marking each file PRESENT as it completes
+
+        Parameters:
+            target_files (list): dicts with the id, local_path and remote_path of each file
+            hostname (str): the host to rsync from over ssh, or empty if the remote_paths are local
+            event (threading.Event): an event to listen for to stop the transfer
+        """
+        workers = int(self._host_option(hostname, 'rsync_workers', 4))
+        logging.info('rsync transfer of %d files from %s with %d workers',
+                     len(target_files), hostname or 'the local filesystem', workers)
+        try:
+            count, size, seconds = rsync_transfer_files(
+                file_list=target_files,
+                hostname=hostname or None,
+                workers=workers,
+                event=event,
+                on_file_done=partial(self._batch_file_done, 'rsync'),
+                username=self._host_option(hostname, 'ssh_username', None),
+                key_filename=self._host_option(hostname, 'ssh_key_file', None),
+                partial=self._host_option(hostname, 'rsync_partial', True) in ['True', 'true', '1', 1, True],
+                inplace=self._host_option(hostname, 'rsync_inplace', False) in ['True', 'true', '1', 1, True],
+                options=self._host_option(hostname, 'rsync_options', ''))
+        finally:
+            self._transfer_ended(('rsync', hostname), failed=not self.kill_event.is_set())
+        self._report_batch('rsync', hostname or 'the local filesystem', len(target_files), count, size, seconds)
+
+    def _batch_file_done(self, transfer_type, file):
+        """
+        Callback for the sftp and rsync transfers as each file completes
+        """
+        _, filename = os.path.split(file['local_path'])
+        if file.get('id'):
+            self._files_transferred(
+                {file['local_path']: file['id']}, [file['local_path']])
+        msg = '{} transfer complete for {}'.format(transfer_type, filename)
+        print_line(msg, self._event_list)
+
+    def _report_batch(self, transfer_type, source, total, count, size, seconds):
+        """
+        Print the throughput of a finished sftp or rsync batch, and the overall progress
+        """
+        msg = '{transfer_type} transferred {count} of {total} files ({size}) from {source} in {time}, {rate}/s'.format(
+            transfer_type=transfer_type,
+            count=count,
+            total=total,
+            size=format_size(size),
+            source=source,
+            time=format_duration(seconds),
+            rate=format_size(size / seconds if seconds else 0))
+        logging.info(msg)
+        print_line(msg, self._event_list)
+        msg = self.report_files_local()
+        print_line(msg, self._event_list)
+        msg = self.report_transfer_progress()
+        if msg:
+            print_line(msg, self._event_list)
+
+    def _files_transferred(self, ids_by_path, paths):
+        """
+        Mark files PRESENT as soon as their transfer finishes, without waiting
+        for the rest of the transfer or the next directory scan
+
+        Parameters:
+            ids_by_path (dict): local path -> DataFile id of the files being transferred
+            paths (list): the local paths of the files that just finished
+        """
+        ids = list()
+        sizes = list()
+        for path in paths:
+            _id = ids_by_path.get(path)
+            if _id is None:
+                continue
+            ids.append(_id)
+            try:
+                sizes.append((os.path.getsize(path), _id))
+            except OSError:
+                continue
+        if not ids:
+            return
+        self._recovery.arrived(ids)
+        # applied in the background by the catalog writer
+        self._writer.set_status(ids, FileStatus.PRESENT)
+        self._set_field('local_size', sizes)
+        logging.info('%d transferred files are now local', len(ids))
+        self._arrived.set()
+        if self._wake_event:
+            self._wake_event.set()
+
+    def report_files_local(self):
+        """
+        Return a string in the format 'X of Y files availabe locally' where X is the number here, and Y is the total
+        """
+        if self._memory is not None:
+            local = self._memory.count(FileStatus.PRESENT.value)
+            total = self._memory.count()
+        else:
+            local = (DataFile
+                     .select()
+                     .where(DataFile.local_status == FileStatus.PRESENT.value)
+                     .count())
+            total = DataFile.select().count()
 
         msg = '{local}/{total} files available locally or {prec:.2f}%'.format(
-            local=local, total=total, prec=((local*1.0)/total)*100)
+            local=local, total=total, prec=((local*1.0)/total)*100 if total else 100.0)
+        return msg
+
+    def report_failed_transfers(self):
+        """
+        Return a string naming the files that were given up on after failing
+        transfer_max_retries times, or None if there are none
+        """
+        ids = self._recovery.given_up()
+        names = list()
+        step = 500
+        for idx in range(0, len(ids), step):
+            q = (DataFile
+                 .select(DataFile.name)
+                 .where(
+                     (DataFile.id << ids[idx: idx + step]) &
+                     (DataFile.local_status != FileStatus.PRESENT.value)))
+            names.extend(x[0] for x in q.tuples())
+        if not names:
+            return None
+        return '{count} files could not be transferred after {retries} attempts, including {names}'.format(
+            count=len(names),
+            retries=self._recovery.max_retries,
+            names=', '.join(sorted(names)[:5]))
+
+    def transfer_progress(self):
+        """
+        Return a tuple of (local bytes, total bytes, bytes per second, seconds remaining)
+
+        The total uses the remote sizes recorded while verifying the remote files, so
+        files that havent been listed yet only count once they're local. The rate and
+        time remaining are None until the throughput can be measured
+
+        The totals are summed over the catalog only when sizes have changed since the
+        last call, otherwise the previous totals are reused
+        """
+        if self._byte_totals is None or self._sizes_changed.is_set():
+            # cleared first so a size written during the sum is picked up next time
+            self._sizes_changed.clear()
+            local, total = (DataFile
+                            .select(
+                                fn.SUM(DataFile.local_size),
+                                fn.SUM(fn.MAX(DataFile.local_size, DataFile.remote_size)))
+                            .scalar(as_tuple=True))
+            self._byte_totals = (local or 0, total or 0)
+        local, total = self._byte_totals
+        self._progress.sample(local)
+        return local, total, self._progress.rate(), self._progress.eta(total - local)
+
+    def report_transfer_progress(self):
+        """
+        Return a string with the bytes available locally and the estimated time to
+        transfer the rest, or None if there is nothing left to transfer
+        """
+        local, total, rate, eta = self.transfer_progress()
+        if total <= local:
+            return None
+        msg = '{local} of {total} available locally'.format(
+            local=format_size(local),
+            total=format_size(total))
+        if eta is None:
+            msg += ', measuring transfer rate'
+        else:
+            msg += ', {rate}/s, about {eta} remaining'.format(
+                rate=format_size(rate),
+                eta=format_duration(eta))
         return msg
 
     def get_file_paths_by_year(self, datatype, case, start_year=None, end_year=None):
@@ -611,12 +1877,21 @@ class FileManager(object):
             end_year (int): the last year to return data for
         """
         try:
+            if self._memory is not None:
+                paths = self._memory.file_paths(
+                    case=case,
+                    datatype=datatype,
+                    status=FileStatus.PRESENT.value,
+                    start_year=start_year,
+                    end_year=end_year,
+                    match_end_year=datatype in ['climo_regrid', 'climo_native', 'ts_regrid', 'ts_native'])
+                return paths if paths else None
             if start_year and end_year:
                 if datatype in ['climo_regrid', 'climo_native', 'ts_regrid', 'ts_native']:
                     query = (DataFile
                          .select()
                          .where(
-                                (DataFile.month == end_year) &
+                                (DataFile.end_year == end_year) &
                                 (DataFile.year == start_year) &
                                 (DataFile.case == case) &
                                 (DataFile.datatype == datatype) &
@@ -1,4 +1,5 @@
 import logging
+import threading
 from time import sleep
 from lib.util import print_debug, format_debug, print_line, print_message
 
@@ -7,6 +8,14 @@ from globus_cli.commands.ls import _get_ls_res as globus_ls
 from globus_cli.commands.login import do_link_login_flow, check_logged_in
 from globus_cli.services.transfer import get_client
 
+# seconds between task status checks, reset to the minimum whenever data is
+# moving and doubled up to the maximum while the task is idle
+POLL_MIN_INTERVAL = 2
+POLL_MAX_INTERVAL = 60
+
+# the most task ids the task list filter accepts at once
+TASK_LIST_FILTER_LIMIT = 50
+
 def get_ls(client, path, endpoint):
     for fail_count in xrange(10):
         try:
@@ -22,17 +31,17 @@ def get_ls(client, path, endpoint):
         else:
             return res
 
-def transfer(client, remote_uuid, local_uuid, file_list, event=None):
+def submit_transfer(client, remote_uuid, local_uuid, file_list, sync_level='checksum'):
     """
-    Setup a file transfer between two endpoints
-    
+    Submit a transfer task between two endpoints, returns the task id or None if it couldnt be submitted
+
     Parameters:
         remote_uuid (str): the globus uuid of the source endpoint
         local_uuid (str): the globus uuid of the destination endpoint
         file_list (list): a list of dictionaries with keys remote_path, local_path
-        event (Threadding.Event): a kill event for running inside a thread
+        sync_level (str): how globus decides a destination file is already up to date,
+            one of exists, size, mtime or checksum
     """
-
     # create the transfer object
     try:
         task_label = 'Processflow auto transfer'
@@ -40,12 +49,12 @@ def transfer(client, remote_uuid, local_uuid, file_list, event=None):
             client,
             remote_uuid,
             local_uuid,
-            sync_level='checksum',
+            sync_level=sync_level,
             label=task_label)
     except Exception as e:
         logging.error('Error creating transfer task')
         logging.error(format_debug(e))
-        return
+        return None
     
     # add in our transfer items
     for datafile in file_list:
@@ -55,7 +64,6 @@ def transfer(client, remote_uuid, local_uuid, file_list, event=None):
             recursive=False)
     
     # Start the transfer
-    task_id = None
     result = None
     try:
         result = client.submit_transfer(transfer_task)
@@ -66,19 +74,178 @@ def transfer(client, remote_uuid, local_uuid, file_list, event=None):
             logging.error("result: %s", str(result))
         logging.error("Could not submit the transfer")
         logging.error(format_debug(e))
-        return
-    
-    # loop until transfer is complete
-    while True:
-        status = client.get_task(task_id)
-        if status['status'] == 'SUCCEEDED':
-            return True, None
-        elif status['status'] == 'FAILED':
-            return False, status.get('nice_status_details')
-        if event and event.is_set():
-            client.cancel_task(task_id)
-            return None, None
-        sleep(10)
+        return None
+    return task_id
+
+def completed_files(client, task_id, seen):
+    """
+    Return the destination paths of the files a task has finished that arent in seen yet,
+    or None if they couldnt be listed
+
+    Parameters:
+        client (TransferClient): the globus client the task was submitted with
+        task_id (str): the id of the task
+        seen (set): the paths already returned, updated in place
+    """
+    done = list()
+    try:
+        for item in client.task_successful_transfers(task_id, num_results=None):
+            path = item['destination_path']
+            if path not in seen:
+                done.append(path)
+    except Exception as e:
+        # the next poll will pick them up
+        logging.error('Unable to list the finished files for task %s', task_id)
+        logging.error(format_debug(e))
+        return None
+    seen.update(done)
+    return done
+
+class TaskPoller(threading.Thread):
+    """
+    A thread that follows every running transfer task with a single task list request per poll
+
+    Finished files are reported as their count grows and each task is reported
+    once it succeeds or fails. The poll interval is reset to POLL_MIN_INTERVAL while
+    any task is moving data and backs off to POLL_MAX_INTERVAL while they are all idle.
+    Once the kill_event is set any tasks still running are cancelled
+
+    Parameters:
+        client (TransferClient): the globus client the tasks are submitted with
+        kill_event (threading.Event): an event to listen for to terminate
+    """
+    def __init__(self, client, kill_event):
+        super(TaskPoller, self).__init__(name='globus_task_poller')
+        self.daemon = True
+        self._client = client
+        self._kill_event = kill_event
+        self._lock = threading.Lock()
+        # task id -> _Task
+        self._tasks = dict()
+
+    def add(self, task_id, on_files_done=None, on_finished=None):
+        """
+        Start following a submitted task
+
+        Parameters:
+            task_id (str): the id of the task
+            on_files_done (function): called with a list of destination paths as files finish
+            on_finished (function): called with (task_id, succeeded, details) once the task ends
+        """
+        with self._lock:
+            self._tasks[task_id] = _Task(on_files_done, on_finished)
+
+    def cancel(self, task_id):
+        """
+        Stop following a task and cancel it, its on_finished isnt called
+        """
+        with self._lock:
+            self._tasks.pop(task_id, None)
+        try:
+            self._client.cancel_task(task_id)
+        except Exception as e:
+            logging.error('Unable to cancel transfer task %s', task_id)
+            logging.error(format_debug(e))
+
+    def active(self):
+        """
+        Return the number of tasks still being followed
+        """
+        with self._lock:
+            return len(self._tasks)
+
+    def poll(self):
+        """
+        Check every task once, returns True if any of them moved data since the last poll
+        """
+        with self._lock:
+            task_ids = self._tasks.keys()
+        moving = False
+        for idx in range(0, len(task_ids), TASK_LIST_FILTER_LIMIT):
+            chunk = task_ids[idx: idx + TASK_LIST_FILTER_LIMIT]
+            documents = self._client.task_list(
+                num_results=None,
+                filter='task_id:' + ','.join(chunk))
+            for document in documents:
+                task_id = document['task_id']
+                with self._lock:
+                    task = self._tasks.get(task_id)
+                if task is None:
+                    continue
+                if task.update(self._client, task_id, document):
+                    moving = True
+                if document['status'] in ['SUCCEEDED', 'FAILED']:
+                    with self._lock:
+                        self._tasks.pop(task_id, None)
+                    task.finish(task_id, document)
+        return moving
+
+    def _cancel_all(self):
+        with self._lock:
+            task_ids, self._tasks = self._tasks.keys(), dict()
+        for task_id in task_ids:
+            try:
+                self._client.cancel_task(task_id)
+            except Exception as e:
+                logging.error('Unable to cancel transfer task %s', task_id)
+                logging.error(format_debug(e))
+
+    def run(self):
+        interval = POLL_MIN_INTERVAL
+        while not self._kill_event.is_set():
+            if not self.active():
+                # nothing to follow, checking for new tasks costs no requests
+                interval = POLL_MIN_INTERVAL
+                self._kill_event.wait(interval)
+                continue
+            try:
+                if self.poll():
+                    interval = POLL_MIN_INTERVAL
+                else:
+                    interval = min(interval * 2, POLL_MAX_INTERVAL)
+            except Exception as e:
+                logging.error('Unable to check the transfer tasks')
+                logging.error(format_debug(e))
+                interval = min(interval * 2, POLL_MAX_INTERVAL)
+            self._kill_event.wait(interval)
+        self._cancel_all()
+
+
+class _Task(object):
+    """
+    The progress seen so far for a task followed by a TaskPoller
+    """
+    def __init__(self, on_files_done, on_finished):
+        self.on_files_done = on_files_done
+        self.on_finished = on_finished
+        self.seen = set()
+        self.listed = 0
+        self.files = 0
+        self.bytes = 0
+
+    def update(self, client, task_id, document):
+        """
+        Report any newly finished files, returns True if the task moved data since the last update
+        """
+        files = document.get('files_transferred') or 0
+        moved = document.get('bytes_transferred') or 0
+        # only page through the finished files when the count has grown
+        if self.on_files_done and (files > self.listed or document['status'] == 'SUCCEEDED'):
+            done = completed_files(client, task_id, self.seen)
+            if done is not None:
+                self.listed = files
+            if done:
+                self.on_files_done(done)
+        moving = files > self.files or moved > self.bytes
+        self.files = files
+        self.bytes = moved
+        return moving
+
+    def finish(self, task_id, document):
+        succeeded = document['status'] == 'SUCCEEDED'
+        logging.info('transfer task %s %s', task_id, document['status'].lower())
+        if self.on_finished:
+            self.on_finished(task_id, succeeded, document.get('nice_status_details'))
 
 def transfer_directory(src_uuid, dst_uuid, src_path, dst_path, event_list=None, killevent=None):
     """
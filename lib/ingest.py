@@ -0,0 +1,104 @@
+"""
+A module for bringing data that is already on this machine into the project without copying it
+"""
+import os
+import errno
+import fcntl
+import logging
+import tempfile
+
+from multiprocessing.pool import ThreadPool
+
+# linux ioctl to make a copy on write clone of a file, on filesystems like btrfs and xfs
+FICLONE = 0x40049409
+
+
+def link_file(source, destination):
+    """
+    Make destination refer to the data in source without copying it
+
+    A hardlink is tried first, then a copy on write clone, and if neither works,
+    for example because the files are on different filesystems, a symlink
+
+    Parameters:
+        source (str): the existing file
+        destination (str): the path to make
+    Returns:
+        how the file was linked, one of exists, hardlink, reflink or symlink,
+        or None if the source doesnt exist or nothing worked
+    """
+    if os.path.lexists(destination):
+        return 'exists'
+    if not os.path.isfile(source):
+        return None
+    directory, _ = os.path.split(destination)
+    if directory and not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError as e:
+            if e.errno != errno.EEXIST:
+                raise
+    try:
+        os.link(source, destination)
+        return 'hardlink'
+    except OSError as e:
+        logging.debug('unable to hardlink %s: %s', source, e)
+    if _reflink(source, destination):
+        return 'reflink'
+    try:
+        os.symlink(os.path.abspath(source), destination)
+        return 'symlink'
+    except OSError as e:
+        logging.error('unable to link %s to %s: %s', source, destination, e)
+    return None
+
+
+def _reflink(source, destination):
+    # the clone is made under a temporary name and only renamed into place once it has
+    # worked, so an empty file is never seen at the destination
+    directory, name = os.path.split(destination)
+    try:
+        fd, temp_path = tempfile.mkstemp(dir=directory or '.', prefix='.{}.'.format(name))
+    except OSError:
+        return False
+    try:
+        try:
+            with open(source, 'rb') as src:
+                fcntl.ioctl(fd, FICLONE, src.fileno())
+        finally:
+            os.close(fd)
+        os.chmod(temp_path, os.stat(source).st_mode & 0777)
+        os.rename(temp_path, destination)
+    except (IOError, OSError):
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        return False
+    return True
+
+
+def link_files(file_list, workers=16):
+    """
+    Link many files at once
+
+    Parameters:
+        file_list (list): dicts with keys remote_path, the existing file, and local_path
+        workers (int): the number of files to link at once
+    Returns:
+        a list of (file, how it was linked) in the same order as file_list
+    """
+    if not file_list:
+        return list()
+
+    def link(file):
+        try:
+            return file, link_file(file['remote_path'], file['local_path'])
+        except Exception as e:
+            logging.error('unable to link %s: %s', file['remote_path'], e)
+            return file, None
+
+    pool = ThreadPool(max(1, min(workers, len(file_list))))
+    try:
+        return pool.map(link, file_list)
+    finally:
+        pool.close()
+        pool.join()
@@ -222,12 +222,27 @@ Please add a space and run again.'''.format(num=line_index)
         'processflow.db')
     msg = 'Initializing file manager'
     print_line(msg, event_list)
+    persistent = config['global'].get('persistent_catalog') in ['True', 'true', '1', 1, True]
+    if persistent:
+        msg = 'Reusing the file catalog from previous runs'
+        print_line(msg, event_list)
     filemanager = FileManager(
         database=db,
         event_list=event_list,
-        config=config)
-    
-    filemanager.populate_file_list()
+        config=config,
+        persistent=persistent)
+
+    # generate the jobs first so only the data they read gets tracked
+    runmanager = RunManager(
+        event_list=event_list,
+        event=event,
+        config=config,
+        filemanager=filemanager)
+    runmanager.setup_cases()
+
+    filemanager.populate_file_list(
+        data_required=runmanager.get_data_required())
+    filemanager.set_transfer_windows(runmanager.get_data_windows())
     msg = 'Starting local status update'
     print_line(msg, event_list)
 
@@ -238,7 +253,7 @@ Please add a space and run again.'''.format(num=line_index)
     msg = filemanager.report_files_local()
     print_line(msg, event_list)
 
-    filemanager.write_database()
+    filemanager.write_database(force=True)
     all_data = filemanager.all_data_local()
     if all_data:
         msg = 'all data is local'
@@ -273,12 +288,6 @@ Please add a space and run again.'''.format(num=line_index)
                     line='Globus authentication complete',
                     event_list=event_list)
     # setup the runmanager
-    runmanager = RunManager(
-        event_list=event_list,
-        event=event,
-        config=config,
-        filemanager=filemanager)
-    runmanager.setup_cases()
     runmanager.setup_jobs()
     runmanager.write_job_sets(
         os.path.join(config['global']['project_path'],
@@ -0,0 +1,106 @@
+"""
+A module for verifying transferred files with locally computed checksums
+"""
+import os
+import hashlib
+import logging
+import threading
+
+from multiprocessing.pool import ThreadPool
+
+from lib.util import format_debug
+
+# large reads keep the hashing bound by disk throughput instead of python overhead
+CHECKSUM_BLOCK_SIZE = 8 * 1024 * 1024
+
+
+def file_checksum(path, algorithm='md5'):
+    """
+    Return the hex digest of a file, or None if it cant be read
+
+    Parameters:
+        path (str): the file to checksum
+        algorithm (str): any algorithm supported by hashlib
+    """
+    digest = hashlib.new(algorithm)
+    try:
+        with open(path, 'rb') as fp:
+            while True:
+                block = fp.read(CHECKSUM_BLOCK_SIZE)
+                if not block:
+                    break
+                digest.update(block)
+    except IOError:
+        return None
+    return digest.hexdigest()
+
+
+def read_manifest(path):
+    """
+    Return a dict of file name -> checksum from a manifest in md5sum/sha256sum
+    output format, or an empty dict if there is no manifest
+
+    Parameters:
+        path (str): the path to the manifest
+    """
+    manifest = dict()
+    try:
+        with open(path, 'r') as fp:
+            for line in fp:
+                parts = line.strip().split(None, 1)
+                if len(parts) != 2:
+                    continue
+                checksum, name = parts
+                # binary mode entries are prefixed with a *
+                name = os.path.basename(name.lstrip('*'))
+                manifest[name] = checksum.lower()
+    except IOError:
+        pass
+    return manifest
+
+
+class ChecksumVerifier(threading.Thread):
+    """
+    A thread that checksums newly arrived files in the background
+
+    Parameters:
+        pending (function): returns a list of (id, local_path) of files that need a checksum
+        record (function): called with a list of (id, local_path, checksum) once they're computed
+        kill_event (threading.Event): an event to listen for to terminate
+        algorithm (str): the hashlib algorithm to use
+        workers (int): the number of files to checksum at once
+        interval (float): seconds to wait between checks for new files
+    """
+    def __init__(self, pending, record, kill_event, algorithm='md5', workers=4, interval=30):
+        super(ChecksumVerifier, self).__init__(name='checksum_verifier')
+        self.daemon = True
+        self._pending = pending
+        self._record = record
+        self._kill_event = kill_event
+        self._algorithm = algorithm
+        self._workers = workers
+        self._interval = interval
+
+    def _checksum(self, item):
+        _id, path = item
+        return _id, path, file_checksum(path, self._algorithm)
+
+    def run(self):
+        pool = ThreadPool(self._workers)
+        try:
+            while not self._kill_event.is_set():
+                try:
+                    items = self._pending()
+                    # record each batch as it finishes so a kill doesnt lose all the work
+                    for idx in range(0, len(items), self._workers):
+                        if self._kill_event.is_set():
+                            return
+                        results = pool.map(self._checksum, items[idx: idx + self._workers])
+                        self._record([x for x in results if x[2] is not None])
+                except Exception as e:
+                    logging.error('Checksum verification failed')
+                    logging.error(format_debug(e))
+                self._kill_event.wait(self._interval)
+        finally:
+            pool.close()
+            pool.join()
@@ -2,6 +2,9 @@ from peewee import *
 
 database = SqliteDatabase(None)  # Defer initialization
 
+# bump this whenever the tables below change so persistent catalogs get rebuilt
+SCHEMA_VERSION = 6
+
 
 class DataFile(Model):
     case = CharField()
@@ -12,11 +15,63 @@ class DataFile(Model):
     remote_status = IntegerField()
     year = IntegerField()
     month = IntegerField()
+    # the last year of data in the file, multi-year files like climos and
+    # timeseries cover year through end_year
+    end_year = IntegerField(default=0)
     datatype = CharField()
     local_size = IntegerField()
+    # the size reported by the remote listing, 0 if it hasnt been listed
+    remote_size = IntegerField(default=0)
+    # the locally computed checksum, empty until the file has been verified
+    checksum = CharField(default='')
     transfer_type = CharField()
     remote_uuid = CharField()
     remote_hostname = CharField()
 
     class Meta:
         database = database
+        indexes = (
+            (('case', 'datatype', 'year'), False),
+            (('local_status',), False),
+            # a file is registered once, re-adding it replaces the existing row
+            (('case', 'datatype', 'name', 'year', 'end_year'), True),
+        )
+
+
+class DataGroup(Model):
+    """
+    The config signature each (case, datatype) set of DataFiles was rendered from
+    """
+    case = CharField()
+    datatype = CharField()
+    signature = CharField()
+
+    class Meta:
+        database = database
+
+
+class DataDirectory(Model):
+    """
+    The last observed modification time of each local data directory
+    """
+    path = CharField(unique=True)
+    mtime = FloatField()
+
+    class Meta:
+        database = database
+
+
+class RemoteDirectory(Model):
+    """
+    The last listing of each remote data directory, name -> size as json
+    """
+    endpoint = CharField()
+    path = CharField()
+    listed = FloatField()
+    contents = TextField()
+
+    class Meta:
+        database = database
+        indexes = (
+            (('endpoint', 'path'), True),
+        )
@@ -0,0 +1,77 @@
+"""
+A module for estimating how long the remaining data transfers will take
+"""
+import threading
+
+from collections import deque
+from datetime import timedelta
+from time import time
+
+
+def format_size(size):
+    """
+    Return a human readable string for a number of bytes
+    """
+    size = float(size)
+    for unit in ['B', 'KB', 'MB', 'GB', 'TB']:
+        if abs(size) < 1024.0 or unit == 'TB':
+            break
+        size /= 1024.0
+    return '{:.1f} {}'.format(size, unit)
+
+
+def format_duration(seconds):
+    """
+    Return a string like 1 day, 2:03:04 for a number of seconds
+    """
+    return str(timedelta(seconds=int(seconds)))
+
+
+class TransferProgress(object):
+    """
+    Estimates transfer throughput from how the number of bytes available locally grows
+
+    The rate is measured over the samples taken in the last window seconds, so it
+    follows the current throughput instead of the average over the whole run
+
+    Parameters:
+        window (float): the number of seconds of samples to measure the rate over
+    """
+    def __init__(self, window=600):
+        self._lock = threading.Lock()
+        self._window = window
+        # (time, bytes available locally)
+        self._samples = deque()
+
+    def sample(self, local_bytes, now=None):
+        """
+        Record the number of bytes available locally
+        """
+        now = time() if now is None else now
+        with self._lock:
+            self._samples.append((now, local_bytes))
+            # keep one sample older than the window so the rate covers all of it
+            while len(self._samples) > 2 and now - self._samples[1][0] > self._window:
+                self._samples.popleft()
+
+    def rate(self):
+        """
+        Return the observed throughput in bytes per second, or None if it cant be measured yet
+        """
+        with self._lock:
+            if len(self._samples) < 2:
+                return None
+            start_time, start_bytes = self._samples[0]
+            end_time, end_bytes = self._samples[-1]
+        if end_time <= start_time or end_bytes <= start_bytes:
+            return None
+        return (end_bytes - start_bytes) / (end_time - start_time)
+
+    def eta(self, remaining_bytes):
+        """
+        Return the estimated number of seconds to transfer remaining_bytes, or None if unknown
+        """
+        rate = self.rate()
+        if not rate:
+            return None
+        return remaining_bytes / rate
@@ -0,0 +1,86 @@
+"""
+A module for reconciling the file catalog against the contents of the local data directories
+"""
+import os
+import logging
+
+from multiprocessing.pool import ThreadPool
+
+try:
+    from os import scandir
+except ImportError:
+    try:
+        from scandir import scandir
+    except ImportError:
+        scandir = None
+
+# directories modified this recently may still change without their mtime
+# moving, so their mtime isnt trusted for skipping
+MTIME_SETTLE_SECONDS = 1.0
+
+
+def list_directory(path):
+    """
+    Return a dict of entry name -> size for the entries in a directory, or None if it cant be read
+
+    Parameters:
+        path (str): the directory to list
+    """
+    try:
+        if scandir is not None:
+            entries = [(entry.name, entry.stat) for entry in scandir(path)]
+        else:
+            entries = [(name, lambda name=name: os.stat(os.path.join(path, name)))
+                       for name in os.listdir(path)]
+    except OSError:
+        return None
+    contents = dict()
+    for name, stat in entries:
+        try:
+            contents[name] = stat().st_size
+        except OSError:
+            # removed while it was being listed
+            contents[name] = 0
+    return contents
+
+
+def _scan(item):
+    path, known_mtime = item
+    try:
+        mtime = os.stat(path).st_mtime
+    except OSError:
+        return path, None, None
+    if known_mtime is not None and known_mtime == mtime:
+        return path, mtime, False
+    return path, mtime, list_directory(path)
+
+
+def scan_directories(directories, known_mtimes, workers=4):
+    """
+    List every directory that has changed since it was last scanned
+
+    Parameters:
+        directories (list): the directory paths to check
+        known_mtimes (dict): directory path -> the mtime it had when it was last scanned
+        workers (int): the number of threads to spread the scans over
+    Returns:
+        a dict of directory path -> (mtime, contents) where contents is a dict of
+        entry name -> size, False if the directory hasnt changed, or None if it doesnt exist
+    """
+    items = [(path, known_mtimes.get(path)) for path in directories]
+    if workers > 1 and len(items) > 1:
+        pool = ThreadPool(min(workers, len(items)))
+        try:
+            results = pool.map(_scan, items)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = [_scan(item) for item in items]
+
+    scanned = dict()
+    for path, mtime, contents in results:
+        scanned[path] = (mtime, contents)
+    logging.debug('scanned %d of %d directories',
+                  len([x for x in scanned.values() if x[1]]), len(scanned))
+    return scanned
@@ -0,0 +1,188 @@
+"""
+A module for returning the files of failed or stalled transfers to the queue
+"""
+import logging
+import threading
+
+from time import time
+
+
+class TransferRecovery(object):
+    """
+    Tracks the files of every running transfer batch, so the ones that never
+    arrive can be sent again
+
+    A file whose batch fails is held back for retry_delay seconds, doubling with
+    each failure, and given up on after max_retries failures. An endpoint is held
+    back the same way after a failed batch, and after max_failures failed batches
+    in a row it is only tried again every MAX_DELAY seconds, so a long outage
+    doesnt stop the run from picking up once the endpoint is back
+
+    Parameters:
+        max_retries (int): the number of failed transfers before a file is given up on
+        retry_delay (float): seconds to wait before the first retry
+        max_failures (int): the number of failed batches in a row before an endpoint
+            is only tried every MAX_DELAY seconds
+        stall_timeout (float): seconds without a file arriving before a batch counts as stalled, 0 to never
+    """
+    # the longest a file or endpoint is held back between retries
+    MAX_DELAY = 6 * 60 * 60
+
+    def __init__(self, max_retries=5, retry_delay=60, max_failures=5, stall_timeout=3600):
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.max_failures = max_failures
+        self.stall_timeout = stall_timeout
+        self._lock = threading.Lock()
+        # (transfer_type, endpoint) -> _Batch
+        self._batches = dict()
+        # DataFile id -> (failures, time it can be retried)
+        self._files = dict()
+        # (transfer_type, endpoint) -> (failed batches in a row, time it can be used again)
+        self._endpoints = dict()
+
+    def started(self, key, ids, now=None):
+        """
+        Start tracking a batch of files sent to an endpoint
+
+        Parameters:
+            key (tuple): the (transfer_type, endpoint) the files are sent from
+            ids (list): the DataFile ids in the batch
+        """
+        with self._lock:
+            self._batches[key] = _Batch(ids, time() if now is None else now)
+
+    def arrived(self, ids, now=None):
+        """
+        Record that files have arrived, they no longer need recovering
+        """
+        now = time() if now is None else now
+        with self._lock:
+            for key, batch in self._batches.items():
+                before = len(batch.outstanding)
+                batch.outstanding.difference_update(ids)
+                if len(batch.outstanding) != before:
+                    batch.last_arrival = now
+                    # the endpoint is working
+                    self._endpoints.pop(key, None)
+
+    def verified(self, ids):
+        """
+        Record that files have arrived intact, their failures are forgotten
+
+        The failures of a file are kept when it arrives, so one that keeps arriving
+        corrupt is still given up on
+        """
+        with self._lock:
+            for _id in ids:
+                self._files.pop(_id, None)
+
+    def rejected(self, key, ids, now=None):
+        """
+        Count files that arrived corrupt as a failed transfer from their endpoint
+
+        Parameters:
+            key (tuple): the (transfer_type, endpoint) the files were sent from
+            ids (list): the DataFile ids that failed their checksum
+        """
+        with self._lock:
+            self._failed(key, ids, time() if now is None else now)
+
+    def ended(self, key, failed, now=None):
+        """
+        Stop tracking an endpoint's batch
+
+        Parameters:
+            key (tuple): the (transfer_type, endpoint) of the batch
+            failed (bool): if the transfer failed, the files that didnt arrive are held
+                back and counted against their retry limit
+        Returns:
+            the ids of the files in the batch that didnt arrive
+        """
+        now = time() if now is None else now
+        with self._lock:
+            batch = self._batches.pop(key, None)
+            if batch is None:
+                return list()
+            ids = list(batch.outstanding)
+            if failed and ids:
+                self._failed(key, ids, now)
+            return ids
+
+    def _failed(self, key, ids, now):
+        for _id in ids:
+            failures, _ = self._files.get(_id, (0, 0))
+            failures += 1
+            self._files[_id] = (failures, now + self._delay(failures))
+            if failures == self.max_retries:
+                logging.error('giving up on DataFile %d after %d failed transfers', _id, failures)
+        failures, _ = self._endpoints.get(key, (0, 0))
+        failures += 1
+        if failures >= self.max_failures:
+            delay = self.MAX_DELAY
+        else:
+            delay = self._delay(failures)
+        self._endpoints[key] = (failures, now + delay)
+        if failures == self.max_failures:
+            logging.error('%s %s failed %d transfers in a row, only trying it every %d seconds',
+                          key[0], key[1], failures, self.MAX_DELAY)
+
+    def stalled(self, now=None):
+        """
+        Return the keys of the batches that havent had a file arrive in stall_timeout seconds
+        """
+        if not self.stall_timeout:
+            return list()
+        now = time() if now is None else now
+        with self._lock:
+            return [
+                key for key, batch in self._batches.items()
+                if now - batch.last_arrival > self.stall_timeout
+            ]
+
+    def active(self):
+        """
+        Return the keys of the batches being tracked
+        """
+        with self._lock:
+            return self._batches.keys()
+
+    def file_ready(self, _id, now=None):
+        """
+        Return True if the file can be sent, False if it's waiting out a retry delay or was given up on
+        """
+        with self._lock:
+            failures, retry_at = self._files.get(_id, (0, 0))
+        if failures >= self.max_retries:
+            return False
+        return (time() if now is None else now) >= retry_at
+
+    def endpoint_ready(self, key, now=None):
+        """
+        Return True if files can be sent from the endpoint
+        """
+        with self._lock:
+            _, retry_at = self._endpoints.get(key, (0, 0))
+        return (time() if now is None else now) >= retry_at
+
+    def given_up(self):
+        """
+        Return the ids of the files that wont be sent again
+        """
+        with self._lock:
+            return [
+                _id for _id, (failures, _) in self._files.items()
+                if failures >= self.max_retries
+            ]
+
+    def _delay(self, failures):
+        return min(self.retry_delay * 2 ** (failures - 1), self.MAX_DELAY)
+
+
+class _Batch(object):
+    """
+    The files of a running transfer that havent arrived yet
+    """
+    def __init__(self, ids, now):
+        self.outstanding = set(ids)
+        self.last_arrival = now
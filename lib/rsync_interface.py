@@ -0,0 +1,190 @@
+"""
+A module for transferring files with rsync over ssh, or between local paths
+"""
+import os
+import math
+import logging
+import tempfile
+import threading
+import subprocess
+
+from time import time, sleep
+from Queue import Queue, Empty
+
+from lib.util import print_debug
+
+# interrupted files are kept here, inside each destination directory, so partial
+# data never sits under a file's final name where it could be taken for complete
+PARTIAL_DIR = '.rsync-partial'
+# seconds rsync is given to exit after being asked to stop before it's killed
+TERMINATE_TIMEOUT = 30
+
+
+def rsync_command(source, destination, files_from, hostname=None, username=None,
+                  key_filename=None, partial=True, inplace=False, options=''):
+    """
+    Return the rsync command line that copies the files listed in files_from
+    from the source directory into the destination directory
+
+    Parameters:
+        source (str): the directory the files are in
+        destination (str): the directory to copy them into
+        files_from (str): a file listing the names to copy, relative to source
+        hostname (str): the host the source is on, or None if it's a local path
+        username (str): the user to log in as
+        key_filename (str): the private key to log in with
+        partial (bool): keep partly transferred files in PARTIAL_DIR so an interrupted
+            rsync can continue them
+        inplace (bool): write updates straight into the existing files instead of a
+            copy, so only the changed blocks of large files are written, rsync doesnt
+            allow a partial directory with this so partial is ignored
+        options (str): any other rsync options
+    """
+    cmd = ['rsync', '--times', '--files-from={}'.format(files_from), '--out-format=%n']
+    if inplace:
+        cmd.append('--inplace')
+    elif partial:
+        cmd.append('--partial-dir={}'.format(PARTIAL_DIR))
+    if options:
+        cmd.extend(options.split())
+    if hostname:
+        # never stop to ask for a password, the login has to work with keys or the agent
+        ssh = ['ssh', '-o', 'BatchMode=yes']
+        if username:
+            ssh.extend(['-l', username])
+        if key_filename:
+            ssh.extend(['-i', os.path.expanduser(key_filename)])
+        cmd.extend(['-e', ' '.join(ssh)])
+        source = '{}:{}'.format(hostname, source)
+    cmd.extend([source.rstrip('/') + '/', destination.rstrip('/') + '/'])
+    return cmd
+
+
+def transfer_files(file_list, hostname=None, workers=4, event=None, on_file_done=None, **kwargs):
+    """
+    Copy files with several rsync processes at once, each one copying a batch
+    of files from the same directory with a single --files-from list
+
+    Parameters:
+        file_list (list): dicts with keys remote_path and local_path, in the order to send them
+        hostname (str): the host the files are on, or None to copy local paths
+        workers (int): the number of rsync processes to run at once
+        event (threading.Event): an event to listen for to stop the transfers, any
+            running rsync is terminated when it's set
+        on_file_done (function): called with the file dict as each transfer completes
+        kwargs: passed to rsync_command
+    Returns:
+        a tuple of (files transferred, bytes transferred, seconds taken)
+    """
+    # files can only share an rsync run if they come from and go to the same directories,
+    # the local files always have the same names as the remote ones
+    groups = dict()
+    for file in file_list:
+        remote_dir, _ = os.path.split(file['remote_path'])
+        local_dir, _ = os.path.split(file['local_path'])
+        groups.setdefault((remote_dir, local_dir), list()).append(file)
+
+    # split the files so every worker has a share
+    chunk_size = int(math.ceil(len(file_list) / float(max(1, workers)))) or 1
+    queue = Queue()
+    for (remote_dir, local_dir), files in groups.items():
+        for idx in range(0, len(files), chunk_size):
+            queue.put((remote_dir, local_dir, files[idx: idx + chunk_size]))
+
+    totals = {'files': 0, 'bytes': 0}
+    lock = threading.Lock()
+
+    def done(file):
+        try:
+            size = os.path.getsize(file['local_path'])
+        except OSError:
+            return
+        with lock:
+            totals['files'] += 1
+            totals['bytes'] += size
+        if on_file_done:
+            on_file_done(file)
+
+    def work():
+        while not (event and event.is_set()):
+            try:
+                source, destination, files = queue.get_nowait()
+            except Empty:
+                return
+            try:
+                run(source, destination, files)
+            except Exception as e:
+                logging.error('rsync of %d files from %s failed', len(files), source)
+                print_debug(e)
+
+    def run(source, destination, files):
+        names = [os.path.split(x['remote_path'])[1] for x in files]
+        if not os.path.exists(destination):
+            os.makedirs(destination)
+        fd, files_from = tempfile.mkstemp(prefix='processflow_rsync_')
+        try:
+            with os.fdopen(fd, 'w') as fp:
+                fp.write('\n'.join(names) + '\n')
+            cmd = rsync_command(source, destination, files_from, hostname=hostname, **kwargs)
+            logging.info(' '.join(cmd))
+            # errors come through the same pipe, reading two pipes one after the other
+            # would block rsync once it filled the one that isnt being read
+            proc = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+            stopper = threading.Thread(target=stop_on_event, args=(proc,))
+            stopper.daemon = True
+            stopper.start()
+            # rsync prints each name as that file finishes
+            by_name = dict(zip(names, files))
+            reported = set()
+            errors = list()
+            for line in iter(proc.stdout.readline, ''):
+                name = line.strip()
+                if name in by_name:
+                    if name not in reported:
+                        reported.add(name)
+                        done(by_name[name])
+                elif name:
+                    errors.append(name)
+                    # only the last few are logged
+                    del errors[:-20]
+            proc.wait()
+            if proc.returncode != 0:
+                logging.error('rsync exited with %d: %s', proc.returncode, '\n'.join(errors))
+                return
+            # files that were already up to date arent listed
+            for name, file in by_name.items():
+                if name not in reported:
+                    done(file)
+        finally:
+            os.remove(files_from)
+
+    def stop_on_event(proc):
+        if not event:
+            return
+        while proc.poll() is None:
+            if event.wait(1.0):
+                break
+        else:
+            return
+        try:
+            proc.terminate()
+            deadline = time() + TERMINATE_TIMEOUT
+            while proc.poll() is None and time() < deadline:
+                sleep(0.5)
+            if proc.poll() is None:
+                logging.error('rsync didnt stop, killing it')
+                proc.kill()
+        except OSError:
+            # it already exited
+            pass
+
+    start = time()
+    threads = [
+        threading.Thread(target=work, name='rsync_worker_{}'.format(idx))
+        for idx in range(max(1, min(workers, queue.qsize())))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return totals['files'], totals['bytes'], time() - start
@@ -232,6 +232,30 @@ class RunManager(object):
         for case in self.cases:
             self._job_total += len(case['jobs'])
 
+    def get_data_required(self):
+        """
+        Return a dict of case -> the set of data types read by the jobs generated for that case
+        """
+        data_required = dict()
+        for case in self.cases:
+            types = data_required.setdefault(case['case'], set())
+            for job in case['jobs']:
+                types.update(job.data_required)
+        return data_required
+
+    def get_data_windows(self):
+        """
+        Return a dict of (case, datatype) -> list of (start_year, end_year, job_type)
+        for every job that reads that data type
+        """
+        windows = dict()
+        for case in self.cases:
+            for job in case['jobs']:
+                for datatype in job.data_required:
+                    windows.setdefault((case['case'], datatype), list()).append(
+                        (job.start_year, job.end_year, job.job_type))
+        return windows
+
     def setup_jobs(self):
         """
         Setup the dependencies for each job in each case
@@ -340,6 +364,9 @@ class RunManager(object):
 
     def write_job_sets(self, path):
         out_str = ''
+        progress = self.filemanager.report_transfer_progress()
+        if progress:
+            out_str += '\ntransfers: ' + progress + '\n'
         with open(path, 'w') as fp:
             for case in self.cases:
                 out_str += '\n==' + '='*len(case['case']) + '==\n'
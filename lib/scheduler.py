@@ -0,0 +1,79 @@
+"""
+A module for ordering file transfers by when the jobs will need the data
+"""
+import heapq
+
+# lower runs first, post-processing feeds the diagnostics and aprime only runs on full sets
+JOB_TYPE_PRIORITY = {
+    'climo': 0,
+    'timeseries': 0,
+    'regrid': 0,
+    'e3sm_diags': 1,
+    'amwg': 1,
+    'aprime': 2
+}
+DEFAULT_PRIORITY = 1
+
+# files no job needs go last
+UNNEEDED = (float('inf'), float('inf'))
+
+
+class TransferScheduler(object):
+    """
+    Ranks missing files by the earliest job that reads them, and hands out bounded batches
+
+    A file is ranked by the end year of the first job window that covers it, then by the
+    job type, so the files for the first climo window all land before anything for later
+    windows and before the ocean data that only aprime reads
+
+    Parameters:
+        batch_size (int): the most files to hand out in one batch
+    """
+    def __init__(self, batch_size=500):
+        self.batch_size = batch_size
+        # (case, datatype) -> list of (end_year, type priority, start_year) sorted earliest first
+        self._windows = dict()
+        # (case, datatype) -> {year: (end_year, type priority)}
+        self._cache = dict()
+
+    def set_windows(self, windows):
+        """
+        Set the job year windows each data type is needed for
+
+        Parameters:
+            windows (dict): (case, datatype) -> list of (start_year, end_year, job_type)
+        """
+        self._windows = dict()
+        for key, items in windows.items():
+            self._windows[key] = sorted(
+                (end, JOB_TYPE_PRIORITY.get(job_type, DEFAULT_PRIORITY), start)
+                for start, end, job_type in items)
+        self._cache = dict()
+
+    def priority(self, case, datatype, year):
+        """
+        Return a sortable (end_year, type priority) of the first job window that needs the file
+        """
+        key = (case, datatype)
+        cache = self._cache.setdefault(key, dict())
+        rank = cache.get(year)
+        if rank is None:
+            rank = UNNEEDED
+            for end, type_priority, start in self._windows.get(key, list()):
+                # one-off files like restarts and namelists are needed by any window
+                if not year or start <= year <= end:
+                    rank = (end, type_priority)
+                    break
+            cache[year] = rank
+        return rank
+
+    def next_batch(self, files):
+        """
+        Return the batch_size files that are needed soonest
+
+        Parameters:
+            files (list): the missing files, each with case, datatype, year and month attributes
+        """
+        def key(file):
+            return self.priority(file.case, file.datatype, file.year) + (file.year, file.month)
+        return heapq.nsmallest(self.batch_size, files, key=key)
@@ -1,11 +1,23 @@
 import sys
 import os
+import math
 import logging
+import threading
 import paramiko
 
-from getpass import getpass
+from time import time
+from functools import partial
+from Queue import Queue, Empty
+from getpass import getpass, getuser
 from lib.util import print_debug
 
+# downloads are written here until they are complete
+PART_SUFFIX = '.part'
+# large files fetched in ranges are preallocated, so they get their own suffix
+# and are never mistaken for a partial download to resume
+RANGE_SUFFIX = '.ranges'
+TRANSFER_BLOCK_SIZE = 1024 * 1024
+
 def get_ls(client, remote_path):
     """
     Return a list of the contents of the remote_path from the 
@@ -44,19 +56,67 @@ def get_ll(client, remote_path):
         })
     return ll
 
-def transfer(sftp_client, file):
+def listdir_sizes(sftp_client, remote_path):
+    """
+    Return a dict of file name -> size for a remote directory, from a single sftp listing
+
+    Parameters:
+        sftp_client (paramiko.SFTPClient): the client to list with
+        remote_path (str): the directory to list
+    """
+    return dict(
+        (x.filename, x.st_size or 0)
+        for x in sftp_client.listdir_attr(remote_path))
+
+def transfer(sftp_client, file, large_file_size=0, range_workers=4, open_channel=None):
     """
-    Use a paramiko ssh client to transfer the files in 
-    file_list one at a time
+    Use a paramiko sftp client to download a single file
+
+    The file is written to local_path.part and only renamed into place once its
+    size matches the remote file, so a partly written file is never seen as local.
+    If a .part file is left from an interrupted transfer the download picks up
+    from where it stopped. Files of at least large_file_size bytes are instead
+    fetched as range_workers byte ranges at once
 
     Parameters:
         sftp_client (paramiko.SFTPClient): the client to use for transport
         file (dict): a dict with keys remote_path, and local_path
+        large_file_size (int): the size in bytes to fetch files in ranges from, 0 to never use ranges
+        range_workers (int): the number of ranges to fetch at once
+        open_channel (function): returns a new sftp client for a range to be read over,
+            defaults to a new channel on the same connection as sftp_client
     """
 
     _, f_name = os.path.split(file['remote_path'])
+    part_path = file['local_path'] + PART_SUFFIX
     try:
-        sftp_client.get(file['remote_path'], file['local_path'])
+        remote_size = sftp_client.stat(file['remote_path']).st_size
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        if offset > remote_size:
+            # the remote file was replaced, start over
+            offset = 0
+        if not offset and large_file_size and remote_size >= large_file_size and range_workers > 1:
+            part_path = file['local_path'] + RANGE_SUFFIX
+            try:
+                if open_channel is None:
+                    transport = sftp_client.get_channel().get_transport()
+                    open_channel = lambda: paramiko.SFTPClient.from_transport(transport)
+                fetch_ranges(open_channel, file['remote_path'], part_path, remote_size, range_workers)
+            except Exception:
+                # the preallocated file cant be resumed from
+                if os.path.exists(part_path):
+                    os.remove(part_path)
+                raise
+        else:
+            if offset:
+                logging.info('resuming %s from byte %d of %d', f_name, offset, remote_size)
+            fetch(sftp_client, file['remote_path'], part_path, offset, remote_size)
+        local_size = os.path.getsize(part_path)
+        if local_size != remote_size:
+            msg = '{} is {} bytes but {} were transferred'.format(
+                f_name, remote_size, local_size)
+            raise IOError(msg)
+        os.rename(part_path, file['local_path'])
     except Exception as e:
         print_debug(e)
         msg = '{} transfer failed'.format(f_name)
@@ -67,32 +127,336 @@ def transfer(sftp_client, file):
         logging.info(msg)
     return True
 
-def get_ssh_client(hostname):    
+def fetch(sftp_client, remote_path, local_path, offset, length):
     """
-    Get user credentials and use them to log in to the remote host
+    Copy the remote file from offset to length into local_path, appending to what's already there
 
     Parameters:
-        hostname (str): the hostname of the remote host
+        sftp_client (paramiko.SFTPClient): the client to read with
+        remote_path (str): the file to read
+        local_path (str): the file to write
+        offset (int): the first byte to copy, everything before it is already in local_path
+        length (int): the size of the remote file
+    """
+    remote_file = sftp_client.open(remote_path, 'rb')
+    try:
+        remote_file.seek(offset)
+        remote_file.prefetch(length)
+        with open(local_path, 'ab' if offset else 'wb') as local_file:
+            while True:
+                block = remote_file.read(TRANSFER_BLOCK_SIZE)
+                if not block:
+                    break
+                local_file.write(block)
+    finally:
+        remote_file.close()
+
+def fetch_ranges(open_channel, remote_path, local_path, size, workers):
+    """
+    Copy a large remote file by reading byte ranges over several sftp channels at once,
+    each range is written in place into a preallocated local file
+
+    Every range gets its own channel, a paramiko SFTPClient can't be read from
+    by more than one thread at a time
+
+    Parameters:
+        open_channel (function): returns a new sftp client to read a range with
+        remote_path (str): the file to read
+        local_path (str): the file to write
+        size (int): the size of the remote file
+        workers (int): the number of ranges to read at once
+    """
+    with open(local_path, 'wb') as local_file:
+        local_file.truncate(size)
+    range_size = int(math.ceil(size / float(workers)))
+    errors = list()
+
+    def read_range(start, end):
+        sftp_client = None
+        remote_file = None
+        fd = None
+        try:
+            sftp_client = open_channel()
+            remote_file = sftp_client.open(remote_path, 'rb')
+            fd = os.open(local_path, os.O_WRONLY)
+            remote_file.seek(start)
+            remote_file.prefetch(end)
+            os.lseek(fd, start, os.SEEK_SET)
+            position = start
+            while position < end:
+                block = remote_file.read(min(TRANSFER_BLOCK_SIZE, end - position))
+                if not block:
+                    raise IOError('{} ended at byte {} of {}'.format(remote_path, position, size))
+                while block:
+                    written = os.write(fd, block)
+                    position += written
+                    block = block[written:]
+        except Exception as e:
+            errors.append(e)
+        finally:
+            if fd is not None:
+                os.close(fd)
+            if remote_file is not None:
+                remote_file.close()
+            if sftp_client is not None:
+                sftp_client.close()
+
+    threads = [
+        threading.Thread(
+            target=read_range,
+            name='sftp_range_{}'.format(idx),
+            args=(start, min(start + range_size, size)))
+        for idx, start in enumerate(range(0, size, range_size))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+
+def open_sftp(client, window_size=0, max_packet_size=0):
+    """
+    Open an sftp channel on a connected ssh client
+
+    Parameters:
+        client (paramiko.SSHClient): a connected ssh client
+        window_size (int): the ssh window size for the channel, 0 for the paramiko default
+        max_packet_size (int): the largest ssh packet for the channel, 0 for the paramiko default
+    """
+    if not window_size and not max_packet_size:
+        return client.open_sftp()
+    return paramiko.SFTPClient.from_transport(
+        client.get_transport(),
+        window_size=window_size or None,
+        max_packet_size=max_packet_size or None)
+
+def transfer_files(client, file_list, workers=4, event=None, on_file_done=None,
+                   large_file_size=0, range_workers=4, window_size=0, max_packet_size=0):
+    """
+    Download files over several sftp channels sharing one ssh connection,
+    each channel takes the next file from a shared queue as soon as it's free
+
+    Parameters:
+        client (paramiko.SSHClient or function): a connected ssh client, or a function
+            returning a live one, which is called again to reconnect if the connection drops
+        file_list (list): dicts with keys remote_path and local_path, in the order to send them
+        workers (int): the number of sftp channels to transfer over at once
+        event (threading.Event): an event to listen for to stop after the current files
+        on_file_done (function): called with the file dict as each transfer completes
+        large_file_size (int): the size in bytes to fetch files in ranges from, 0 to never use ranges
+        range_workers (int): the number of ranges of a large file to fetch at once
+        window_size (int): the ssh window size for each channel, 0 for the paramiko default
+        max_packet_size (int): the largest ssh packet for each channel, 0 for the paramiko default
     Returns:
-        Paramiko.Transport client if login successful,
-        None otherwise
+        a tuple of (files transferred, bytes transferred, seconds taken)
     """
-    username = raw_input('Username for {}: '.format(hostname))
+    queue = Queue()
+    for file in file_list:
+        queue.put(file)
+    totals = {'files': 0, 'bytes': 0}
+    lock = threading.Lock()
+    # files that have already been retried after a dropped connection
+    retried = set()
 
-    client = paramiko.SSHClient()
-    client.load_system_host_keys()
-    client.set_missing_host_key_policy(paramiko.WarningPolicy)
-    connected = False
-    for _ in range(3):
+    def channel():
         try:
-            password = getpass(prompt='Password for {}: '.format(hostname))
-            client.connect(hostname, port=22, username=username, password=password)
+            ssh_client = client() if callable(client) else client
+            return ssh_client, open_sftp(ssh_client, window_size, max_packet_size)
         except Exception as e:
-            print 'Invalid password'
-        else:
-            connected = True
-            break
-    if not connected:
+            logging.error('Unable to open an sftp channel')
+            print_debug(e)
+            return None, None
+
+    def work():
+        ssh_client, sftp_client = channel()
+        if sftp_client is None:
+            return
+        try:
+            while not (event and event.is_set()):
+                try:
+                    file = queue.get_nowait()
+                except Empty:
+                    return
+                # the ranges of a large file each get their own channel on this connection
+                open_channel = partial(open_sftp, ssh_client, window_size, max_packet_size)
+                if not transfer(sftp_client, file, large_file_size, range_workers, open_channel):
+                    sock = sftp_client.get_channel()
+                    if callable(client) and sock is not None and sock.closed:
+                        # the connection dropped, reconnect and try the file once more
+                        sftp_client.close()
+                        ssh_client, sftp_client = channel()
+                        if sftp_client is None:
+                            return
+                        with lock:
+                            retry = file['local_path'] not in retried
+                            retried.add(file['local_path'])
+                        if retry:
+                            queue.put(file)
+                    continue
+                try:
+                    size = os.path.getsize(file['local_path'])
+                except OSError:
+                    size = 0
+                with lock:
+                    totals['files'] += 1
+                    totals['bytes'] += size
+                if on_file_done:
+                    on_file_done(file)
+        finally:
+            if sftp_client is not None:
+                sftp_client.close()
+
+    start = time()
+    threads = [
+        threading.Thread(target=work, name='sftp_channel_{}'.format(idx))
+        for idx in range(max(1, min(workers, len(file_list))))
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return totals['files'], totals['bytes'], time() - start
+
+def get_ssh_client(hostname, compress=False):
+    """
+    Log in to the remote host, with a key or the ssh agent if possible
+    and a username and password otherwise
+
+    Parameters:
+        hostname (str): the hostname of the remote host
+        compress (bool): compress the ssh traffic
+    Returns:
+        a connected paramiko.SSHClient, exits if the login fails
+    """
+    client = SSHSessionPool().client(hostname, compress=compress)
+    if client is None:
         print 'Unable to open ssh connection for {}'.format(hostname)
         sys.exit(1)
     return client
+
+
+class SSHSessionPool(object):
+    """
+    Keeps one authenticated ssh connection per host, shared by the directory
+    listings, remote verification and every sftp channel sent to that host
+
+    Keys and the ssh agent are tried first. The user is only asked for a password
+    if those are refused, and it is kept so a dropped connection can be reopened
+    without asking again. Each connection is checked before it's handed out and
+    reconnected if it has gone away
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        # hostname -> paramiko.SSHClient
+        self._clients = dict()
+        # hostname -> (username, password) the user gave
+        self._credentials = dict()
+
+    def client(self, hostname, username=None, key_filename=None, compress=False):
+        """
+        Return a live ssh client for the host, connecting or reconnecting as needed
+
+        Parameters:
+            hostname (str): the host to connect to
+            username (str): the remote username, defaults to the local one for keys and the agent
+            key_filename (str): a private key to try before the default keys and the agent
+            compress (bool): compress the ssh traffic
+        Returns:
+            a connected paramiko.SSHClient, or None if the login failed
+        """
+        with self._lock:
+            client = self._clients.get(hostname)
+            if client is not None and is_alive(client):
+                return client
+            if client is not None:
+                logging.info('ssh connection to %s was lost, reconnecting', hostname)
+                client.close()
+            client = self._connect(hostname, username, key_filename, compress)
+            if client is None:
+                self._clients.pop(hostname, None)
+            else:
+                self._clients[hostname] = client
+            return client
+
+    def close(self):
+        """
+        Close every connection in the pool
+        """
+        with self._lock:
+            for client in self._clients.values():
+                client.close()
+            self._clients = dict()
+
+    def _connect(self, hostname, username, key_filename, compress):
+        if hostname not in self._credentials:
+            try:
+                return connect(
+                    hostname,
+                    username=username or getuser(),
+                    key_filename=key_filename,
+                    compress=compress)
+            except paramiko.AuthenticationException:
+                logging.info('key authentication to %s failed, asking for a password', hostname)
+            except Exception as e:
+                print_debug(e)
+                return None
+
+        if hostname in self._credentials:
+            username, password = self._credentials[hostname]
+            try:
+                return connect(hostname, username=username, password=password, compress=compress)
+            except Exception as e:
+                print_debug(e)
+                return None
+
+        if not username:
+            username = raw_input('Username for {}: '.format(hostname))
+        for _ in range(3):
+            password = getpass(prompt='Password for {}: '.format(hostname))
+            try:
+                client = connect(hostname, username=username, password=password, compress=compress)
+            except paramiko.AuthenticationException:
+                print 'Invalid password'
+            except Exception as e:
+                print_debug(e)
+                return None
+            else:
+                self._credentials[hostname] = (username, password)
+                return client
+        return None
+
+
+def connect(hostname, username, password=None, key_filename=None, compress=False):
+    """
+    Open an ssh connection, raises paramiko.AuthenticationException if the login is refused
+    """
+    client = paramiko.SSHClient()
+    client.load_system_host_keys()
+    client.set_missing_host_key_policy(paramiko.WarningPolicy)
+    client.connect(
+        hostname,
+        port=22,
+        username=username,
+        password=password,
+        key_filename=os.path.expanduser(key_filename) if key_filename else None,
+        allow_agent=password is None,
+        look_for_keys=password is None,
+        compress=compress)
+    # keep idle connections from being dropped between batches
+    client.get_transport().set_keepalive(60)
+    return client
+
+
+def is_alive(client):
+    """
+    Return True if the ssh client's connection is still usable
+    """
+    transport = client.get_transport()
+    if transport is None or not transport.is_active():
+        return False
+    try:
+        transport.send_ignore()
+    except Exception:
+        return False
+    return True
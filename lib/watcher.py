@@ -0,0 +1,146 @@
+"""
+A module for watching local data directories for newly arrived files using inotify
+"""
+import os
+import errno
+import select
+import struct
+import ctypes
+import ctypes.util
+import logging
+import threading
+
+from lib.util import format_debug
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def _load_libc():
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        libc.inotify_init1
+        libc.inotify_add_watch
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+_libc = _load_libc()
+
+
+def inotify_available():
+    """
+    Return True if the platform supports inotify
+    """
+    return _libc is not None
+
+
+class FileWatcher(threading.Thread):
+    """
+    A thread that reports files as they are finished being written into, or moved into,
+    a set of watched directories
+
+    Parameters:
+        directories (list): the directories to watch
+        callback (function): called with a list of the full paths of arrived files,
+            or with None if events were lost and the directories need to be re-scanned
+        kill_event (threading.Event): an event to listen for to terminate
+    """
+    def __init__(self, directories, callback, kill_event):
+        super(FileWatcher, self).__init__(name='file_watcher')
+        self.daemon = True
+        self._callback = callback
+        self._kill_event = kill_event
+        self._lock = threading.Lock()
+        # watch descriptor -> directory path
+        self._watches = dict()
+        self._fd = _libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self._fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        self.add_directories(directories)
+
+    @property
+    def directories(self):
+        with self._lock:
+            return set(self._watches.values())
+
+    def add_directories(self, directories):
+        """
+        Start watching the given directories, any that cant be watched are logged and skipped
+
+        Returns the number of new watches added
+        """
+        added = 0
+        watched = self.directories
+        for directory in directories:
+            if directory in watched or not os.path.isdir(directory):
+                continue
+            wd = _libc.inotify_add_watch(
+                self._fd,
+                directory.encode('utf-8'),
+                IN_CLOSE_WRITE | IN_MOVED_TO)
+            if wd < 0:
+                err = ctypes.get_errno()
+                msg = 'Unable to watch {}: {}'.format(directory, os.strerror(err))
+                logging.warning(msg)
+                if err == errno.ENOSPC:
+                    # out of watches, everything else has to be polled
+                    break
+                continue
+            with self._lock:
+                self._watches[wd] = directory
+            added += 1
+        return added
+
+    def _read_events(self):
+        try:
+            buf = os.read(self._fd, 65536)
+        except OSError as e:
+            if e.errno == errno.EAGAIN:
+                return list(), False
+            raise
+        arrived = list()
+        overflow = False
+        offset = 0
+        while offset + EVENT_HEADER.size <= len(buf):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(buf, offset)
+            offset += EVENT_HEADER.size
+            name = buf[offset: offset + length].rstrip(b'\0')
+            offset += length
+            if mask & IN_Q_OVERFLOW:
+                overflow = True
+                continue
+            with self._lock:
+                if mask & IN_IGNORED:
+                    self._watches.pop(wd, None)
+                    continue
+                directory = self._watches.get(wd)
+            if directory and name:
+                arrived.append(os.path.join(directory, name.decode('utf-8')))
+        return arrived, overflow
+
+    def run(self):
+        try:
+            while not self._kill_event.is_set():
+                ready, _, _ = select.select([self._fd], [], [], 1.0)
+                if not ready:
+                    continue
+                arrived, overflow = self._read_events()
+                if overflow:
+                    logging.warning('inotify queue overflowed, rescanning watched directories')
+                    self._callback(None)
+                if arrived:
+                    self._callback(arrived)
+        except Exception as e:
+            logging.error('File watcher stopped')
+            logging.error(format_debug(e))
+        finally:
+            os.close(self._fd)
+            with self._lock:
+                self._watches = dict()
@@ -0,0 +1,148 @@
+"""
+A module for serializing writes to the file catalog through a single thread
+"""
+import logging
+import threading
+
+from Queue import Queue, Empty
+
+from lib.util import format_debug
+
+
+class _Call(object):
+    """
+    A queued function call, and the result or exception it produced
+    """
+    def __init__(self, func, args):
+        self.func = func
+        self.args = args
+        self.result = None
+        self.error = None
+        self.done = threading.Event()
+
+
+class CatalogWriter(threading.Thread):
+    """
+    A thread that owns every write to the catalog database
+
+    Status updates from transfer threads are queued without blocking and applied in
+    batches, all the updates waiting in the queue are merged and applied with a single
+    call to apply_status per status. Other writes are run in order with call(), which
+    blocks until the write is done so the caller can rely on it.
+
+    Parameters:
+        apply_status (function): called with (ids, status) to apply a batch of status updates
+        kill_event (threading.Event): an event to listen for to terminate, any
+            queued work is finished first
+    """
+    def __init__(self, apply_status, kill_event):
+        super(CatalogWriter, self).__init__(name='catalog_writer')
+        self.daemon = True
+        self._apply_status = apply_status
+        self._kill_event = kill_event
+        self._queue = Queue()
+
+    def set_status(self, ids, status):
+        """
+        Queue a status update for the given DataFile ids, returns immediately
+        """
+        ids = list(ids)
+        if not ids:
+            return
+        if not self.is_alive():
+            self._apply_status(ids, status)
+            return
+        self._queue.put(('status', ids, status))
+
+    def call(self, func, *args):
+        """
+        Run func(*args) on the writer thread and return its result
+
+        If called from the writer thread itself, or once the writer has stopped,
+        the function is run directly
+        """
+        if threading.current_thread() is self or not self.is_alive():
+            return func(*args)
+        item = _Call(func, args)
+        self._queue.put(('call', item, None))
+        while not item.done.wait(1.0):
+            if not self.is_alive():
+                return func(*args)
+        if item.error is not None:
+            raise item.error
+        return item.result
+
+    def flush(self):
+        """
+        Block until everything queued so far has been written
+        """
+        self.call(lambda: None)
+
+    def stop(self):
+        """
+        Write everything queued so far and wait for the thread to exit, anything
+        queued after this is written directly by the caller
+        """
+        if self.is_alive() and threading.current_thread() is not self:
+            self._queue.put(('stop', None, None))
+            self.join()
+        # anything that raced the thread exiting
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                return
+            self._drain(item)
+
+    def _apply_pending(self, pending):
+        # id -> status keeps only the last update for each file
+        by_status = dict()
+        for _id, status in pending.items():
+            by_status.setdefault(status, list()).append(_id)
+        for status, ids in by_status.items():
+            try:
+                self._apply_status(ids, status)
+            except Exception as e:
+                logging.error('Unable to write %d status updates', len(ids))
+                logging.error(format_debug(e))
+        pending.clear()
+
+    def _drain(self, first):
+        """
+        Apply first and everything queued behind it, returns True if a stop was queued
+        """
+        pending = dict()
+        stop = False
+        item = first
+        while item is not None:
+            kind, payload, status = item
+            if kind == 'stop':
+                stop = True
+            elif kind == 'status':
+                for _id in payload:
+                    pending[_id] = status
+            else:
+                # keep writes in the order they were made
+                self._apply_pending(pending)
+                try:
+                    payload.result = payload.func(*payload.args)
+                except Exception as e:
+                    payload.error = e
+                payload.done.set()
+            try:
+                item = self._queue.get_nowait()
+            except Empty:
+                item = None
+        self._apply_pending(pending)
+        return stop
+
+    def run(self):
+        while True:
+            try:
+                item = self._queue.get(timeout=1.0)
+            except Empty:
+                if self._kill_event.is_set():
+                    return
+                continue
+            if self._drain(item):
+                return
@@ -9,7 +9,6 @@ import threading
 import logging
 
 from time import sleep
-from globus_cli.services.transfer import get_client
 
 from lib.events import EventList
 from lib.initialize import initialize
@@ -47,13 +46,13 @@ def main(test=False, **kwargs):
     # An event to kill the threads on terminal exception
     thread_kill_event = threading.Event()
 
+    # An event the file watcher sets to wake the main loop when new data arrives
+    wake_event = threading.Event()
+
     # A flag to tell if we have all the data locally
     all_data = False
     all_data_remote = False
 
-    # get a globus client
-    client = get_client()
-
     # Read in parameters from config
     if test:
         print '=========================================='
@@ -88,6 +87,9 @@ def main(test=False, **kwargs):
     filemanager.update_local_status()
     all_data_local = filemanager.all_data_local()
     if not all_data_local:
+        if config['global'].get('watch_files') in ['True', 'true', '1', 1, True]:
+            filemanager.start_watcher(wake_event)
+        filemanager.start_checksum_verifier()
         filemanager.transfer_needed(
             event_list=event_list,
             event=thread_kill_event)
@@ -111,13 +113,24 @@ def main(test=False, **kwargs):
                 if filemanager.update_local_status():
                     msg = filemanager.report_files_local()
                     print_line(msg, event_list)
-                    filemanager.write_database()
+                    msg = filemanager.report_transfer_progress()
+                    if msg:
+                        print_line(msg, event_list)
                 all_data_local = filemanager.all_data_local()
+            filemanager.write_database()
             if not all_data_local:
                 if debug: print_line(' -- Additional data needed --', event_list)
                 filemanager.transfer_needed(
                     event_list,
                     thread_kill_event)
+                msg = filemanager.report_failed_transfers()
+                if msg:
+                    # the jobs that need these files would wait for them forever
+                    print_line(msg, event_list)
+                    logging.error(msg)
+                    runmanager.write_job_sets(state_path)
+                    filemanager.terminate_transfers()
+                    return -1
 
             if debug: print_line(' -- checking data -- ', event_list)
             runmanager.check_data_ready()
@@ -148,21 +161,30 @@ def main(test=False, **kwargs):
                         filemanager.transfer_needed(
                             event_list=event_list,
                             event=thread_kill_event)
+                        msg = filemanager.report_failed_transfers()
+                        if msg:
+                            print_line(msg, event_list)
+                            logging.error(msg)
+                            filemanager.terminate_transfers()
+                            return -1
                     sleep(10)
-                filemanager.write_database()
+                filemanager.write_database(force=True)
                 finalize(
                     config=config,
                     event_list=event_list,
                     status=status,
                     runmanager=runmanager)
+                filemanager.terminate_transfers()
                 # SUCCESS EXIT
                 return 0
             if debug: print_line(' -- sleeping', event_list)
-            sleep(loop_delay)
+            wake_event.wait(loop_delay)
+            wake_event.clear()
     except KeyboardInterrupt as e:
         print_message('\n----- KEYBOARD INTERRUPT -----')
         runmanager.write_job_sets(state_path)
         filemanager.terminate_transfers()
+        filemanager.write_database(force=True)
         print_message('-----  cleanup complete  -----', 'ok')
     except Exception as e:
         print_message('----- AN UNEXPECTED EXCEPTION OCCURED -----')
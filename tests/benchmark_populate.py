@@ -0,0 +1,135 @@
+"""
+Benchmark FileManager.populate_file_list against the per-file rendering
+and 50 row inserts it used to do
+
+usage: python tests/benchmark_populate.py [num_cases] [num_years]
+"""
+import os, sys
+import shutil
+import tempfile
+
+from time import time
+from configobj import ConfigObj
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.filemanager import FileManager, FileStatus
+from lib.models import DataFile
+from lib.events import EventList
+
+
+def make_config(project_path, num_cases, num_years):
+    config = {
+        'global': {
+            'project_path': project_path
+        },
+        'simulations': {
+            'start_year': 1,
+            'end_year': num_years
+        },
+        'data_types': {}
+    }
+    for idx in range(num_cases):
+        case = '20180129.DECKv1b_piControl_{}.ne30_oEC.edison'.format(idx)
+        config['simulations'][case] = {
+            'transfer_type': 'globus',
+            'remote_uuid': '9d6d994a-6d04-11e5-ba46-22000b92c6ec',
+            'remote_path': '/global/cscratch1/sd/golaz/ACME_simulations/' + case,
+            'short_name': 'case_{}'.format(idx),
+            'data_types': 'all'
+        }
+    for name, component, fmt in [('atm', 'atm', 'CASEID.cam.h0.YEAR-MONTH.nc'),
+                                 ('lnd', 'lnd', 'CASEID.clm2.h0.YEAR-MONTH.nc'),
+                                 ('ocn', 'ocn', 'mpaso.hist.am.timeSeriesStatsMonthly.YEAR-MONTH-01.nc'),
+                                 ('cice', 'ice', 'mpascice.hist.am.timeSeriesStatsMonthly.YEAR-MONTH-01.nc')]:
+        config['data_types'][name] = {
+            'remote_path': 'REMOTE_PATH/archive/{}/hist'.format(component),
+            'file_format': fmt,
+            'local_path': 'PROJECT_PATH/input/CASEID/{}'.format(component),
+            'monthly': 'True'
+        }
+    config['data_types']['ocn_restart'] = {
+        'remote_path': 'REMOTE_PATH/archive/rest/REST_YR-01-01-00000/',
+        'file_format': 'mpaso.rst.REST_YR-01-01_00000.nc',
+        'local_path': 'PROJECT_PATH/input/CASEID/rest',
+        'monthly': 'False'
+    }
+    return ConfigObj(config)
+
+
+def legacy_populate(filemanager, config):
+    """
+    The previous populate_file_list, rendering three strings per file and inserting 50 rows at a time
+    """
+    start_year = int(config['simulations']['start_year'])
+    end_year = int(config['simulations']['end_year'])
+    with DataFile._meta.database.atomic():
+        for case in config['simulations']:
+            if case in ['start_year', 'end_year', 'comparisons']:
+                continue
+            for _type in config['data_types']:
+                local_path = filemanager.render_file_string(_type, 'local_path', case)
+                new_files = list()
+                if config['data_types'][_type]['monthly'] == 'True':
+                    dates = [(y, m) for y in range(start_year, end_year + 1) for m in range(1, 13)]
+                else:
+                    dates = [(None, None)]
+                for year, month in dates:
+                    filename = filemanager.render_file_string(_type, 'file_format', case, year=year, month=month)
+                    r_path = filemanager.render_file_string(_type, 'remote_path', case, year=year, month=month)
+                    new_files.append({
+                        'name': filename,
+                        'remote_path': os.path.join(r_path, filename),
+                        'local_path': os.path.join(local_path, filename),
+                        'local_status': FileStatus.NOT_PRESENT.value,
+                        'case': case,
+                        'remote_status': FileStatus.NOT_PRESENT.value,
+                        'year': year or 0,
+                        'month': month or 0,
+                        'end_year': year or 0,
+                        'datatype': _type,
+                        'local_size': 0,
+                        'transfer_type': config['simulations'][case]['transfer_type'],
+                        'remote_uuid': config['simulations'][case].get('remote_uuid', ''),
+                        'remote_hostname': config['simulations'][case].get('remote_hostname', '')
+                    })
+                step = 50
+                for idx in range(0, len(new_files), step):
+                    DataFile.insert_many(new_files[idx: idx + step]).execute()
+
+
+def run(num_cases, num_years):
+    project_path = tempfile.mkdtemp()
+    try:
+        config = make_config(project_path, num_cases, num_years)
+        db = os.path.join(project_path, 'processflow.db')
+
+        filemanager = FileManager(database=db, event_list=EventList(), config=config)
+        start = time()
+        legacy_populate(filemanager, config)
+        legacy = time() - start
+        legacy_rows = sorted(DataFile.select(DataFile.local_path, DataFile.remote_path).tuples())
+
+        filemanager = FileManager(database=db, event_list=EventList(), config=config)
+        start = time()
+        filemanager.populate_file_list()
+        current = time() - start
+        current_rows = sorted(DataFile.select(DataFile.local_path, DataFile.remote_path).tuples())
+
+        if legacy_rows != current_rows:
+            print 'ERROR: rendered rows differ'
+            return 1
+        print '{} cases x {} years, {} rows'.format(num_cases, num_years, len(current_rows))
+        print 'per-file render + 50 row inserts: {:.2f}s'.format(legacy)
+        print 'compiled templates + bulk insert: {:.2f}s'.format(current)
+        print 'speedup: {:.1f}x'.format(legacy / current)
+    finally:
+        shutil.rmtree(project_path)
+    return 0
+
+
+if __name__ == '__main__':
+    num_cases = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    num_years = int(sys.argv[2]) if len(sys.argv) > 2 else 1000
+    sys.exit(run(num_cases, num_years))
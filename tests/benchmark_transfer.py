@@ -0,0 +1,86 @@
+"""
+Benchmark the rsync transfer backend against the paramiko sftp one, copying
+files through an ssh server back to this machine
+
+The host has to accept key or agent logins for the current user, localhost
+with a running sshd works
+
+usage: python tests/benchmark_transfer.py [hostname] [num_files] [file_size_mb] [workers]
+"""
+import os, sys
+import shutil
+import tempfile
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.ssh_interface import SSHSessionPool
+from lib.ssh_interface import transfer_files as sftp_transfer_files
+from lib.rsync_interface import transfer_files as rsync_transfer_files
+from lib.progress import format_size, format_duration
+
+
+def make_files(directory, num_files, file_size):
+    block = os.urandom(1024 * 1024)
+    for idx in range(num_files):
+        with open(os.path.join(directory, 'file_{}.nc'.format(idx)), 'wb') as fp:
+            for _ in range(file_size):
+                fp.write(block)
+
+
+def report(label, count, size, seconds):
+    print '{:<28} {:>4} files {:>10} in {:>8}, {}/s'.format(
+        label, count, format_size(size), format_duration(seconds),
+        format_size(size / seconds if seconds else 0))
+
+
+def run(hostname, num_files, file_size, workers):
+    source = tempfile.mkdtemp()
+    try:
+        make_files(source, num_files, file_size)
+        names = sorted(os.listdir(source))
+
+        def file_list(destination):
+            return [{
+                'remote_path': os.path.join(source, name),
+                'local_path': os.path.join(destination, name)
+            } for name in names]
+
+        pool = SSHSessionPool()
+        if pool.client(hostname) is None:
+            print 'ERROR: unable to log in to {}'.format(hostname)
+            return 1
+        for label, destination in [('sftp', tempfile.mkdtemp()), ('rsync', tempfile.mkdtemp())]:
+            try:
+                if label == 'sftp':
+                    result = sftp_transfer_files(
+                        client=lambda: pool.client(hostname),
+                        file_list=file_list(destination),
+                        workers=workers)
+                    report('paramiko sftp', *result)
+                else:
+                    result = rsync_transfer_files(
+                        file_list=file_list(destination),
+                        hostname=hostname,
+                        workers=workers)
+                    report('rsync', *result)
+                    # a second pass only has to compare the files
+                    result = rsync_transfer_files(
+                        file_list=file_list(destination),
+                        hostname=hostname,
+                        workers=workers)
+                    report('rsync, already up to date', *result)
+            finally:
+                shutil.rmtree(destination)
+        pool.close()
+    finally:
+        shutil.rmtree(source)
+    return 0
+
+
+if __name__ == '__main__':
+    hostname = sys.argv[1] if len(sys.argv) > 1 else 'localhost'
+    num_files = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    file_size = int(sys.argv[3]) if len(sys.argv) > 3 else 50
+    workers = int(sys.argv[4]) if len(sys.argv) > 4 else 4
+    sys.exit(run(hostname, num_files, file_size, workers))
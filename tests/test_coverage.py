@@ -0,0 +1,59 @@
+import os, sys
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.coverage import CoverageIndex
+from lib.util import print_message
+
+
+class TestCoverage(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestCoverage, self).__init__(*args, **kwargs)
+        self.case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+
+    def test_coverage_year_ranges(self):
+        """
+        test that ranges are only ready once every month in them is present
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        coverage = CoverageIndex()
+        rows = list()
+        for year in range(1, 11):
+            for month in range(1, 13):
+                rows.append((year * 100 + month, self.case, 'atm', year, year <= 5))
+        coverage.add(rows)
+        self.assertEqual(len(coverage), 120)
+
+        self.assertTrue(coverage.is_ready(self.case, 'atm', 1, 5))
+        self.assertFalse(coverage.is_ready(self.case, 'atm', 1, 6))
+        self.assertFalse(coverage.is_ready(self.case, 'atm'))
+
+        coverage.set_present([600 + x for x in range(1, 12)], True)
+        self.assertFalse(coverage.is_ready(self.case, 'atm', 6, 6))
+        coverage.set_present([612], True)
+        self.assertTrue(coverage.is_ready(self.case, 'atm', 1, 6))
+        self.assertFalse(coverage.is_ready(self.case, 'atm', 6, 7))
+
+        coverage.set_present([301], False)
+        self.assertFalse(coverage.is_ready(self.case, 'atm', 1, 5))
+        self.assertTrue(coverage.is_ready(self.case, 'atm', 4, 6))
+
+    def test_coverage_unknown_and_one_off_types(self):
+        """
+        test data types without years, and data types that arent tracked at all
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        coverage = CoverageIndex()
+        coverage.add([(1, self.case, 'ocn_streams', 0, False)])
+        self.assertFalse(coverage.is_ready(self.case, 'ocn_streams'))
+        coverage.set_present([1], True)
+        self.assertTrue(coverage.is_ready(self.case, 'ocn_streams'))
+        self.assertTrue(coverage.is_ready(self.case, 'climo_regrid', 1, 2))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,19 +2,135 @@ import os, sys
 import unittest
 import shutil
 import inspect
+import tempfile
+import json
+import threading
+import time
+import logging
 
 from configobj import ConfigObj
 
 if sys.path[0] != '.':
     sys.path.insert(0, os.path.abspath('.'))
 
-from lib.filemanager import FileManager
+from lib.filemanager import FileManager, FileStatus
+from lib.progress import TransferProgress, format_size
+from lib.integrity import file_checksum
 from lib.models import DataFile
 from lib.events import EventList
 from lib.util import print_message
 from globus_cli.services.transfer import get_client
 
 
+def make_local_config(project_path, start_year=1, end_year=2, data_types='atm'):
+    """
+    Build a minimal config for a single case with local data under project_path
+    """
+    case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+    return ConfigObj({
+        'global': {
+            'project_path': project_path,
+            'verify': False
+        },
+        'simulations': {
+            'start_year': start_year,
+            'end_year': end_year,
+            case: {
+                'transfer_type': 'local',
+                'local_path': os.path.join(project_path, 'input', case),
+                'short_name': 'piControl',
+                'native_grid_name': 'ne30',
+                'native_mpas_grid_name': 'oEC60to30v3',
+                'data_types': data_types
+            }
+        },
+        'data_types': {
+            'atm': {
+                'remote_path': 'REMOTE_PATH/archive/atm/hist',
+                'file_format': 'CASEID.cam.h0.YEAR-MONTH.nc',
+                'local_path': 'LOCAL_PATH/atm',
+                'monthly': 'True'
+            },
+            'ocn_streams': {
+                'remote_path': 'REMOTE_PATH/run',
+                'file_format': 'streams.ocean',
+                'local_path': 'LOCAL_PATH/mpas',
+                'monthly': 'False'
+            }
+        }
+    })
+
+
+def remove_database(db):
+    """
+    Remove a test catalog along with the sidecar files sqlite keeps next to it in WAL mode
+    """
+    for path in [db, db + '-wal', db + '-shm']:
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def touch_files(directory, names):
+    if not os.path.exists(directory):
+        os.makedirs(directory)
+    for name in names:
+        with open(os.path.join(directory, name), 'w') as fp:
+            fp.write(name)
+
+
+def wait_for(condition, timeout=10):
+    """
+    Poll condition until it returns True, or return False after timeout seconds
+    """
+    deadline = time.time() + timeout
+    while not condition():
+        if time.time() > deadline:
+            return False
+        time.sleep(0.1)
+    return True
+
+
+def count_status(status):
+    return DataFile.select().where(DataFile.local_status == status.value).count()
+
+
+class FileAttributes(object):
+    def __init__(self, filename, st_size):
+        self.filename = filename
+        self.st_size = st_size
+
+
+class FakeSSHClient(object):
+    """
+    Stands in for an ssh client, its sftp listings come from a dict of directory -> {name: size}
+    """
+    def __init__(self, remote):
+        self.remote = remote
+        self.listings = list()
+
+    def open_sftp(self):
+        return self
+
+    def listdir_attr(self, path):
+        self.listings.append(path)
+        return [FileAttributes(name, size) for name, size in self.remote.get(path, dict()).items()]
+
+    def close(self):
+        pass
+
+
+# an rsync that copies the first COUNT names in its --files-from list, printing each one
+RSYNC_SOME_FILES = '''for arg; do
+    case $arg in --files-from=*) files_from=${arg#--files-from=};; esac
+    destination=$arg
+done
+head -n COUNT $files_from | while read name; do
+    printf %s "$name" > "$destination$name"
+    echo "$name"
+done
+'''
+
+
 class TestFileManager(unittest.TestCase):
 
     def __init__(self, *args, **kwargs):
@@ -26,6 +142,76 @@ class TestFileManager(unittest.TestCase):
         self.local_endpoint = 'a871c6de-2acd-11e7-bc7c-22000b9a448b'
         self.experiment = '20180215.DECKv1b_1pctCO2.ne30_oEC.edison'
 
+    def setUp(self):
+        self.project_path = tempfile.mkdtemp()
+        self.db = os.path.join(self.project_path, 'processflow.db')
+        self.case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+        self.atm_path = os.path.join(self.project_path, 'input', self.case, 'atm')
+        self.filemanager = None
+
+    def tearDown(self):
+        if self.filemanager is not None:
+            self.filemanager.terminate_transfers()
+        shutil.rmtree(self.project_path)
+
+    def start_filemanager(self, config, persistent=False, data_required=None):
+        """
+        Build a FileManager on the test catalog and populate its file list,
+        the previous one is stopped first and the last one in tearDown
+        """
+        if self.filemanager is not None:
+            self.filemanager.terminate_transfers()
+        self.filemanager = FileManager(
+            database=self.db,
+            event_list=EventList(),
+            config=config,
+            persistent=persistent)
+        self.filemanager.populate_file_list(data_required=data_required)
+        return self.filemanager
+
+    def fake_rsync(self, script):
+        """
+        Put an rsync on the PATH that runs script instead, for the rest of the test
+        """
+        bin_dir = tempfile.mkdtemp()
+        path = os.path.join(bin_dir, 'rsync')
+        with open(path, 'w') as fp:
+            fp.write('#!/bin/sh\n' + script)
+        os.chmod(path, 0755)
+        self.addCleanup(shutil.rmtree, bin_dir)
+        self.addCleanup(os.environ.__setitem__, 'PATH', os.environ['PATH'])
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+    def rsync_config(self, **kwargs):
+        """
+        A local config whose case is rsynced from an archive under project_path, one rsync at a time
+        """
+        config = make_local_config(self.project_path, **kwargs)
+        config['global']['rsync_workers'] = 1
+        config['simulations'][self.case]['transfer_type'] = 'rsync'
+        config['simulations'][self.case]['remote_path'] = os.path.join(self.project_path, 'archive')
+        return config
+
+    def sftp_config(self, **kwargs):
+        """
+        A local config whose case is sent over sftp from edison
+        """
+        config = make_local_config(self.project_path, **kwargs)
+        config['simulations'][self.case]['transfer_type'] = 'sftp'
+        config['simulations'][self.case]['remote_hostname'] = 'edison.nersc.gov'
+        config['simulations'][self.case]['remote_path'] = '/remote/{}'.format(self.case)
+        return config
+
+    def remote_listing(self, size):
+        """
+        Return directory -> {name: size} for every file in the catalog, as an sftp listing would see them
+        """
+        remote = dict()
+        for df in DataFile.select():
+            remote_path, _ = os.path.split(df.remote_path)
+            remote.setdefault(remote_path, dict())[df.name] = size
+        return remote
+
     def test_filemanager_setup_valid_from_scratch(self):
         """
         run filemansger setup with no sta
@@ -34,6 +220,7 @@ class TestFileManager(unittest.TestCase):
         print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
         sta = False
         db = '{}.db'.format(inspect.stack()[0][3])
+        self.addCleanup(remove_database, db)
         config_path = 'tests/test_configs/valid_config_from_scratch.cfg'
         config = ConfigObj(config_path)
         experiment = '20170926.FCT2.A_WCYCL1850S.ne30_oECv3.anvil'
@@ -45,7 +232,6 @@ class TestFileManager(unittest.TestCase):
 
         self.assertTrue(isinstance(filemanager, FileManager))
         self.assertTrue(os.path.exists(db))
-        os.remove(db)
 
 
     def test_filemanager_setup_valid_with_inplace_data(self):
@@ -56,6 +242,7 @@ class TestFileManager(unittest.TestCase):
         config_path = 'tests/test_configs/e3sm_diags_complete.cfg'
         config = ConfigObj(config_path)
         db = '{}.db'.format(inspect.stack()[0][3])
+        self.addCleanup(remove_database, db)
 
         filemanager = FileManager(
             database=db,
@@ -67,7 +254,6 @@ class TestFileManager(unittest.TestCase):
         self.assertTrue(isinstance(filemanager, FileManager))
         self.assertTrue(os.path.exists(db))
         self.assertTrue(filemanager.all_data_local())
-        os.remove(db)
     
     def test_filemanager_get_file_paths(self):
         """
@@ -77,6 +263,7 @@ class TestFileManager(unittest.TestCase):
         config_path = 'tests/test_configs/filemanager_partial_data.cfg'
         config = ConfigObj(config_path)
         db = '{}.db'.format(inspect.stack()[0][3])
+        self.addCleanup(remove_database, db)
 
         filemanager = FileManager(
             database=db,
@@ -135,7 +322,468 @@ class TestFileManager(unittest.TestCase):
             case='20180129.DECKv1b_piControl.ne30_oEC.edison')
         self.assertTrue(ready)
 
-        os.remove(db)
+
+    def test_filemanager_persistent_catalog(self):
+        """
+        run the filemanager twice against the same catalog, changing the config in between
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        touch_files(self.atm_path, ['{}.cam.h0.{:04d}-{:02d}.nc'.format(self.case, 1, x) for x in range(1, 13)])
+        config = make_local_config(self.project_path, end_year=2)
+        filemanager = self.start_filemanager(config, persistent=True)
+        mode = DataFile._meta.database.execute_sql('PRAGMA journal_mode').fetchone()[0]
+        self.assertEqual(mode, 'wal')
+        filemanager.update_local_status()
+        self.assertEqual(DataFile.select().count(), 24)
+        self.assertFalse(filemanager.all_data_local())
+
+        # a second run with the same config keeps the rows and their status
+        self.start_filemanager(config, persistent=True)
+        self.assertEqual(count_status(FileStatus.PRESENT), 12)
+
+        # extending the year range re-renders the group, adding a data type adds rows
+        touch_files(self.atm_path, ['{}.cam.h0.{:04d}-{:02d}.nc'.format(self.case, 2, x) for x in range(1, 13)])
+        touch_files(os.path.join(self.project_path, 'input', self.case, 'mpas'), ['streams.ocean'])
+        config = make_local_config(self.project_path, end_year=3, data_types=['atm', 'ocn_streams'])
+        filemanager = self.start_filemanager(config, persistent=True)
+        filemanager.update_local_status()
+        self.assertEqual(DataFile.select().count(), 37)
+        self.assertTrue(filemanager.check_data_ready(
+            data_required=['atm', 'ocn_streams'],
+            case=self.case,
+            start_year=1,
+            end_year=2))
+
+        # removing a data type removes its rows
+        config = make_local_config(self.project_path, end_year=3)
+        self.start_filemanager(config, persistent=True)
+        self.assertEqual(DataFile.select().count(), 36)
+
+    def test_filemanager_multi_year_files(self):
+        """
+        test that climo style files are found by their start and end year
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        filemanager = self.start_filemanager(make_local_config(self.project_path, end_year=2))
+        filemanager.add_files(
+            data_type='climo_regrid',
+            file_list=[{
+                'name': '{}_ANN_{:04d}01_{:04d}12_climo.nc'.format(self.case, start, end),
+                'local_path': os.path.join(self.project_path, 'climo_{}_{}.nc'.format(start, end)),
+                'case': self.case,
+                'year': start,
+                'end_year': end,
+                'local_status': 0
+            } for start, end in [(1, 1), (1, 2), (2, 2)]])
+
+        paths = filemanager.get_file_paths_by_year(
+            datatype='climo_regrid',
+            case=self.case,
+            start_year=1,
+            end_year=2)
+        self.assertEqual(paths, [os.path.join(self.project_path, 'climo_1_2.nc')])
+        self.assertEqual(
+            filemanager.report_files_local(),
+            '3/27 files available locally or 11.11%')
+        self.assertFalse(filemanager.all_data_local())
+
+    def test_filemanager_skips_unchanged_directories(self):
+        """
+        test that directories are only listed again once their mtime changes
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        names = ['{}.cam.h0.{:04d}-{:02d}.nc'.format(self.case, 1, x) for x in range(1, 13)]
+        filemanager = self.start_filemanager(make_local_config(self.project_path, end_year=1))
+        touch_files(self.atm_path, names[:6])
+        os.utime(self.atm_path, (1000, 1000))
+        self.assertTrue(filemanager.update_local_status())
+        self.assertFalse(filemanager.check_data_ready(['atm'], self.case, 1, 1))
+
+        # new files that leave the directory mtime untouched are not seen
+        touch_files(self.atm_path, names[6:])
+        os.utime(self.atm_path, (1000, 1000))
+        self.assertFalse(filemanager.update_local_status())
+
+        os.utime(self.atm_path, (2000, 2000))
+        self.assertTrue(filemanager.update_local_status())
+        self.assertTrue(filemanager.check_data_ready(['atm'], self.case, 1, 1))
+        self.assertTrue(filemanager.all_data_local())
+
+    def test_filemanager_watcher(self):
+        """
+        test that files written into a watched directory are marked present right away
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        names = ['{}.cam.h0.{:04d}-{:02d}.nc'.format(self.case, 1, x) for x in range(1, 13)]
+        filemanager = self.start_filemanager(make_local_config(self.project_path, end_year=1))
+        filemanager.update_local_status()
+        wake_event = threading.Event()
+        if not filemanager.start_watcher(wake_event):
+            return
+        touch_files(self.atm_path, names)
+        self.assertTrue(wait_for(lambda: filemanager.check_data_ready(['atm'], self.case, 1, 1), timeout=5))
+        self.assertTrue(wake_event.wait(5))
+        self.assertTrue(filemanager.update_local_status())
+
+    def test_filemanager_write_database(self):
+        """
+        test that the file list is only rewritten when the catalog changes
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        os.makedirs(os.path.join(self.project_path, 'output'))
+        file_list_path = os.path.join(self.project_path, 'output', 'file_list.txt')
+        names = ['{}.cam.h0.{:04d}-{:02d}.nc'.format(self.case, 1, x) for x in range(1, 13)]
+        config = make_local_config(self.project_path, end_year=1)
+        filemanager = self.start_filemanager(config)
+        filemanager.write_database()
+        with open(file_list_path, 'r') as fp:
+            contents = fp.read()
+        self.assertEqual(contents.count('local_status:  missing'), 12)
+
+        # nothing changed, nothing is written
+        os.remove(file_list_path)
+        filemanager.write_database(force=True)
+        self.assertFalse(os.path.exists(file_list_path))
+
+        # changes are held back by the rate limit unless forced
+        touch_files(self.atm_path, names[:1])
+        self.assertTrue(filemanager.update_local_status())
+        filemanager.write_database()
+        self.assertFalse(os.path.exists(file_list_path))
+        filemanager.write_database(force=True)
+        with open(file_list_path, 'r') as fp:
+            contents = fp.read()
+        self.assertEqual(contents.count('local_status:  present'), 1)
+
+        config['global']['file_list_format'] = 'json'
+        touch_files(self.atm_path, names[1:2])
+        self.assertTrue(filemanager.update_local_status())
+        filemanager.write_database(force=True)
+        with open(os.path.join(self.project_path, 'output', 'file_list.jsonl'), 'r') as fp:
+            rows = [json.loads(line) for line in fp]
+        self.assertEqual(len(rows), 12)
+        self.assertEqual(len([x for x in rows if x['local_status'] == FileStatus.PRESENT.value]), 2)
+
+    def test_filemanager_memory_catalog(self):
+        """
+        test that the in-memory catalog answers queries and checkpoints its changes
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_local_config(self.project_path, end_year=2, data_types='atm, ocn_streams')
+        config['global']['catalog_backend'] = 'memory'
+        config['global']['catalog_checkpoint_interval'] = 3600
+        filemanager = self.start_filemanager(config)
+        self.assertTrue(filemanager.report_files_local().startswith('0/25'))
+        self.assertFalse(filemanager.all_data_local())
+
+        touch_files(self.atm_path, ['{}.cam.h0.0001-{:02d}.nc'.format(self.case, x) for x in range(1, 13)])
+        self.assertTrue(filemanager.update_local_status())
+        self.assertTrue(filemanager.check_data_ready(['atm'], self.case, 1, 1))
+        self.assertFalse(filemanager.check_data_ready(['atm'], self.case, 1, 2))
+        paths = filemanager.get_file_paths_by_year('atm', self.case, 1, 2)
+        self.assertEqual(len(paths), 12)
+        self.assertTrue(filemanager.report_files_local().startswith('12/25'))
+
+        # the database only sees the changes once they're checkpointed
+        self.assertEqual(count_status(FileStatus.PRESENT), 0)
+        filemanager.terminate_transfers()
+        self.assertEqual(count_status(FileStatus.PRESENT), 12)
+
+    def test_filemanager_add_files_upsert(self):
+        """
+        test that registering the same job output twice doesnt grow the catalog
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        filemanager = self.start_filemanager(make_local_config(self.project_path, end_year=2))
+        climo_path = os.path.join(self.project_path, 'output', 'pp', 'climo')
+        new_files = [{
+            'name': 'piControl_{}_000101_000212_climo.nc'.format(season),
+            'local_path': os.path.join(climo_path, 'piControl_{}_000101_000212_climo.nc'.format(season)),
+            'case': self.case,
+            'year': 1,
+            'end_year': 2,
+            'local_status': FileStatus.NOT_PRESENT.value
+        } for season in ['ANN', 'DJF', 'MAM', 'JJA', 'SON']]
+        filemanager.add_files(data_type='climo_regrid', file_list=new_files)
+        self.assertFalse(filemanager.check_data_ready(['climo_regrid'], self.case, 1, 2))
+        ids = [x.id for x in DataFile.select().where(DataFile.datatype == 'climo_regrid')]
+        self.assertEqual(len(ids), 5)
+
+        for item in new_files:
+            item['local_status'] = FileStatus.PRESENT.value
+        filemanager.add_files(data_type='climo_regrid', file_list=new_files)
+        rows = DataFile.select().where(DataFile.datatype == 'climo_regrid')
+        self.assertEqual(sorted([x.id for x in rows]), sorted(ids))
+        self.assertEqual(DataFile.select().count(), 29)
+        self.assertTrue(filemanager.check_data_ready(['climo_regrid'], self.case, 1, 2))
+        paths = filemanager.get_file_paths_by_year('climo_regrid', self.case, 1, 2)
+        self.assertEqual(len(paths), 5)
+
+    def test_filemanager_data_required(self):
+        """
+        test that only the data types some job reads are added to the catalog
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_local_config(self.project_path, end_year=2, data_types='all')
+        self.start_filemanager(config, data_required={self.case: set(['atm', 'climo_regrid'])})
+        self.assertEqual(DataFile.select().count(), 24)
+        self.assertEqual(
+            DataFile.select().where(DataFile.datatype == 'ocn_streams').count(), 0)
+
+        filemanager = self.start_filemanager(config, data_required={})
+        self.assertEqual(DataFile.select().count(), 0)
+        self.assertTrue(filemanager.all_data_local())
+
+    def test_filemanager_transfer_progress(self):
+        """
+        test that local and remote sizes are recorded and used for the progress estimate
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = self.sftp_config(end_year=1)
+        config['global']['verify'] = True
+        filemanager = self.start_filemanager(config)
+        self.assertTrue(filemanager.verify_remote_files(FakeSSHClient(self.remote_listing(1000)), self.case))
+        self.assertEqual(filemanager.transfer_progress()[:2], (0, 12000))
+
+        names = ['{}.cam.h0.0001-{:02d}.nc'.format(self.case, x) for x in range(1, 7)]
+        touch_files(self.atm_path, names)
+        filemanager.update_local_status()
+        local, total, _, _ = filemanager.transfer_progress()
+        self.assertEqual(local, sum(len(x) for x in names))
+        self.assertEqual(total, 12000)
+        self.assertTrue(filemanager.report_transfer_progress().startswith(
+            '{} of'.format(format_size(local))))
+
+        # the totals are only summed again once a size changes
+        DataFile.update(remote_size=5).where(DataFile.id == 12).execute()
+        self.assertEqual(filemanager.transfer_progress()[1], 12000)
+        touch_files(self.atm_path, [names[0].replace('-01.nc', '-07.nc')])
+        filemanager.update_local_status()
+        self.assertEqual(filemanager.transfer_progress()[:2], (local + len(names[0]), 11005))
+
+        progress = TransferProgress(window=60)
+        self.assertIsNone(progress.eta(100))
+        progress.sample(0, now=0)
+        progress.sample(500, now=10)
+        progress.sample(1000, now=20)
+        self.assertEqual(progress.rate(), 50)
+        self.assertEqual(progress.eta(1000), 20)
+        # nothing has arrived within the window
+        progress.sample(1000, now=100)
+        self.assertIsNone(progress.rate())
+
+    def test_filemanager_checksum_verification(self):
+        """
+        test that files are checksummed locally and mismatches are sent back for transfer
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = self.sftp_config(end_year=1, data_types='atm, ocn_streams')
+        config['global']['verify_checksums'] = 'True'
+        config['global']['checksum_manifest'] = 'md5sums.txt'
+        config['global']['transfer_max_retries'] = 1
+        filemanager = self.start_filemanager(config)
+
+        names = ['{}.cam.h0.0001-{:02d}.nc'.format(self.case, x) for x in range(1, 13)]
+        touch_files(self.atm_path, names)
+        touch_files(os.path.join(self.project_path, 'input', self.case, 'mpas'), ['streams.ocean'])
+        with open(os.path.join(self.atm_path, 'md5sums.txt'), 'w') as fp:
+            for name in names[:-1]:
+                fp.write('{}  {}\n'.format(file_checksum(os.path.join(self.atm_path, name)), name))
+            fp.write('{}  {}\n'.format('0' * 32, names[-1]))
+        filemanager.update_local_status()
+        self.assertEqual(count_status(FileStatus.PRESENT), 13)
+
+        filemanager.start_checksum_verifier()
+        self.assertTrue(wait_for(
+            lambda: DataFile.select().where(DataFile.checksum != '').count() == 11))
+        self.assertFalse(os.path.exists(os.path.join(self.atm_path, names[-1])))
+        missing = DataFile.get(DataFile.name == names[-1])
+        self.assertEqual(missing.local_status, FileStatus.NOT_PRESENT.value)
+        self.assertEqual(missing.checksum, '')
+        # nothing is checked in a directory whose manifest hasnt arrived
+        streams = DataFile.get(DataFile.name == 'streams.ocean')
+        self.assertEqual((streams.local_status, streams.checksum), (FileStatus.PRESENT.value, ''))
+        # the mismatch counts as a failed transfer
+        self.assertEqual(
+            filemanager.report_failed_transfers(),
+            '1 files could not be transferred after 1 attempts, including {}'.format(names[-1]))
+
+    def test_filemanager_transfer_completion(self):
+        """
+        test that files are marked local as soon as their transfer finishes
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        # half the files arrive and the rest never finish
+        self.fake_rsync(RSYNC_SOME_FILES.replace('COUNT', '6') + 'exec sleep 600\n')
+        filemanager = self.start_filemanager(self.rsync_config(end_year=1))
+        filemanager.transfer_needed(EventList(), threading.Event())
+        self.assertTrue(wait_for(lambda: count_status(FileStatus.PRESENT) == 6))
+
+        present = DataFile.select().where(DataFile.local_status == FileStatus.PRESENT.value)
+        self.assertTrue(all(x.local_size == len(x.name) for x in present))
+        self.assertEqual(count_status(FileStatus.IN_TRANSIT), 6)
+        self.assertFalse(filemanager.check_data_ready(['atm'], self.case, 1, 1))
+        # the arrivals wake the main loop
+        self.assertTrue(filemanager.update_local_status())
+
+    def test_filemanager_remote_listing_cache(self):
+        """
+        test that remote directories are listed once and the listing is reused from the catalog
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = self.sftp_config(end_year=1, data_types='atm, ocn_streams')
+        config['global']['verify'] = True
+        config['global']['remote_listing_ttl'] = 2
+        filemanager = self.start_filemanager(config)
+        client = FakeSSHClient(self.remote_listing(100))
+
+        self.assertTrue(filemanager.verify_remote_files(client, self.case))
+        self.assertEqual(sorted(client.listings), sorted(client.remote.keys()))
+        self.assertEqual(DataFile.select().where(DataFile.remote_size == 100).count(), 13)
+
+        # a recent listing is reused
+        del client.listings[:]
+        self.assertTrue(filemanager.verify_remote_files(client, self.case))
+        self.assertEqual(client.listings, [])
+
+        # a file missing from the stored listing gets the directory listed again
+        atm_dir = os.path.split(DataFile.get(DataFile.datatype == 'atm').remote_path)[0]
+        client.remote[atm_dir]['extra.nc'] = 5
+        filemanager.add_files('atm', [{
+            'name': 'extra.nc',
+            'local_path': os.path.join(self.project_path, 'extra.nc'),
+            'remote_path': os.path.join(atm_dir, 'extra.nc'),
+            'case': self.case,
+            'year': 1,
+            'local_status': FileStatus.NOT_PRESENT.value,
+            'transfer_type': 'sftp',
+            'remote_hostname': 'edison.nersc.gov'
+        }])
+        self.assertTrue(filemanager.verify_remote_files(client, self.case))
+        self.assertEqual(client.listings, [atm_dir])
+        self.assertEqual(DataFile.get(DataFile.name == 'extra.nc').remote_size, 5)
+
+        # once the listing expires a file removed from the remote is noticed
+        del client.remote[atm_dir]['extra.nc']
+        self.assertTrue(filemanager.verify_remote_files(client, self.case))
+        self.assertTrue(wait_for(lambda: not filemanager.verify_remote_files(client, self.case)))
+
+    def test_filemanager_transfer_recovery(self):
+        """
+        test that files of a failed transfer go back to NOT_PRESENT and are reported once given up on
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        # a third of the files arrive before rsync fails
+        self.fake_rsync(RSYNC_SOME_FILES.replace('COUNT', '4') + 'exit 23\n')
+        config = self.rsync_config(end_year=1)
+        config['global']['transfer_max_retries'] = 1
+        filemanager = self.start_filemanager(config)
+        filemanager.transfer_needed(EventList(), threading.Event())
+        self.assertTrue(wait_for(lambda: count_status(FileStatus.NOT_PRESENT) == 8))
+
+        self.assertEqual(count_status(FileStatus.PRESENT), 4)
+        self.assertTrue(filemanager.report_failed_transfers().startswith(
+            '8 files could not be transferred after 1 attempts'))
+        # the files that were given up on arent sent again
+        filemanager.transfer_needed(EventList(), threading.Event())
+        self.assertEqual(count_status(FileStatus.IN_TRANSIT), 0)
+        self.assertFalse(filemanager.all_data_local())
+
+    def test_filemanager_transfer_stalled(self):
+        """
+        test that a batch that stops delivering files is stopped and its files go back to NOT_PRESENT
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        pid_path = os.path.join(self.project_path, 'rsync.pid')
+        self.fake_rsync('echo $$ > {0}.tmp; mv {0}.tmp {0}\nexec sleep 600\n'.format(pid_path))
+        config = self.rsync_config(end_year=1)
+        config['global']['transfer_stall_timeout'] = 1
+        filemanager = self.start_filemanager(config)
+        filemanager.transfer_needed(EventList(), threading.Event())
+        self.assertTrue(wait_for(lambda: os.path.exists(pid_path)))
+        self.assertEqual(count_status(FileStatus.IN_TRANSIT), 12)
+        with open(pid_path, 'r') as fp:
+            pid = int(fp.read())
+
+        def running():
+            try:
+                os.kill(pid, 0)
+            except OSError:
+                return False
+            return True
+
+        time.sleep(1.5)
+        filemanager.transfer_needed(EventList(), threading.Event())
+        self.assertTrue(wait_for(lambda: not running()))
+        self.assertEqual(count_status(FileStatus.NOT_PRESENT), 12)
+        # the endpoint is held back after the failure
+        filemanager.transfer_needed(EventList(), threading.Event())
+        self.assertEqual(count_status(FileStatus.IN_TRANSIT), 0)
+
+    def test_filemanager_in_transit_by_id(self):
+        """
+        test that starting a transfer only marks the rows of the case being sent in transit,
+        when another case has files with the same names and the batch is bigger than a chunk
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        other = '20180129.DECKv1b_abrupt4xCO2.ne30_oEC.edison'
+        # an rsync that never finishes keeps the batch in transit
+        self.fake_rsync('exec sleep 600\n')
+        config = self.rsync_config(end_year=50)
+        config['global']['transfer_batch_size'] = 1000
+        config['data_types']['atm']['file_format'] = 'cam.h0.YEAR-MONTH.nc'
+        config['simulations'][other] = dict(
+            config['simulations'][self.case],
+            transfer_type='local',
+            local_path=os.path.join(self.project_path, 'input', other))
+        filemanager = self.start_filemanager(config)
+        self.assertEqual(DataFile.select().where(DataFile.case == other).count(), 600)
+
+        filemanager.transfer_needed(EventList(), threading.Event())
+        statuses = dict()
+        for case, status in DataFile.select(DataFile.case, DataFile.local_status).tuples():
+            statuses.setdefault(case, set()).add(status)
+        self.assertEqual(statuses[self.case], set([FileStatus.IN_TRANSIT.value]))
+        self.assertEqual(statuses[other], set([FileStatus.NOT_PRESENT.value]))
+
+    def test_filemanager_link_ingest(self):
+        """
+        test that data already on this machine is linked into place and marked local straight away
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        config = make_local_config(self.project_path, end_year=1)
+        config['simulations'][self.case]['transfer_type'] = 'link'
+        config['simulations'][self.case]['remote_path'] = os.path.join(self.project_path, 'archive', self.case)
+        filemanager = self.start_filemanager(config)
+        files = list(DataFile.select().order_by(DataFile.month))
+        source_dir, _ = os.path.split(files[0].remote_path)
+        # the last month hasnt been written yet
+        touch_files(source_dir, [x.name for x in files[:-1]])
+
+        errors = list()
+        handler = logging.Handler(logging.ERROR)
+        handler.emit = lambda record: errors.append(record.getMessage())
+        logging.getLogger().addHandler(handler)
+        try:
+            # a missing source is only reported on the first pass
+            filemanager.transfer_needed(EventList(), threading.Event())
+            filemanager.transfer_needed(EventList(), threading.Event())
+        finally:
+            logging.getLogger().removeHandler(handler)
+        self.assertEqual(len([x for x in errors if x.startswith('Unable to link 1 files')]), 1)
+
+        statuses = dict((x.id, (x.local_status, x.local_size)) for x in DataFile.select())
+        for df in files[:-1]:
+            self.assertEqual(statuses[df.id], (FileStatus.PRESENT.value, len(df.name)))
+            self.assertEqual(os.stat(df.local_path).st_ino, os.stat(df.remote_path).st_ino)
+        self.assertEqual(statuses[files[-1].id][0], FileStatus.NOT_PRESENT.value)
+        # nothing was sent by a transfer
+        self.assertEqual(count_status(FileStatus.IN_TRANSIT), 0)
+        self.assertEqual(DataFile.select().where(DataFile.checksum != '').count(), 0)
+
+        touch_files(source_dir, [files[-1].name])
+        filemanager.transfer_needed(EventList(), threading.Event())
+        self.assertTrue(filemanager.all_data_local())
 
 if __name__ == '__main__':
     unittest.main()
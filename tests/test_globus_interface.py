@@ -0,0 +1,109 @@
+import os, sys
+import unittest
+import inspect
+import threading
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.globus_interface import TaskPoller, completed_files
+from lib.util import print_message
+
+
+class TaskListClient(object):
+    """
+    Answers the task list and successful transfer requests from a dict of task documents
+    """
+    def __init__(self):
+        self.tasks = dict()
+        self.done = dict()
+        self.task_list_calls = 0
+        self.cancelled = list()
+
+    def task_list(self, num_results=10, filter=''):
+        self.task_list_calls += 1
+        task_ids = filter.split(':', 1)[1].split(',')
+        return [dict(self.tasks[x], task_id=x) for x in task_ids if x in self.tasks]
+
+    def task_successful_transfers(self, task_id, num_results=100):
+        return [{'destination_path': x} for x in self.done.get(task_id, list())]
+
+    def cancel_task(self, task_id):
+        self.cancelled.append(task_id)
+
+
+class TestGlobusInterface(unittest.TestCase):
+
+    def test_completed_files(self):
+        """
+        test that each finished file of a task is only returned once
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        client = TaskListClient()
+        seen = set()
+        client.done['task'] = ['/data/{}'.format(x) for x in range(6)]
+        self.assertEqual(completed_files(client, 'task', seen), client.done['task'])
+        self.assertEqual(completed_files(client, 'task', seen), [])
+        client.done['task'].append('/data/6')
+        self.assertEqual(completed_files(client, 'task', seen), ['/data/6'])
+
+        class BrokenClient(object):
+            def task_successful_transfers(self, task_id, num_results=100):
+                raise IOError('connection reset')
+        self.assertEqual(completed_files(BrokenClient(), 'task', seen), None)
+
+    def test_task_poller_follows_tasks_together(self):
+        """
+        test that every task is polled with one task list request and reported as files finish
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        client = TaskListClient()
+        poller = TaskPoller(client=client, kill_event=threading.Event())
+        arrived = list()
+        finished = list()
+
+        def on_finished(task_id, succeeded, details):
+            finished.append((task_id, succeeded, details))
+
+        for task_id in ['a', 'b']:
+            client.tasks[task_id] = {
+                'status': 'ACTIVE',
+                'files_transferred': 0,
+                'bytes_transferred': 0
+            }
+            poller.add(task_id, on_files_done=arrived.extend, on_finished=on_finished)
+        self.assertFalse(poller.poll())
+        self.assertEqual(client.task_list_calls, 1)
+
+        client.tasks['a'].update(files_transferred=2, bytes_transferred=200)
+        client.done['a'] = ['/data/a1', '/data/a2']
+        self.assertTrue(poller.poll())
+        self.assertEqual(client.task_list_calls, 2)
+        self.assertEqual(sorted(arrived), ['/data/a1', '/data/a2'])
+
+        client.tasks['a'].update(status='SUCCEEDED', files_transferred=3, bytes_transferred=300)
+        client.done['a'].append('/data/a3')
+        client.tasks['b'].update(status='FAILED', nice_status_details='PERMISSION_DENIED')
+        poller.poll()
+        self.assertEqual(arrived, ['/data/a1', '/data/a2', '/data/a3'])
+        self.assertEqual(sorted(finished), [('a', True, None), ('b', False, 'PERMISSION_DENIED')])
+        self.assertEqual(poller.active(), 0)
+
+    def test_task_poller_cancels_on_kill(self):
+        """
+        test that tasks still running when the kill event is set are cancelled
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        client = TaskListClient()
+        kill_event = threading.Event()
+        poller = TaskPoller(client=client, kill_event=kill_event)
+        client.tasks['a'] = {'status': 'ACTIVE'}
+        poller.add('a')
+        kill_event.set()
+        poller.start()
+        poller.join()
+        self.assertEqual(client.cancelled, ['a'])
+
+
+if __name__ == '__main__':
+    unittest.main()
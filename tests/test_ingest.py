@@ -0,0 +1,90 @@
+import os, sys
+import unittest
+import shutil
+import inspect
+import tempfile
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.ingest import link_file, link_files, _reflink
+from lib.util import print_message
+
+
+class TestIngest(unittest.TestCase):
+
+    def test_link_file(self):
+        """
+        test that files are hardlinked into new directories, and existing or missing files are left alone
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        directory = tempfile.mkdtemp()
+        try:
+            source = os.path.join(directory, 'source.nc')
+            with open(source, 'w') as fp:
+                fp.write('x' * 100)
+            destination = os.path.join(directory, 'atm', 'source.nc')
+            self.assertEqual(link_file(source, destination), 'hardlink')
+            self.assertEqual(os.stat(source).st_ino, os.stat(destination).st_ino)
+            self.assertEqual(link_file(source, destination), 'exists')
+            self.assertEqual(link_file(os.path.join(directory, 'missing.nc'),
+                                       os.path.join(directory, 'atm', 'missing.nc')), None)
+            self.assertFalse(os.path.exists(os.path.join(directory, 'atm', 'missing.nc')))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_reflink_never_leaves_an_empty_file(self):
+        """
+        test that a clone only appears at the destination once it has worked, and a failed one leaves nothing behind
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        directory = tempfile.mkdtemp()
+        try:
+            source = os.path.join(directory, 'source.nc')
+            with open(source, 'w') as fp:
+                fp.write('x' * 100)
+            destination = os.path.join(directory, 'clone.nc')
+            if _reflink(source, destination):
+                # the filesystem supports cloning
+                with open(destination) as fp:
+                    self.assertEqual(fp.read(), 'x' * 100)
+                self.assertEqual(sorted(os.listdir(directory)), ['clone.nc', 'source.nc'])
+            else:
+                self.assertEqual(os.listdir(directory), ['source.nc'])
+            # the source going missing leaves nothing behind either
+            self.assertFalse(_reflink(os.path.join(directory, 'missing.nc'),
+                                      os.path.join(directory, 'missing_clone.nc')))
+            self.assertFalse(any(x.startswith('.') or 'missing' in x for x in os.listdir(directory)))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_link_files(self):
+        """
+        test that many files are linked at once and each result is returned in order
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        directory = tempfile.mkdtemp()
+        try:
+            file_list = list()
+            for idx in range(20):
+                source = os.path.join(directory, 'archive', 'file_{}.nc'.format(idx))
+                if idx % 5:
+                    if not os.path.exists(os.path.dirname(source)):
+                        os.makedirs(os.path.dirname(source))
+                    with open(source, 'w') as fp:
+                        fp.write('x')
+                file_list.append({
+                    'remote_path': source,
+                    'local_path': os.path.join(directory, 'local', 'file_{}.nc'.format(idx))
+                })
+            results = link_files(file_list, workers=4)
+            self.assertEqual([x for x, _ in results], file_list)
+            self.assertEqual([method for _, method in results],
+                             [None if idx % 5 == 0 else 'hardlink' for idx in range(20)])
+            self.assertEqual(link_files([]), [])
+        finally:
+            shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    unittest.main()
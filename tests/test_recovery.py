@@ -0,0 +1,107 @@
+import os, sys
+import unittest
+import inspect
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.recovery import TransferRecovery
+from lib.util import print_message
+
+
+class TestRecovery(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestRecovery, self).__init__(*args, **kwargs)
+        self.key = ('sftp', 'edison.nersc.gov')
+
+    def test_recovery_backs_off_and_gives_up(self):
+        """
+        test that files from failed batches wait longer after each failure and are given up on
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        recovery = TransferRecovery(max_retries=3, retry_delay=10, max_failures=10)
+        recovery.started(self.key, [1, 2, 3], now=0)
+        recovery.arrived([1], now=5)
+        self.assertEqual(sorted(recovery.ended(self.key, failed=True, now=20)), [2, 3])
+        self.assertTrue(recovery.file_ready(1, now=20))
+        self.assertFalse(recovery.file_ready(2, now=29))
+        self.assertTrue(recovery.file_ready(2, now=30))
+        self.assertFalse(recovery.endpoint_ready(self.key, now=29))
+
+        recovery.started(self.key, [2], now=30)
+        recovery.ended(self.key, failed=True, now=30)
+        self.assertFalse(recovery.file_ready(2, now=49))
+        self.assertTrue(recovery.file_ready(2, now=50))
+
+        recovery.started(self.key, [2], now=50)
+        recovery.ended(self.key, failed=True, now=50)
+        self.assertFalse(recovery.file_ready(2, now=10 ** 6))
+        self.assertEqual(recovery.given_up(), [2])
+        self.assertTrue(recovery.file_ready(3, now=30))
+
+    def test_recovery_endpoint_failures(self):
+        """
+        test that an endpoint is held back longer after failing repeatedly, and forgiven when files arrive
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        recovery = TransferRecovery(max_retries=10, retry_delay=1, max_failures=3)
+        recovery.started(self.key, [1], now=0)
+        recovery.ended(self.key, failed=True, now=0)
+        recovery.started(self.key, [1, 2], now=10)
+        recovery.arrived([2], now=11)
+        self.assertTrue(recovery.endpoint_ready(self.key, now=11))
+        recovery.ended(self.key, failed=True, now=12)
+        recovery.started(self.key, [1], now=20)
+        recovery.ended(self.key, failed=True, now=20)
+        # the second failure in a row after the arrival waits twice as long
+        self.assertFalse(recovery.endpoint_ready(self.key, now=21.5))
+        self.assertTrue(recovery.endpoint_ready(self.key, now=22))
+        recovery.started(self.key, [1], now=30)
+        recovery.ended(self.key, failed=True, now=30)
+        # after max_failures in a row it's only tried every MAX_DELAY seconds, never given up on
+        self.assertFalse(recovery.endpoint_ready(self.key, now=30 + recovery.MAX_DELAY - 1))
+        self.assertTrue(recovery.endpoint_ready(self.key, now=30 + recovery.MAX_DELAY))
+        recovery.started(self.key, [1], now=10 ** 6)
+        recovery.arrived([1], now=10 ** 6 + 1)
+        recovery.ended(self.key, failed=False, now=10 ** 6 + 1)
+        self.assertTrue(recovery.endpoint_ready(self.key, now=10 ** 6 + 1))
+
+    def test_recovery_stalled_and_finished(self):
+        """
+        test that batches without arrivals are stalled, and finished batches dont count as failures
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        recovery = TransferRecovery(stall_timeout=100)
+        recovery.started(self.key, [1, 2], now=0)
+        recovery.started(('globus', 'uuid'), [3], now=0)
+        recovery.arrived([1], now=90)
+        self.assertEqual(recovery.stalled(now=150), [('globus', 'uuid')])
+        self.assertEqual(recovery.ended(self.key, failed=False, now=150), [2])
+        self.assertTrue(recovery.file_ready(2, now=150))
+        self.assertTrue(recovery.endpoint_ready(self.key, now=150))
+        self.assertEqual(recovery.ended(self.key, failed=True, now=150), [])
+        self.assertEqual(recovery.active(), [('globus', 'uuid')])
+
+    def test_recovery_corrupt_files(self):
+        """
+        test that files which keep arriving corrupt are given up on, and verified files are forgiven
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        recovery = TransferRecovery(max_retries=2, retry_delay=10, max_failures=10)
+        for attempt in range(2):
+            now = attempt * 100
+            recovery.started(self.key, [1, 2], now=now)
+            recovery.arrived([1, 2], now=now)
+            recovery.ended(self.key, failed=False, now=now)
+            self.assertTrue(recovery.file_ready(1, now=now))
+            recovery.rejected(self.key, [1], now=now)
+            recovery.verified([2])
+        self.assertFalse(recovery.file_ready(1, now=10 ** 6))
+        self.assertEqual(recovery.given_up(), [1])
+        self.assertTrue(recovery.file_ready(2, now=100))
+        self.assertFalse(recovery.endpoint_ready(self.key, now=101))
+
+
+if __name__ == '__main__':
+    unittest.main()
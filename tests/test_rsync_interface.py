@@ -0,0 +1,154 @@
+import os, sys
+import unittest
+import shutil
+import inspect
+import tempfile
+import threading
+import time
+
+from distutils.spawn import find_executable
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.rsync_interface import rsync_command, transfer_files
+from lib.util import print_message
+
+
+class TestRsyncInterface(unittest.TestCase):
+
+    def test_rsync_command(self):
+        """
+        test that the rsync options and the ssh login are put on the command line
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        cmd = rsync_command('/remote/atm/hist', '/local/atm', '/tmp/files')
+        self.assertEqual(cmd, [
+            'rsync', '--times', '--files-from=/tmp/files', '--out-format=%n',
+            '--partial-dir=.rsync-partial', '/remote/atm/hist/', '/local/atm/'])
+
+        cmd = rsync_command(
+            '/remote/atm/hist/', '/local/atm', '/tmp/files',
+            hostname='edison.nersc.gov',
+            username='user',
+            key_filename='/keys/id_rsa',
+            inplace=True,
+            options='-z --bwlimit=1000')
+        self.assertEqual(cmd, [
+            'rsync', '--times', '--files-from=/tmp/files', '--out-format=%n', '--inplace',
+            '-z', '--bwlimit=1000',
+            '-e', 'ssh -o BatchMode=yes -l user -i /keys/id_rsa',
+            'edison.nersc.gov:/remote/atm/hist/', '/local/atm/'])
+
+    @unittest.skipIf(not find_executable('rsync'), 'rsync is not installed')
+    def test_rsync_transfer_local_files(self):
+        """
+        test that files are copied between local paths and reported as each completes
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        remote = tempfile.mkdtemp()
+        local = tempfile.mkdtemp()
+        try:
+            file_list = list()
+            for component in ['atm', 'ocn']:
+                os.makedirs(os.path.join(remote, component))
+                for idx in range(10):
+                    name = '{}_{}.nc'.format(component, idx)
+                    with open(os.path.join(remote, component, name), 'w') as fp:
+                        fp.write('x' * 100)
+                    file_list.append({
+                        'remote_path': os.path.join(remote, component, name),
+                        'local_path': os.path.join(local, component, name)
+                    })
+            done = list()
+            count, size, _ = transfer_files(file_list, workers=3, on_file_done=done.append)
+            self.assertEqual((count, size), (20, 2000))
+            self.assertEqual(len(done), 20)
+            self.assertEqual(len(os.listdir(os.path.join(local, 'ocn'))), 10)
+
+            # files that are already up to date are still reported
+            del done[:]
+            count, _, _ = transfer_files(file_list, workers=3, on_file_done=done.append)
+            self.assertEqual((count, len(done)), (20, 20))
+        finally:
+            shutil.rmtree(remote)
+            shutil.rmtree(local)
+
+    def fake_rsync(self, script):
+        """
+        Put an rsync on the PATH that runs script instead, for the rest of the test
+        """
+        bin_dir = tempfile.mkdtemp()
+        path = os.path.join(bin_dir, 'rsync')
+        with open(path, 'w') as fp:
+            fp.write('#!/bin/sh\n' + script)
+        os.chmod(path, 0755)
+        self.addCleanup(shutil.rmtree, bin_dir)
+        self.addCleanup(os.environ.__setitem__, 'PATH', os.environ['PATH'])
+        os.environ['PATH'] = bin_dir + os.pathsep + os.environ['PATH']
+
+    def test_rsync_transfer_lots_of_errors(self):
+        """
+        test that an rsync writing more errors than a pipe holds doesnt block, and the files it sent are reported
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        local = tempfile.mkdtemp()
+        try:
+            # more than a pipe buffer of errors before the names of the sent files
+            self.fake_rsync(
+                'i=0; while [ $i -lt 3000 ]; do echo "rsync: failed to open file $i" >&2; i=$((i+1)); done\n'
+                'touch {0}/a.nc {0}/b.nc\n'
+                'echo a.nc; echo b.nc\n'
+                'exit 23\n'.format(local))
+            file_list = [{
+                'remote_path': '/remote/{}'.format(name),
+                'local_path': os.path.join(local, name)
+            } for name in ['a.nc', 'b.nc', 'c.nc']]
+            done = list()
+            result = list()
+            thread = threading.Thread(
+                target=lambda: result.append(transfer_files(file_list, on_file_done=done.append)))
+            thread.start()
+            thread.join(30)
+            self.assertFalse(thread.is_alive())
+            self.assertEqual(result[0][0], 2)
+            self.assertEqual(sorted(x['local_path'] for x in done), sorted(x['local_path'] for x in file_list[:2]))
+        finally:
+            shutil.rmtree(local)
+
+    def test_rsync_transfer_stopped_while_running(self):
+        """
+        test that a running rsync is terminated when the event is set
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        local = tempfile.mkdtemp()
+        try:
+            self.fake_rsync('exec sleep 60\n')
+            event = threading.Event()
+            timer = threading.Timer(1, event.set)
+            timer.start()
+            start = time.time()
+            count, _, _ = transfer_files(
+                [{'remote_path': '/remote/a.nc', 'local_path': os.path.join(local, 'a.nc')}],
+                event=event)
+            timer.cancel()
+            self.assertEqual(count, 0)
+            self.assertLess(time.time() - start, 30)
+        finally:
+            shutil.rmtree(local)
+
+    def test_rsync_transfer_stopped(self):
+        """
+        test that nothing is started once the event is set
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        event = threading.Event()
+        event.set()
+        count, size, _ = transfer_files(
+            [{'remote_path': '/no/file', 'local_path': '/no/file'}],
+            event=event)
+        self.assertEqual((count, size), (0, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
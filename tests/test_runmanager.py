@@ -158,7 +158,9 @@ class TestRunManager(unittest.TestCase):
         path = os.path.join(self.project_path, 'output', 'job_state.txt')
         runmanager.write_job_sets(path)
         self.assertTrue(os.path.exists(path))
-        os.remove(database)
+        for db_file in [database, database + '-wal', database + '-shm']:
+            if os.path.exists(db_file):
+                os.remove(db_file)
 
 
 if __name__ == '__main__':
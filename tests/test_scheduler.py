@@ -0,0 +1,58 @@
+import os, sys
+import unittest
+import inspect
+
+from collections import namedtuple
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.scheduler import TransferScheduler
+from lib.util import print_message
+
+MissingFile = namedtuple('MissingFile', ['case', 'datatype', 'year', 'month'])
+
+
+class TestScheduler(unittest.TestCase):
+
+    def __init__(self, *args, **kwargs):
+        super(TestScheduler, self).__init__(*args, **kwargs)
+        self.case = '20180129.DECKv1b_piControl.ne30_oEC.edison'
+
+    def test_scheduler_orders_by_job_window(self):
+        """
+        test that the first climo window is sent first, with ocean data for aprime after the atm data
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        scheduler = TransferScheduler(batch_size=70)
+        scheduler.set_windows({
+            (self.case, 'atm'): [(1, 5, 'climo'), (6, 10, 'climo')],
+            (self.case, 'ocn'): [(1, 10, 'aprime')],
+            (self.case, 'ocn_restart'): [(1, 10, 'aprime')],
+        })
+        files = list()
+        for year in range(10, 0, -1):
+            for month in range(1, 13):
+                files.append(MissingFile(self.case, 'ocn', year, month))
+                files.append(MissingFile(self.case, 'atm', year, month))
+        files.append(MissingFile(self.case, 'ocn_restart', 0, 0))
+        files.append(MissingFile(self.case, 'lnd', 1, 1))
+
+        batch = scheduler.next_batch(files)
+        self.assertEqual(len(batch), 70)
+        # the whole first climo window comes first, in order
+        self.assertEqual(batch[:60], sorted(
+            [x for x in files if x.datatype == 'atm' and x.year <= 5],
+            key=lambda x: (x.year, x.month)))
+        self.assertTrue(all(x.datatype == 'atm' for x in batch[60:]))
+
+        batch = scheduler.next_batch([x for x in files if x.datatype != 'atm'])
+        self.assertEqual(batch[0].datatype, 'ocn_restart')
+        self.assertEqual(batch[-1], MissingFile(self.case, 'ocn', 6, 9))
+        # nothing needs lnd, so it goes last
+        batch = scheduler.next_batch([x for x in files if x.datatype in ['lnd', 'ocn']])
+        self.assertNotIn(MissingFile(self.case, 'lnd', 1, 1), batch)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,285 @@
+import os, sys
+import unittest
+import shutil
+import inspect
+import tempfile
+import threading
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.ssh_interface import transfer, transfer_files, SSHSessionPool, PART_SUFFIX, RANGE_SUFFIX
+from lib.util import print_message
+
+
+class LocalFile(file):
+    """
+    A local file standing in for a paramiko SFTPFile
+    """
+    def prefetch(self, file_size=None):
+        pass
+
+
+class LocalSFTP(object):
+    """
+    An sftp client that reads files from the local filesystem
+    """
+    def __init__(self):
+        self.bytes_read = 0
+        self.opened = 0
+        self.closed = False
+        # the threads that have read through this client
+        self.threads = set()
+
+    def stat(self, path):
+        return os.stat(path)
+
+    def open(self, filename, mode='r'):
+        sftp = self
+        self.opened += 1
+
+        class CountingFile(LocalFile):
+            def read(self, size=-1):
+                block = super(CountingFile, self).read(size)
+                sftp.bytes_read += len(block)
+                sftp.threads.add(threading.current_thread().name)
+                return block
+        return CountingFile(filename, mode)
+
+    def get_channel(self):
+        return None
+
+    def close(self):
+        self.closed = True
+
+
+class LocalHost(object):
+    """
+    An ssh client whose sftp channels read from the local filesystem
+    """
+    def __init__(self):
+        self.sftp_opened = 0
+
+    def open_sftp(self):
+        self.sftp_opened += 1
+        return LocalSFTP()
+
+
+class Transport(object):
+    def __init__(self):
+        self.active = True
+
+    def is_active(self):
+        return self.active
+
+    def send_ignore(self):
+        pass
+
+
+class Connection(object):
+    def __init__(self):
+        self.transport = Transport()
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.transport.active = False
+
+
+class CountingPool(SSHSessionPool):
+    """
+    A session pool that makes fake connections and counts the logins
+    """
+    def __init__(self):
+        super(CountingPool, self).__init__()
+        self.logins = 0
+
+    def _connect(self, hostname, username, key_filename, compress):
+        self.logins += 1
+        return Connection()
+
+
+class TestSSHInterface(unittest.TestCase):
+
+    def test_transfer_files_over_channel_pool(self):
+        """
+        test that files are spread over the pool of channels and reported as each completes
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        remote = tempfile.mkdtemp()
+        local = tempfile.mkdtemp()
+        try:
+            file_list = list()
+            for idx in range(20):
+                name = 'file_{}.nc'.format(idx)
+                with open(os.path.join(remote, name), 'w') as fp:
+                    fp.write('x' * 1000)
+                file_list.append({
+                    'remote_path': os.path.join(remote, name),
+                    'local_path': os.path.join(local, name)
+                })
+            file_list.append({
+                'remote_path': os.path.join(remote, 'missing.nc'),
+                'local_path': os.path.join(local, 'missing.nc')
+            })
+            host = LocalHost()
+            done = list()
+            count, size, seconds = transfer_files(
+                client=host,
+                file_list=file_list,
+                workers=4,
+                on_file_done=done.append)
+            self.assertEqual(count, 20)
+            self.assertEqual(size, 20000)
+            self.assertEqual(host.sftp_opened, 4)
+            self.assertEqual(len(done), 20)
+            self.assertEqual(sorted(os.listdir(local)), sorted('file_{}.nc'.format(x) for x in range(20)))
+        finally:
+            shutil.rmtree(remote)
+            shutil.rmtree(local)
+
+    def test_transfer_files_stops_on_event(self):
+        """
+        test that no new files are started once the event is set
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        event = threading.Event()
+        event.set()
+        count, size, _ = transfer_files(
+            client=LocalHost(),
+            file_list=[{'remote_path': '/no/file', 'local_path': '/no/file'}],
+            event=event)
+        self.assertEqual((count, size), (0, 0))
+
+    def test_transfer_resumes_partial_file(self):
+        """
+        test that an interrupted download continues from the .part file and is only renamed once complete
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        remote = tempfile.mkdtemp()
+        local = tempfile.mkdtemp()
+        try:
+            contents = ''.join(chr(x % 256) for x in range(5000))
+            with open(os.path.join(remote, 'mpaso.rst.nc'), 'wb') as fp:
+                fp.write(contents)
+            file = {
+                'remote_path': os.path.join(remote, 'mpaso.rst.nc'),
+                'local_path': os.path.join(local, 'mpaso.rst.nc')
+            }
+            with open(file['local_path'] + PART_SUFFIX, 'wb') as fp:
+                fp.write(contents[:2000])
+
+            sftp = LocalSFTP()
+            self.assertTrue(transfer(sftp, file))
+            self.assertEqual(sftp.bytes_read, 3000)
+            self.assertFalse(os.path.exists(file['local_path'] + PART_SUFFIX))
+            with open(file['local_path'], 'rb') as fp:
+                self.assertEqual(fp.read(), contents)
+
+            # a short read leaves the .part file to resume from and nothing at local_path
+            os.remove(file['local_path'])
+            class ShortSFTP(LocalSFTP):
+                def stat(self, path):
+                    info = os.stat(path)
+                    return type('Stat', (object,), {'st_size': info.st_size + 10})()
+            self.assertFalse(transfer(ShortSFTP(), file))
+            self.assertFalse(os.path.exists(file['local_path']))
+            self.assertEqual(os.path.getsize(file['local_path'] + PART_SUFFIX), 5000)
+        finally:
+            shutil.rmtree(remote)
+            shutil.rmtree(local)
+
+    def test_transfer_large_file_in_ranges(self):
+        """
+        test that a file over the size threshold is fetched in ranges into the right places
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        remote = tempfile.mkdtemp()
+        local = tempfile.mkdtemp()
+        try:
+            contents = ''.join(chr(x % 251) for x in range(10000))
+            with open(os.path.join(remote, 'mpaso.rst.nc'), 'wb') as fp:
+                fp.write(contents)
+            file = {
+                'remote_path': os.path.join(remote, 'mpaso.rst.nc'),
+                'local_path': os.path.join(local, 'mpaso.rst.nc')
+            }
+            sftp = LocalSFTP()
+            channels = list()
+
+            def open_channel():
+                channels.append(LocalSFTP())
+                return channels[-1]
+            self.assertTrue(transfer(sftp, file, large_file_size=4000, range_workers=3,
+                                     open_channel=open_channel))
+            self.assertEqual(sftp.opened, 0)
+            self.assertEqual(sum(x.bytes_read for x in channels), 10000)
+            with open(file['local_path'], 'rb') as fp:
+                self.assertEqual(fp.read(), contents)
+            self.assertEqual(os.listdir(local), ['mpaso.rst.nc'])
+
+            # a failed range leaves nothing behind to be mistaken for a partial download
+            os.remove(file['local_path'])
+            class ShortSFTP(LocalSFTP):
+                def stat(self, path):
+                    info = os.stat(path)
+                    return type('Stat', (object,), {'st_size': info.st_size + 10})()
+            self.assertFalse(transfer(ShortSFTP(), file, large_file_size=4000, range_workers=3,
+                                      open_channel=open_channel))
+            self.assertEqual(os.listdir(local), [])
+        finally:
+            shutil.rmtree(remote)
+            shutil.rmtree(local)
+
+    def test_transfer_ranges_use_their_own_channels(self):
+        """
+        test that each range of a large file is read over its own channel, which is closed afterwards
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        remote = tempfile.mkdtemp()
+        local = tempfile.mkdtemp()
+        try:
+            with open(os.path.join(remote, 'mpaso.rst.nc'), 'wb') as fp:
+                fp.write('x' * 10000)
+            file = {
+                'remote_path': os.path.join(remote, 'mpaso.rst.nc'),
+                'local_path': os.path.join(local, 'mpaso.rst.nc')
+            }
+            channels = list()
+
+            def open_channel():
+                channels.append(LocalSFTP())
+                return channels[-1]
+            self.assertTrue(transfer(LocalSFTP(), file, large_file_size=4000, range_workers=4,
+                                     open_channel=open_channel))
+            self.assertEqual(len(channels), 4)
+            self.assertTrue(all(x.opened == 1 and x.closed for x in channels))
+            self.assertTrue(all(len(x.threads) == 1 for x in channels))
+            self.assertEqual(len(set.union(*[x.threads for x in channels])), 4)
+        finally:
+            shutil.rmtree(remote)
+            shutil.rmtree(local)
+
+    def test_session_pool_reuses_connection(self):
+        """
+        test that a host is only logged into again once its connection has dropped
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        pool = CountingPool()
+        client = pool.client('edison.nersc.gov')
+        self.assertIs(pool.client('edison.nersc.gov'), client)
+        self.assertEqual(pool.logins, 1)
+        pool.client('cori.nersc.gov')
+        self.assertEqual(pool.logins, 2)
+
+        client.transport.active = False
+        reconnected = pool.client('edison.nersc.gov')
+        self.assertIsNot(reconnected, client)
+        self.assertEqual(pool.logins, 3)
+        pool.close()
+        self.assertFalse(reconnected.transport.active)
+
+
+if __name__ == '__main__':
+    unittest.main()
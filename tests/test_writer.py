@@ -0,0 +1,83 @@
+import os, sys
+import unittest
+import inspect
+import threading
+
+if sys.path[0] != '.':
+    sys.path.insert(0, os.path.abspath('.'))
+
+from lib.writer import CatalogWriter
+from lib.util import print_message
+
+
+class TestCatalogWriter(unittest.TestCase):
+
+    def setUp(self):
+        self.applied = dict()
+        self.calls = list()
+        self.kill_event = threading.Event()
+        self.writer = CatalogWriter(self.apply_status, self.kill_event)
+
+    def tearDown(self):
+        self.writer.stop()
+
+    def apply_status(self, ids, status):
+        self.calls.append(len(ids))
+        for _id in ids:
+            self.applied[_id] = status
+
+    def test_writer_status_from_threads(self):
+        """
+        test that status updates queued from several threads are all applied
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.writer.start()
+
+        def transfer(ids):
+            for _id in ids:
+                self.writer.set_status([_id], 'present')
+        threads = [
+            threading.Thread(target=transfer, args=(range(x, 49, 4),))
+            for x in range(1, 5)
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.writer.flush()
+        self.assertEqual(sorted(self.applied.keys()), range(1, 49))
+        self.assertEqual(sum(self.calls), 48)
+
+        # stopping writes whatever is still queued before the thread exits
+        self.writer.set_status([1], 'missing')
+        self.writer.stop()
+        self.assertFalse(self.writer.is_alive())
+        self.assertEqual(self.applied[1], 'missing')
+
+        # once stopped, updates are applied by the caller
+        self.writer.set_status([2], 'missing')
+        self.assertEqual(self.applied[2], 'missing')
+
+    def test_writer_call(self):
+        """
+        test that calls run in order with the queued status updates and pass back results and errors
+        """
+        print '\n'; print_message('---- Starting Test: {} ----'.format(inspect.stack()[0][3]), 'ok')
+        self.writer.start()
+        self.writer.set_status([1, 2], 'present')
+        self.assertEqual(self.writer.call(lambda: dict(self.applied)), {1: 'present', 2: 'present'})
+        self.assertEqual(self.writer.call(threading.current_thread).name, 'catalog_writer')
+
+        def fail():
+            raise ValueError('no database')
+        self.assertRaises(ValueError, self.writer.call, fail)
+
+        # the writer exits on the kill event once its queue is empty
+        self.kill_event.set()
+        self.writer.join(5)
+        self.assertFalse(self.writer.is_alive())
+        self.assertIs(self.writer.call(threading.current_thread), threading.current_thread())
+
+
+if __name__ == '__main__':
+    unittest.main()